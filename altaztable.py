@@ -0,0 +1,87 @@
+###################################################################
+#
+# Module: altaztable.py
+# Author: ghostop14
+#
+# Precomputed Alt/Az tables for radecl.py's tracking loop.  Building an AltAz
+# frame and running the full ICRS->AltAz transform chain (including IERS
+# lookups) costs tens of milliseconds per call.  Here the transform is run
+# once, vectorized over a time grid, and each tick interpolates the result.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import numpy as np
+
+from astropy.coordinates import AltAz
+from astropy import units as u
+
+from tableinterp import cubicHermite, unwrapDegrees
+
+# -------------------  Global Vars -------------------------------------
+DEFAULT_ALTAZ_WINDOW = 3600.0  # seconds
+DEFAULT_ALTAZ_STEP = 60.0  # seconds
+
+# -------------------  Classes ----------------------------------------
+class AltAzTable(object):
+    """
+    DESCRIPTION:
+        Azimuth/elevation of a fixed RA/Dec target from one ground location, transformed
+        once over a time grid and cubic-interpolated per lookup.  Lookups take POSIX
+        timestamps (seconds) so the per-tick path does no astropy Time arithmetic.
+    INPUTS:
+        target (SkyCoord)        = RA/Dec target
+        groundLoc (EarthLocation)= observer location
+        startTime (Time)         = first sample time
+        duration (float)         = window length in seconds
+        step (float)             = sample spacing in seconds
+    """
+    def __init__(self, target, groundLoc, startTime, duration=DEFAULT_ALTAZ_WINDOW, step=DEFAULT_ALTAZ_STEP):
+        if step <= 0.0:
+            raise ValueError("Alt/Az table step must be greater than zero.")
+
+        self.target = target
+        self.groundLoc = groundLoc
+        self.step = float(step)
+
+        # At least 3 samples for the second-order slope estimate
+        numSamples = max(int(np.ceil(float(duration) / self.step)), 2) + 1
+        self.offsets = np.arange(numSamples, dtype=np.float64) * self.step
+        self.startTimestamp = startTime.unix
+        self.endTimestamp = self.startTimestamp + self.offsets[-1]
+
+        azimuth, elevation = self.transform(startTime + self.offsets*u.s)
+
+        self.azimuth = unwrapDegrees(azimuth)
+        self.elevation = elevation
+        self.azimuthSlope = np.gradient(self.azimuth, self.offsets, edge_order=2)
+        self.elevationSlope = np.gradient(self.elevation, self.offsets, edge_order=2)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def transform(self, times):
+        # Exact (vectorized) transform for an array of astropy Times
+        altAz = self.target.transform_to(AltAz(location=self.groundLoc, obstime=times))
+        return altAz.az.degree, altAz.alt.degree
+
+    def covers(self, timestamp):
+        return self.startTimestamp <= timestamp <= self.endTimestamp
+
+    def lookup(self, timestamp):
+        # Returns (azimuth, elevation) in degrees at a POSIX timestamp (scalar or array)
+        offset = timestamp - self.startTimestamp
+        azimuth = cubicHermite(offset, self.offsets, self.azimuth, self.azimuthSlope) % 360.0
+        elevation = cubicHermite(offset, self.offsets, self.elevation, self.elevationSlope)
+
+        return azimuth, elevation
+
+    def interpolationError(self, startTime):
+        # Maximum absolute az/el error (degrees) against the exact transform at every sample
+        # midpoint, where interpolation error peaks.  startTime is the Time the table was built from.
+        midOffsets = (self.offsets[:-1] + self.offsets[1:]) / 2.0
+        exactAz, exactEl = self.transform(startTime + midOffsets*u.s)
+        azimuth, elevation = self.lookup(self.startTimestamp + midOffsets)
+
+        azError = np.abs((azimuth - exactAz + 180.0) % 360.0 - 180.0)
+
+        return float(np.max(azError)), float(np.max(np.abs(elevation - exactEl)))
@@ -0,0 +1,390 @@
+###################################################################
+#
+# Module: asynctrack.py
+# Author: ghostop14
+#
+# asyncio I/O core for skytrack.py.  The ephemeris, every radio and every
+# rotor run as independent tasks, so a slow SDRSharp or gqrx reply no longer
+# stalls the rotor (or the next tick).  Each device has its own timeout and
+# reconnects with backoff.  Backpressure is handled by coalescing: a device
+# that is still busy when new positions/frequencies arrive only ever sends the
+# newest one, while AOS/LOS events are queued and never dropped.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import asyncio
+import collections
+import functools
+import time
+from datetime import datetime
+
+from ephemtable import buildTargetTables, doppler_shift, DEFAULT_TABLE_WINDOW, DEFAULT_TABLE_STEP, INTERPOLATION_CUBIC
+from radiocontrol import RADIOTYPE_GQRX, RADIOTYPE_SDRSHARP, DEFAULT_RADIO_PORT, RECV_SIZE, nextReply, replyOk
+from rotorcontrol import getRotor, RotctldRotor
+from rotorlimits import RotorLimits
+from rotormotion import MotionPlanner
+from trackscheduler import DeadlineScheduler
+from tracker import TrackState
+from trackdefaults import DEFAULT_DEVICE_TIMEOUT
+from trackmetrics import TrackMetrics, schedulerCollector, asyncDeviceCollector
+
+# -------------------  Global Vars -------------------------------------
+MAX_RECONNECT_BACKOFF = 30.0  # seconds
+
+# -------------------  Classes ----------------------------------------
+class AsyncDevice(object):
+    """
+    DESCRIPTION:
+        Base for a line-oriented TCP device driven from its own task.  Subclasses provide
+        async handle(value, isEvent), which sends one value and reads its reply (see AsyncRotor
+        and AsyncRadio).  submit() replaces any not-yet-sent value with the newest one (dropped
+        values are counted); submitEvent() queues messages that must all be delivered.
+        Connection failures back off exponentially up to MAX_RECONNECT_BACKOFF.  A value's
+        optional onSuccess callback is called with the completion time only if handle() returns
+        True for it; a value that is replaced, times out or fails never calls it.
+    """
+    def __init__(self, name, host, port, timeout=DEFAULT_DEVICE_TIMEOUT):
+        self.name = name
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.latest = None
+        self.latestCallback = None
+        self.events = collections.deque()
+        self.wakeup = asyncio.Event()
+        self.backoff = 0.0
+        self.everConnected = False
+        self.reconnects = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.lastLatency = None
+        # Optional trackmetrics.TrackMetrics that round trips are recorded in
+        self.metrics = None
+
+    def submit(self, value, onSuccess=None):
+        if self.latest is not None:
+            self.dropped += 1
+
+        self.latest = value
+        self.latestCallback = onSuccess
+        self.wakeup.set()
+
+    def submitEvent(self, message):
+        self.events.append(message)
+        self.wakeup.set()
+
+    async def ensureConnected(self):
+        if self.writer:
+            return True
+
+        if self.backoff > 0.0:
+            await asyncio.sleep(self.backoff)
+
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            self.backoff = 0.0
+            if self.everConnected:
+                self.reconnects += 1
+                print("[Info] " + self.name + " reconnected.")
+            self.everConnected = True
+            return True
+        except Exception as e:
+            self.backoff = min(max(self.backoff * 2.0, 1.0), MAX_RECONNECT_BACKOFF)
+            print("ERROR: Unable to connect to " + self.name + " at " + self.host + ":" + str(self.port) + ". Error: " + str(e) +
+                  ".  Retrying in %.0f seconds." % self.backoff)
+            self.reader = None
+            self.writer = None
+            return False
+
+    def close(self):
+        if self.writer:
+            try:
+                self.writer.close()
+            except:
+                pass
+
+        self.reader = None
+        self.writer = None
+
+    async def readLine(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionResetError(self.name + " closed the connection")
+
+        return line.decode('utf8', errors='replace').strip()
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            while self.events or self.latest is not None:
+                if not await self.ensureConnected():
+                    # Anything queued while we were down is stale except events
+                    continue
+
+                onSuccess = None
+                if self.events:
+                    value = self.events.popleft()
+                    isEvent = True
+                else:
+                    value = self.latest
+                    onSuccess = self.latestCallback
+                    self.latest = None
+                    self.latestCallback = None
+                    isEvent = False
+
+                try:
+                    startTime = time.monotonic()
+                    succeeded = await asyncio.wait_for(self.handle(value, isEvent), self.timeout)
+                    self.lastLatency = time.monotonic() - startTime
+                    if self.metrics is not None:
+                        self.metrics.observeRtt(self.name, self.lastLatency)
+                    if succeeded and onSuccess is not None:
+                        onSuccess(time.monotonic())
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    print("ERROR: " + self.name + " did not reply within %.1f seconds." % self.timeout)
+                    self.close()
+                except Exception as e:
+                    print("ERROR talking to " + self.name + ": " + str(e) + ".  Will reconnect.")
+                    self.close()
+
+class AsyncRotor(AsyncDevice):
+    # value is (azimuth, elevation).  Waits for the RPRT acknowledgement and returns True for RPRT 0.
+    async def handle(self, value, isEvent):
+        azimuth, elevation = value
+        self.writer.write(("P " + str(azimuth) + " " + str(elevation) + "\n").encode('utf-8'))
+        await self.writer.drain()
+
+        while True:
+            reply = await self.readLine()
+            if reply.startswith('RPRT'):
+                break
+
+        if reply != 'RPRT 0':
+            print("ROTOR ERROR: " + self.name + " returned " + reply)
+            return False
+
+        return True
+
+class AsyncRadio(AsyncDevice):
+    # value is a frequency in Hz, events are 'AOS\n' / 'LOS\n'
+    def __init__(self, name, radio, radioType=RADIOTYPE_GQRX, timeout=DEFAULT_DEVICE_TIMEOUT):
+        hostparams = radio.split(":")
+        port = DEFAULT_RADIO_PORT
+        if len(hostparams) > 1:
+            port = int(hostparams[1])
+
+        AsyncDevice.__init__(self, name, hostparams[0], port, timeout)
+        self.radioType = radioType
+        self.recvBuffer = b''
+
+        if radioType == RADIOTYPE_SDRSHARP:
+            self.radioCommand = '{"Command": "Set", "Method": "Frequency","Value": <frequency>}'
+        else:
+            self.radioCommand = "F <frequency>\n"
+
+    def close(self):
+        AsyncDevice.close(self)
+        self.recvBuffer = b''
+
+    async def readReply(self):
+        # One whole reply (a line for gqrx, a JSON object for SDRSharp), however it was split across reads
+        while True:
+            reply, self.recvBuffer = nextReply(self.recvBuffer, self.radioType)
+            if reply is not None and len(reply) > 0:
+                return reply
+
+            if reply is None:
+                data = await self.reader.read(RECV_SIZE)
+                if not data:
+                    raise ConnectionResetError(self.name + " closed the connection")
+                self.recvBuffer += data
+
+    async def handle(self, value, isEvent):
+        if isEvent:
+            message = value
+        else:
+            message = self.radioCommand.replace("<frequency>", str(int(value)))
+
+        self.writer.write(message.encode())
+        await self.writer.drain()
+        result = await self.readReply()
+
+        if isEvent or len(result) == 0:
+            return
+
+        if not replyOk(result, self.radioType):
+            if 'Not tunable' in result:
+                print("ERROR: Does not look like the receiver is started.  Start SDRSharp receiving then tuning should work.")
+            else:
+                print("ERROR setting frequency.  Radio returned error message:" + result)
+
+# -------------------  Global Functions ----------------------------------------
+def makeRotorDevice(target):
+    # Network rotors are used directly.  Serial rotors get their managed rotctld started once
+    # (blocking, at startup) and are then driven over its local socket like any other.
+    if ':' in target.rotor:
+        params = target.rotor.split(":")
+        return AsyncRotor(target.label + " rotor", params[0], int(params[1]))
+
+    backend = getRotor(target.rotor, target.rotortype, target.rotorbaud)
+    if isinstance(backend, RotctldRotor):
+        backend.startDaemon()
+
+    return AsyncRotor(target.label + " rotor", backend.host, backend.port)
+
+async def ephemerisTask(ts, planets, observer, targets, devices, delay, azoffset, rotorLimits, sendAosLos, aos_elevation,
+                        tableWindow, tableStep, interpolation, leadTime=0.0, tableCache=None, metrics=None, output=None):
+    loop = asyncio.get_running_loop()
+    lastStatusTime = 0.0
+    scheduler = DeadlineScheduler(delay, leadTime)
+
+    if metrics is None:
+        metrics = TrackMetrics()
+    metrics.addCollector(schedulerCollector(scheduler))
+
+    try:
+        while True:
+            tickStart = time.perf_counter()
+
+            # State is computed for when this tick's commands take effect, not when we woke up
+            tickTime = scheduler.tickTime()
+            t = ts.from_datetime(tickTime)
+
+            if targets[0].table is None or not targets[0].table.covers(t):
+                # Table builds are the only heavy computation, keep them off the event loop
+                if tableCache is not None:
+                    buildTables = tableCache.getTables
+                else:
+                    buildTables = buildTargetTables
+
+                with metrics.stage('table'):
+                    tables = await loop.run_in_executor(None, buildTables, ts, observer, [curTarget.target for curTarget in targets],
+                                                        t, tableWindow, tableStep, planets, [curTarget.bodyName for curTarget in targets],
+                                                        interpolation)
+                for curTarget, curTable in zip(targets, tables):
+                    curTarget.table = curTable
+
+                print("[Info] Precomputed %d positions for %d targets." % (len(tables[0]), len(targets)))
+
+            showStatus = output is None and (delay >= 1.0 or (time.monotonic() - lastStatusTime) >= 1.0)
+            if showStatus:
+                lastStatusTime = time.monotonic()
+                print("\nCurrent Time: " + datetime.now().strftime("%m/%d/%Y %H:%M:%S") + "  (" + datetime.utcnow().strftime("%m/%d/%Y %H:%M:%S") + " UTC)")
+                print(scheduler.summary())
+
+            for curTarget, (radioDevice, rotorDevice) in zip(targets, devices):
+                with metrics.stage('ephemeris'):
+                    azimuth, elevation, distance_meters, relativeVelocity, illumination = curTarget.table.lookup(t)
+
+                if output is not None:
+                    with metrics.stage('output'):
+                        output.write(curTarget.label, TrackState(tickTime.timestamp(), azimuth, elevation, distance_meters, relativeVelocity,
+                                                                 doppler_shift(curTarget.freq, relativeVelocity) if curTarget.freq != 0.0 else None,
+                                                                 illumination))
+
+                if radioDevice:
+                    if sendAosLos:
+                        if elevation >= aos_elevation and curTarget.lastElevation < aos_elevation:
+                            radioDevice.submitEvent("AOS\n")
+                        elif elevation < aos_elevation and curTarget.lastElevation >= aos_elevation:
+                            radioDevice.submitEvent("LOS\n")
+
+                    radioDevice.submit(doppler_shift(curTarget.freq, relativeVelocity))
+
+                curTarget.lastElevation = elevation
+
+                if rotorDevice:
+                    trueAz = (azimuth + azoffset) % 360.0
+                    if rotorLimits.reachable(azimuth, elevation, azoffset):
+                        rotorCommand = curTarget.motion.plan(time.monotonic(), trueAz, elevation)
+                        if rotorCommand is not None:
+                            # Recorded by the planner only once the rotor acknowledges this move.  Until then
+                            # the deadband doesn't suppress it, so a lost move is planned again next tick.
+                            rotorDevice.submit(rotorCommand, functools.partial(curTarget.motion.commit,
+                                                                               pendingCommand=curTarget.motion.pendingCommand))
+                    elif showStatus:
+                        print('[Info] ' + curTarget.label + ': Rotor would violate user-configured limits.  No move sent.')
+
+                if showStatus:
+                    print("%-20s Az %7.2f  El %6.2f  Vel %10.2f m/s" % (curTarget.label, azimuth, elevation, relativeVelocity), end='')
+                    if curTarget.freq != 0.0:
+                        print("  Doppler Freq %.2f Hz" % doppler_shift(curTarget.freq, relativeVelocity), end='')
+                    print("")
+
+                    for curDevice in (radioDevice, rotorDevice):
+                        if curDevice and curDevice.lastLatency is not None:
+                            print("    %-28s rtt %.1f ms, dropped %d, timeouts %d, reconnects %d" % (curDevice.name, curDevice.lastLatency*1000.0,
+                                  curDevice.dropped, curDevice.timeouts, curDevice.reconnects))
+
+            metrics.observeStage('tick', time.perf_counter() - tickStart)
+            metrics.maybeLog()
+
+            await scheduler.waitAsync()
+    finally:
+        print(scheduler.summary())
+
+        for curTarget in targets:
+            if curTarget.motion is not None:
+                print(curTarget.label + ": " + curTarget.motion.summary())
+
+async def runAsyncTargets(ts, planets, observer, targets, delay, azoffset=0.0, rotorLimits=None, sendAosLos=False,
+                          aos_elevation=10.0, tableWindow=DEFAULT_TABLE_WINDOW, tableStep=DEFAULT_TABLE_STEP, interpolation=INTERPOLATION_CUBIC, deviceTimeout=DEFAULT_DEVICE_TIMEOUT,
+                          leadTime=0.0, tableCache=None, rotorMotion=None, metrics=None, output=None):
+    devices = []
+    allDevices = []
+
+    if rotorLimits is None:
+        rotorLimits = RotorLimits()
+
+    if rotorMotion is None:
+        rotorMotion = {'rotorLimits': rotorLimits}
+
+    for curTarget in targets:
+        radioDevice = None
+        rotorDevice = None
+
+        if len(curTarget.radioAddress) > 0 and curTarget.freq != 0.0:
+            radioDevice = AsyncRadio(curTarget.label + " radio", curTarget.radioAddress, curTarget.radioType, deviceTimeout)
+            allDevices.append(radioDevice)
+
+        if len(curTarget.rotor) > 0:
+            rotorDevice = makeRotorDevice(curTarget)
+            rotorDevice.timeout = deviceTimeout
+            allDevices.append(rotorDevice)
+            curTarget.motion = MotionPlanner(**rotorMotion)
+
+        devices.append((radioDevice, rotorDevice))
+
+    if metrics is None:
+        metrics = TrackMetrics()
+
+    for curDevice in allDevices:
+        curDevice.metrics = metrics
+    metrics.addCollector(asyncDeviceCollector(allDevices))
+
+    tasks = [asyncio.create_task(curDevice.run()) for curDevice in allDevices]
+    tasks.append(asyncio.create_task(ephemerisTask(ts, planets, observer, targets, devices, delay, azoffset, rotorLimits, sendAosLos,
+                                                   aos_elevation, tableWindow, tableStep, interpolation, leadTime, tableCache,
+                                                   metrics, output)))
+
+    try:
+        # Device tasks never finish on their own, so this only returns if the ephemeris task fails
+        await asyncio.gather(*tasks)
+    finally:
+        for curTask in tasks:
+            curTask.cancel()
+
+        for curDevice in allDevices:
+            curDevice.close()
+
+def runAsyncTracking(ts, planets, observer, targets, delay, **kwargs):
+    # Blocking entry point.  Runs until interrupted.
+    try:
+        asyncio.run(runAsyncTargets(ts, planets, observer, targets, delay, **kwargs))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,78 @@
+###################################################################
+#
+# Module: bodyindex.py
+# Author: ghostop14
+#
+# Body-name index for ephemeris kernels.  Opening a kernel (and importing
+# skyfield to do it) is most of skytrack.py's startup time, yet --listbodies
+# and --body validation only need the list of names the kernel answers to.
+# The index for the default kernel is built in; for any other kernel it is
+# built on first use and saved next to the kernel as <kernel>.bodies.json.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import json
+import os
+
+# -------------------  Global Vars -------------------------------------
+BODY_INDEX_SUFFIX = '.bodies.json'
+
+# Prebuilt from de421.bsp's planets.names()
+PREBUILT_BODY_INDEX = {
+    'de421.bsp': ['EARTH', 'EARTH BARYCENTER', 'EARTH MOON BARYCENTER', 'EARTH-MOON BARYCENTER', 'EARTH_BARYCENTER', 'EMB',
+                  'JUPITER BARYCENTER', 'JUPITER_BARYCENTER', 'MARS', 'MARS BARYCENTER', 'MARS_BARYCENTER', 'MERCURY',
+                  'MERCURY BARYCENTER', 'MERCURY_BARYCENTER', 'MOON', 'NEPTUNE BARYCENTER', 'NEPTUNE_BARYCENTER',
+                  'PLUTO BARYCENTER', 'PLUTO_BARYCENTER', 'SATURN BARYCENTER', 'SATURN_BARYCENTER', 'SOLAR SYSTEM BARYCENTER',
+                  'SOLAR_SYSTEM_BARYCENTER', 'SSB', 'SUN', 'URANUS BARYCENTER', 'URANUS_BARYCENTER', 'VENUS', 'VENUS BARYCENTER',
+                  'VENUS_BARYCENTER'],
+}
+
+# -------------------  Global Functions ----------------------------------------
+def bodyIndexFile(kernelFile):
+    return kernelFile + BODY_INDEX_SUFFIX
+
+def kernelSize(kernelFile):
+    try:
+        return os.path.getsize(kernelFile)
+    except OSError:
+        return None
+
+def loadBodyIndex(kernelFile):
+    # Returns the sorted body names for kernelFile without opening it, or None if no index exists.
+    # A saved index is only trusted if the kernel is still the same size it was when indexed.
+    indexFile = bodyIndexFile(kernelFile)
+
+    if os.path.exists(indexFile):
+        try:
+            with open(indexFile, 'r') as f:
+                index = json.load(f)
+
+            if index.get('size') == kernelSize(kernelFile):
+                return index['names']
+        except (OSError, ValueError, KeyError) as e:
+            print("[Warning] Unable to read body index " + indexFile + ": " + str(e))
+
+    return PREBUILT_BODY_INDEX.get(os.path.basename(kernelFile))
+
+def saveBodyIndex(kernelFile, sortedNames):
+    # A read-only kernel directory just means the index is not saved
+    try:
+        with open(bodyIndexFile(kernelFile), 'w') as f:
+            json.dump({'size': kernelSize(kernelFile), 'names': sortedNames}, f)
+    except OSError as e:
+        print("[Warning] Unable to save body index: " + str(e))
+
+def buildBodyIndex(planets, kernelFile):
+    # Builds the sorted body name list from a loaded kernel and saves it for next time.
+    bodyNames = planets.names()
+    sortedNames = sorted(str(curObject) for curKey in bodyNames for curObject in bodyNames[curKey])
+
+    if os.path.basename(kernelFile) not in PREBUILT_BODY_INDEX:
+        saveBodyIndex(kernelFile, sortedNames)
+
+    return sortedNames
+
+def bodyInIndex(bodyNames, bodyName):
+    # Kernel name lookups are case-insensitive and fall back to '<name> barycenter' (see ephemtable.resolveBody)
+    upperName = bodyName.upper()
+    return upperName in bodyNames or (upperName + ' BARYCENTER') in bodyNames
@@ -0,0 +1,244 @@
+###################################################################
+#
+# Module: ephemtable.py
+# Author: ghostop14
+#
+# Precomputed ephemeris tables for skytrack.py.  Rather than solving the
+# ephemeris once (or twice) per tracking tick, a whole tracking window is
+# evaluated in one batched skyfield call over a Time array and each tick is
+# then served from the resulting table.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import numpy as np
+
+from skyfield import almanac
+from skyfield.constants import AU_M
+
+from tableinterp import cubicHermite, unwrapDegrees
+from trackdefaults import DEFAULT_TABLE_WINDOW, DEFAULT_TABLE_STEP, INTERPOLATION_LINEAR, INTERPOLATION_CUBIC
+
+# -------------------  Global Vars -------------------------------------
+SECONDS_PER_DAY = 86400.0
+
+# -------------------  Global Functions ----------------------------------------
+def buildTimeArray(ts, startTime, duration, step):
+    # Returns a skyfield Time array from startTime covering duration seconds
+    # with samples every step seconds (inclusive of both ends).  Always at least 3 samples, which the
+    # second-order slope estimate in EphemerisTable needs, so the table may run a little past duration.
+    numSamples = max(int(np.ceil(duration / step)), 2) + 1
+    offsets = np.arange(numSamples, dtype=np.float64) * step
+    return ts.tt_jd(startTime.tt + offsets / SECONDS_PER_DAY)
+
+def rangeRateFromAstrometric(astrometric):
+    # Radial velocity in m/s (+ is away) straight from the observer->target position
+    # and velocity vectors: d|r|/dt = (r . v) / |r|.  Works on scalar or array positions.
+    position = astrometric.position.au
+    velocity = astrometric.velocity.au_per_d
+    rangeRate = np.sum(position * velocity, axis=0) / np.sqrt(np.sum(position * position, axis=0))
+
+    return rangeRate * AU_M / SECONDS_PER_DAY
+
+def resolveBody(planets, bodyName):
+    # Returns (bodyName, target) for a kernel body name.  Falls back to '<name> barycenter'
+    # (e.g. saturn is like this in the db file).  Raises KeyError if neither exists.
+    try:
+        return bodyName, planets[bodyName]
+    except KeyError:
+        bodyName = bodyName + ' barycenter'
+        return bodyName, planets[bodyName]
+
+def kernelCoverage(planets):
+    # Returns the (start, end) TDB Julian dates covered by every segment of a loaded kernel.
+    # Trimmed kernels (see kernelexcerpt.py) only cover a short range.
+    segmentRanges = [(segment.spk_segment.start_jd, segment.spk_segment.end_jd) for segment in planets.segments]
+
+    return max(curRange[0] for curRange in segmentRanges), min(curRange[1] for curRange in segmentRanges)
+
+def computeTopocentric(observer, target, times, observerAt=None):
+    # Batched az/el/range/range-rate solve.  times can be a scalar Time or a Time array.
+    # observerAt is an optional precomputed observer.at(times) so several targets can share it.
+    # Returns numpy arrays of azimuth (deg), elevation (deg), range (m) and range-rate (m/s).
+    if observerAt is None:
+        observerAt = observer.at(times)
+
+    astrometric = observerAt.observe(target)
+    elevationTmp, azimuthTmp, dist_AU = astrometric.apparent().altaz()
+
+    return azimuthTmp.degrees, elevationTmp.degrees, dist_AU.m, rangeRateFromAstrometric(astrometric)
+
+def doppler_shift(frequency, relativeVelocity):
+    """
+    DESCRIPTION:
+        This function calculates the doppler shift of a given frequency when actual
+        frequency and the relative velocity is passed.
+        The function for the doppler shift is f' = f - f*(v/c).
+    INPUTS:
+        frequency (float)        = satlitte's beacon frequency in Hz
+        relativeVelocity (float or numpy array) = Velocity at which the satellite is moving
+                                   towards or away from observer in m/s
+    RETURNS:
+        Param1 (float or numpy array) = The frequency experienced due to doppler shift in Hz
+    AFFECTS:
+        None
+    EXCEPTIONS:
+        None
+    DEPENDENCIES:
+        None
+    Note: relativeVelocity is positive when moving away from the observer
+          and negative when moving towards.  Passing an array of velocities (for example
+          EphemerisTable.rangeRate) returns the doppler frequencies for the whole array.
+    """
+    return  (frequency - frequency * (np.asarray(relativeVelocity)/3e8)) 
+
+# -------------------  Classes ----------------------------------------
+class EphemerisTable(object):
+    """
+    DESCRIPTION:
+        Azimuth, elevation, range, range-rate and illumination for one target as seen
+        from one observer, precomputed over a time window.  Lookups interpolate between
+        samples either linearly or with cubic Hermite splines (azimuth is unwrapped so
+        crossing north does not interpolate through 180 degrees).  Cubic interpolation
+        lets a sparse table serve fractional-second lookups; interpolationError() measures
+        how far the interpolated values stray from the exact solve.
+    INPUTS:
+        ts (Timescale)           = skyfield timescale
+        observer (VectorSum)     = earth + Topos observer
+        target (VectorSum)       = target body from the loaded kernel
+        startTime (Time)         = first sample time
+        duration (float)         = window length in seconds
+        step (float)             = sample spacing in seconds
+        planets (SpiceKernel)    = if provided along with bodyName, illumination is tabulated too
+        bodyName (str)           = kernel name for the target (used for illumination)
+        interpolation (str)      = INTERPOLATION_LINEAR or INTERPOLATION_CUBIC
+        observerAt (Geocentric)  = optional observer.at() already evaluated over the same time grid,
+                                   shared between tables for several targets (see buildTargetTables)
+        samples (dict)           = optional previously computed samples (see samples()) to use instead
+                                   of solving the ephemeris, e.g. from tablecache.EphemerisTableCache
+    """
+    def __init__(self, ts, observer, target, startTime, duration=DEFAULT_TABLE_WINDOW, step=DEFAULT_TABLE_STEP,
+                 planets=None, bodyName=None, interpolation=INTERPOLATION_CUBIC, observerAt=None, samples=None):
+        if step <= 0.0:
+            raise ValueError("Ephemeris table step must be greater than zero.")
+
+        if interpolation not in (INTERPOLATION_LINEAR, INTERPOLATION_CUBIC):
+            raise ValueError("Unknown interpolation type: " + str(interpolation))
+
+        self.ts = ts
+        self.observer = observer
+        self.target = target
+        self.interpolation = interpolation
+        self.step = float(step)
+        if samples is not None:
+            self.times = ts.tt_jd(samples['tt'])
+        elif observerAt is not None:
+            self.times = observerAt.t
+        else:
+            self.times = buildTimeArray(ts, startTime, float(duration), self.step)
+        self.startTT = self.times.tt[0]
+        self.endTT = self.times.tt[-1]
+        # Seconds from the start of the table for each sample
+        self.offsets = (self.times.tt - self.startTT) * SECONDS_PER_DAY
+
+        if samples is not None:
+            azimuth, elevation, distance, rangeRate = samples['azimuth'], samples['elevation'], samples['distance'], samples['rangeRate']
+        else:
+            azimuth, elevation, distance, rangeRate = computeTopocentric(observer, target, self.times, observerAt)
+
+        self.azimuth = azimuth
+        self.elevation = elevation
+        self.distance = distance
+        # Unwrapped azimuth so interpolation across 0/360 behaves
+        self.azimuthUnwrapped = unwrapDegrees(azimuth)
+        # m/s, + is away
+        self.rangeRate = rangeRate
+
+        # Slopes for cubic interpolation.  Range has an exact slope (range-rate), the rest are estimated.
+        self.azimuthSlope = np.gradient(self.azimuthUnwrapped, self.offsets, edge_order=2)
+        self.elevationSlope = np.gradient(elevation, self.offsets, edge_order=2)
+        self.rangeRateSlope = np.gradient(rangeRate, self.offsets, edge_order=2)
+
+        if samples is not None:
+            self.illumination = samples.get('illumination')
+        elif planets is not None and bodyName is not None:
+            self.illumination = np.asarray(almanac.fraction_illuminated(planets, bodyName, self.times))
+        else:
+            self.illumination = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def samples(self):
+        # The computed (not derived) arrays, enough to rebuild the table with the samples parameter
+        tableSamples = {'tt': self.times.tt, 'azimuth': self.azimuth, 'elevation': self.elevation,
+                        'distance': self.distance, 'rangeRate': self.rangeRate}
+        if self.illumination is not None:
+            tableSamples['illumination'] = self.illumination
+
+        return tableSamples
+
+    def covers(self, t):
+        # True if t (a skyfield Time) falls inside the table
+        return self.startTT <= t.tt <= self.endTT
+
+    def lookup(self, t):
+        # Returns (azimuth, elevation, distance_meters, rangeRate, illumination) at time t.
+        # t may be a scalar Time or a Time array.  illumination is None if the table was built without it.
+        return self.lookupOffset((t.tt - self.startTT) * SECONDS_PER_DAY)
+
+    def lookupOffset(self, offset):
+        # Same as lookup() but takes seconds from the start of the table
+        if self.interpolation == INTERPOLATION_CUBIC:
+            azimuth = cubicHermite(offset, self.offsets, self.azimuthUnwrapped, self.azimuthSlope) % 360.0
+            elevation = cubicHermite(offset, self.offsets, self.elevation, self.elevationSlope)
+            distance = cubicHermite(offset, self.offsets, self.distance, self.rangeRate)
+            rangeRate = cubicHermite(offset, self.offsets, self.rangeRate, self.rangeRateSlope)
+        else:
+            azimuth = np.interp(offset, self.offsets, self.azimuthUnwrapped) % 360.0
+            elevation = np.interp(offset, self.offsets, self.elevation)
+            distance = np.interp(offset, self.offsets, self.distance)
+            rangeRate = np.interp(offset, self.offsets, self.rangeRate)
+
+        if self.illumination is not None:
+            illumination = np.interp(offset, self.offsets, self.illumination)
+        else:
+            illumination = None
+
+        return azimuth, elevation, distance, rangeRate, illumination
+
+    def interpolationError(self, frequency=0.0):
+        # Compares the interpolated values against an exact solve at every sample midpoint
+        # (where interpolation error peaks).  Returns a dict of maximum absolute errors:
+        # azimuth/elevation in degrees, range in meters, rangeRate in m/s and doppler in Hz.
+        midOffsets = (self.offsets[:-1] + self.offsets[1:]) / 2.0
+        midTimes = self.ts.tt_jd(self.startTT + midOffsets / SECONDS_PER_DAY)
+
+        exactAz, exactEl, exactRange, exactRate = computeTopocentric(self.observer, self.target, midTimes)
+        azimuth, elevation, distance, rangeRate, illumination = self.lookupOffset(midOffsets)
+
+        azError = np.abs((azimuth - exactAz + 180.0) % 360.0 - 180.0)
+
+        return {
+            'azimuth': float(np.max(azError)),
+            'elevation': float(np.max(np.abs(elevation - exactEl))),
+            'range': float(np.max(np.abs(distance - exactRange))),
+            'rangeRate': float(np.max(np.abs(rangeRate - exactRate))),
+            'doppler': float(np.max(np.abs(doppler_shift(float(frequency), rangeRate) - doppler_shift(float(frequency), exactRate)))),
+        }
+
+    def dopplerFrequencies(self, frequency):
+        # Doppler-shifted frequency for every sample in the table
+        return doppler_shift(float(frequency), self.rangeRate)
+
+# -------------------  Global Functions ----------------------------------------
+def buildTargetTables(ts, observer, targets, startTime, duration=DEFAULT_TABLE_WINDOW, step=DEFAULT_TABLE_STEP,
+                      planets=None, bodyNames=None, interpolation=INTERPOLATION_CUBIC):
+    # Builds one EphemerisTable per target over a common time grid.  The observer's position is
+    # evaluated once and shared by every target.
+    observerAt = observer.at(buildTimeArray(ts, startTime, float(duration), float(step)))
+
+    if bodyNames is None:
+        bodyNames = [None] * len(targets)
+
+    return [EphemerisTable(ts, observer, target, startTime, duration, step, planets, bodyName, interpolation, observerAt)
+            for target, bodyName in zip(targets, bodyNames)]
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+
+###################################################################
+#
+# Application: kernelexcerpt.py
+# Author: ghostop14
+#
+# Writes a trimmed copy of an ephemeris kernel holding only the segments
+# needed for the chosen bodies (plus the bodies skytrack always uses) over a
+# date range.  Point skytrack.py at the result with --ephemeris.  Tracking
+# the moon for a week needs about 7 KB rather than all 17 MB of de421.bsp.
+#
+# Kernel segments are read through jplephem's memory maps both here and in
+# skytrack, so only the pages a tracker actually touches become resident and
+# several trackers using the same kernel share them in the page cache.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from jplephem.spk import SPK
+from jplephem.excerpter import write_excerpt
+from jplephem.names import target_name_pairs
+
+from trackdefaults import DEFAULT_KERNEL
+from bodyindex import saveBodyIndex
+
+# -------------------  Global Vars -------------------------------------
+J2000_JD = 2451545.0
+J2000 = datetime(2000, 1, 1, 12, 0, 0)
+
+# skytrack always needs the earth (observer position), the sun (illumination) and, for the
+# light deflection in apparent(), the jupiter and saturn barycenters
+REQUIRED_BODIES = ['earth', 'sun', 'jupiter barycenter', 'saturn barycenter']
+
+# Extra days kept either side of the requested range.  Covers the TDB/UTC offset, rise/set
+# searches over the whole local day and a tracking table window that runs past the end.
+PADDING_DAYS = 1.0
+
+# -------------------  Global Functions ----------------------------------------
+def julianDate(dateValue):
+    return J2000_JD + (dateValue - J2000).total_seconds() / 86400.0
+
+def bodyCode(bodyName):
+    # Kernel code for a body name (case-insensitive, falling back to '<name> barycenter' like
+    # ephemtable.resolveBody) or a plain integer code.  Raises ValueError if unknown.
+    if bodyName.strip().isdigit():
+        return int(bodyName)
+
+    nameCodes = dict((name, code) for code, name in target_name_pairs)
+    upperName = bodyName.strip().upper()
+
+    if upperName in nameCodes:
+        return nameCodes[upperName]
+    elif (upperName + ' BARYCENTER') in nameCodes:
+        return nameCodes[upperName + ' BARYCENTER']
+
+    raise ValueError("Unknown body: " + bodyName)
+
+def segmentChain(spk, code):
+    # Indexes of the segments linking code back to the solar system barycenter (0)
+    chain = []
+
+    while code != 0:
+        matches = [index for index, segment in enumerate(spk.segments) if segment.target == code]
+        if len(matches) == 0:
+            raise ValueError("Kernel has no segment for body %d." % code)
+
+        chain.extend(matches)
+        code = spk.segments[matches[0]].center
+
+    return chain
+
+def kernelBodyNames(codes):
+    # Same names skyfield's planets.names() reports for these codes
+    return sorted(name for code, name in target_name_pairs if code in codes)
+
+def excerptKernel(inputFile, outputFile, bodyNames, startDate, endDate):
+    # Writes the segments for bodyNames (plus REQUIRED_BODIES) covering startDate..endDate (UTC datetimes)
+    # from inputFile to outputFile, along with its body index.  Returns the body codes written.
+    spk = SPK.open(inputFile)
+
+    try:
+        segmentIndexes = set()
+        for curBody in list(bodyNames) + REQUIRED_BODIES:
+            segmentIndexes.update(segmentChain(spk, bodyCode(curBody)))
+
+        summaries = [summary for index, summary in enumerate(spk.daf.summaries()) if index in segmentIndexes]
+        codes = set()
+        for index in segmentIndexes:
+            codes.add(spk.segments[index].target)
+            codes.add(spk.segments[index].center)
+
+        startJD = julianDate(startDate) - PADDING_DAYS
+        endJD = julianDate(endDate) + PADDING_DAYS
+
+        with open(outputFile, 'w+b') as f:
+            write_excerpt(spk, f, startJD, endJD, summaries)
+    finally:
+        spk.close()
+
+    saveBodyIndex(outputFile, kernelBodyNames(codes))
+
+    return codes
+
+def parseDate(datestr):
+    # year/month/day [hh:mm:ss], UTC
+    datestr = datestr.strip().strip('"').strip("'")
+    for curFormat in ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(datestr, curFormat)
+        except ValueError:
+            pass
+
+    raise ValueError("Bad date '" + datestr + "'.  Format: year/month/day [hh:mm:ss]")
+
+# ----------------------  Main Code -------------------------------------------------------
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Ephemeris kernel excerpt tool for skytrack.py')
+    argparser.add_argument('--body', help="[Required] Comma-separated bodies to keep (e.g. moon,mars).  The earth, sun, jupiter and saturn barycenters are always kept.", default="", required=False)
+    argparser.add_argument('--ephemeris', help="Kernel to excerpt from.  Default is " + DEFAULT_KERNEL, default=DEFAULT_KERNEL, required=False)
+    argparser.add_argument('--output', help="[Required] Trimmed kernel to write", default="", required=False)
+    argparser.add_argument('--start', help="First UTC date to cover.  Format: year/month/day [hh:mm:ss].  Default is today.", default="", required=False)
+    argparser.add_argument('--days', help="Number of days to cover from --start.  Default is 7.", default=7, required=False)
+
+    args = argparser.parse_args()
+
+    if len(args.body) == 0 or len(args.output) == 0:
+        print("ERROR: --body and --output are required.")
+        exit(1)
+
+    if not os.path.exists(args.ephemeris):
+        print("ERROR: Unable to find " + args.ephemeris)
+        exit(1)
+
+    try:
+        if len(args.start) > 0:
+            startDate = parseDate(args.start)
+        else:
+            startDate = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError as e:
+        print("ERROR: " + str(e))
+        exit(1)
+
+    days = float(args.days)
+    if days <= 0.0:
+        print("ERROR: --days must be greater than zero.")
+        exit(1)
+
+    endDate = startDate + timedelta(days=days)
+
+    try:
+        codes = excerptKernel(args.ephemeris, args.output, args.body.split(','), startDate, endDate)
+    except ValueError as e:
+        print("ERROR: " + str(e))
+        exit(1)
+
+    print("Wrote %s: %d bodies, %s to %s UTC, %d bytes (from %d bytes)" % (args.output, len(codes), startDate.strftime("%Y/%m/%d %H:%M:%S"),
+                                                                        endDate.strftime("%Y/%m/%d %H:%M:%S"), os.path.getsize(args.output),
+                                                                        os.path.getsize(args.ephemeris)))
@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+
+###################################################################
+#
+# Application: loadharness.py
+# Author: ghostop14
+#
+# Load test for skytrack.py without hardware.  Starts simulated radio and
+# rotctld servers (simdevices.py) in-process, runs skytrack.py against them
+# at a high update rate for a fixed time, then reports what the servers saw
+# (commands/s, error replies, dropped connections, reconnects) alongside the
+# tracker's own metrics log (device round trip percentiles, per-stage tick
+# times, missed deadlines).  Latency, jitter, error and drop rates are set on
+# the simulated servers so reconnect behavior and tail latency can be
+# measured under bad conditions as well as good ones.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from simdevices import SimGqrx, SimSdrSharp, SimRotctld, SimDeviceThread
+from trackdefaults import DEFAULT_KERNEL
+
+# -------------------  Global Vars -------------------------------------
+DEFAULT_BASE_PORT = 17356  # radio on this port, rotctld on the next
+DEFAULT_DURATION = 30.0  # seconds
+DEFAULT_DELAY = 0.05  # seconds between tracker updates
+DEFAULT_LAT = 40.0
+DEFAULT_LONG = -75.0
+DEFAULT_FREQ = 144000000
+
+# Bodies used for --targets, in order
+TARGET_BODIES = ['moon', 'mars', 'jupiter', 'venus', 'saturn', 'sun', 'mercury', 'uranus', 'neptune']
+
+# Seconds to wait for the tracker to exit after SIGINT
+EXIT_TIMEOUT = 10.0
+
+# -------------------  Global Functions ----------------------------------------
+def trackerCommand(args, radioPort, rotorPort, metricsLog):
+    # skytrack.py command line for the selected mode
+    radioOption = 'sdrsharp' if args.radiotype == 'sdrsharp' else 'radio'
+    radioAddress = "127.0.0.1:%d" % radioPort
+    rotorAddress = "127.0.0.1:%d" % rotorPort
+
+    cmd = [sys.executable, '-u', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'skytrack.py'),
+           '--lat=' + str(args.lat), '--long=' + str(args.long), '--ephemeris=' + args.ephemeris, '--delay=' + str(args.delay),
+           '--metricslog=' + metricsLog, '--metricsinterval=1']
+
+    if args.mode == 'single':
+        cmd += ['--body=' + args.body, '--freq=' + str(args.freq), '--' + radioOption + '=' + radioAddress, '--rotor=' + rotorAddress]
+    else:
+        # Every target shares the same simulated radio and rotor (one connection each)
+        for curBody in TARGET_BODIES[:args.targets]:
+            cmd.append("--target=body=%s,freq=%d,%s=%s,rotor=%s" % (curBody, int(args.freq), radioOption, radioAddress, rotorAddress))
+
+        if args.mode == 'async':
+            cmd += ['--async', '--devicetimeout=' + str(args.devicetimeout)]
+
+    if len(args.trackerargs) > 0:
+        cmd += args.trackerargs.split()
+
+    return cmd
+
+def readLastSnapshot(metricsLog):
+    # Last JSON line written by the tracker's --metricslog, or None
+    snapshot = None
+
+    try:
+        with open(metricsLog, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if len(line) > 0:
+                    try:
+                        snapshot = json.loads(line)
+                    except ValueError:
+                        pass
+    except OSError:
+        pass
+
+    return snapshot
+
+def sumCounters(snapshot, name):
+    # Total of a counter across all of its label sets
+    total = 0
+    for curName, value in snapshot['counters'].items():
+        if curName == name or curName.startswith(name + "{"):
+            total += value
+
+    return total
+
+def printReport(servers, snapshot, elapsed):
+    print("\nSimulated devices (%.1f seconds):" % elapsed)
+    for curServer in servers:
+        # The first connection from each tracker connection is not a reconnect, but the servers can't tell
+        # them apart, so connections are reported as-is
+        print("  %-9s %8d commands %9.1f /s  %6d error replies  %6d drops  %4d connections" %
+              (curServer.name, curServer.commands, curServer.commands / elapsed, curServer.errors, curServer.drops, curServer.connections))
+
+    if snapshot is None:
+        print("\nNo tracker metrics were written (did the tracker start?  See --trackerlog).")
+        return
+
+    print("\nTracker round trips:")
+    for device, entry in snapshot['rtt'].items():
+        print("  %-24s n=%-8d p50 %8.3f ms  p90 %8.3f ms  p99 %8.3f ms  max %8.3f ms" %
+              (device, entry['count'], entry['p50']*1000.0, entry['p90']*1000.0, entry['p99']*1000.0, entry['max']*1000.0))
+
+    print("\nTracker stages:")
+    for stage, entry in snapshot['stages'].items():
+        print("  %-24s n=%-8d p50 %8.3f ms  p99 %8.3f ms  max %8.3f ms" %
+              (stage, entry['count'], entry['p50']*1000.0, entry['p99']*1000.0, entry['max']*1000.0))
+
+    ticks = sumCounters(snapshot, 'ticks_total')
+    print("\nTracker counters:")
+    print("  ticks %d (%.1f /s), missed deadlines %d" % (ticks, ticks / elapsed, sumCounters(snapshot, 'missed_deadlines_total')))
+    print("  reconnects %d, errors %d, timeouts %d, acknowledged %d" % (sumCounters(snapshot, 'device_reconnects_total'),
+          sumCounters(snapshot, 'device_errors_total'), sumCounters(snapshot, 'device_timeouts_total'),
+          sumCounters(snapshot, 'device_acknowledged_total')))
+
+# ----------------------  Main Code -------------------------------------------------------
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Load test skytrack.py against simulated radio and rotor servers')
+    argparser.add_argument('--mode', help="Tracker mode: single (--body), multi (--target) or async (--target --async).  Default is single.", default='single', choices=['single', 'multi', 'async'], required=False)
+    argparser.add_argument('--targets', help="Number of targets in multi/async mode (up to " + str(len(TARGET_BODIES)) + ").  Default is 2.", default=2, type=int, required=False)
+    argparser.add_argument('--body', help="Body tracked in single mode.  Default is moon.", default='moon', required=False)
+    argparser.add_argument('--lat', help="Observer latitude.  Default is " + str(DEFAULT_LAT), default=DEFAULT_LAT, required=False)
+    argparser.add_argument('--long', help="Observer longitude.  Default is " + str(DEFAULT_LONG), default=DEFAULT_LONG, required=False)
+    argparser.add_argument('--ephemeris', help="Ephemeris kernel passed to the tracker.  Default is " + DEFAULT_KERNEL, default=DEFAULT_KERNEL, required=False)
+    argparser.add_argument('--freq', help="Frequency sent to the radio (with doppler).  Default is " + str(DEFAULT_FREQ), default=DEFAULT_FREQ, type=int, required=False)
+    argparser.add_argument('--radiotype', help="Simulated radio: gqrx or sdrsharp.  Default is gqrx.", default='gqrx', choices=['gqrx', 'sdrsharp'], required=False)
+    argparser.add_argument('--delay', help="Tracker --delay (seconds between updates).  Default is " + str(DEFAULT_DELAY), default=DEFAULT_DELAY, required=False)
+    argparser.add_argument('--duration', help="Seconds to run the tracker.  Default is " + str(DEFAULT_DURATION), default=DEFAULT_DURATION, required=False)
+    argparser.add_argument('--devicetimeout', help="Tracker --devicetimeout in async mode.  Default is 2.", default=2.0, required=False)
+    argparser.add_argument('--baseport', help="Simulated radio port.  rotctld uses the next port.  Default is " + str(DEFAULT_BASE_PORT), default=DEFAULT_BASE_PORT, type=int, required=False)
+    argparser.add_argument('--latency', help="Milliseconds before each simulated reply.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--jitter', help="+/- milliseconds of random variation on --latency.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--errorrate', help="Fraction of commands (0-1) answered with an error reply.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--droprate', help="Fraction of commands (0-1) that close the connection without a reply.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--seed', help="Random seed for repeatable error/drop patterns.  Default is random.", default=None, required=False)
+    argparser.add_argument('--trackerargs', help="Extra skytrack.py arguments, space separated (e.g. '--rotordeadband=0.5').", default="", required=False)
+    argparser.add_argument('--trackerlog', help="File for the tracker's console output.  Default is to discard it.", default="", required=False)
+
+    args = argparser.parse_args()
+
+    if args.targets < 1 or args.targets > len(TARGET_BODIES):
+        print("ERROR: --targets must be between 1 and " + str(len(TARGET_BODIES)) + ".")
+        exit(1)
+
+    if not os.path.exists(args.ephemeris):
+        print("ERROR: Unable to find ephemeris " + args.ephemeris + ".  The harness runs offline and does not download kernels.")
+        exit(1)
+
+    duration = float(args.duration)
+    radioPort = args.baseport
+    rotorPort = args.baseport + 1
+
+    simSettings = {'latency': float(args.latency)/1000.0, 'jitter': float(args.jitter)/1000.0, 'errorRate': float(args.errorrate),
+                   'dropRate': float(args.droprate), 'seed': int(args.seed) if args.seed is not None else None}
+    if args.radiotype == 'sdrsharp':
+        radioServer = SimSdrSharp(radioPort, **simSettings)
+    else:
+        radioServer = SimGqrx(radioPort, **simSettings)
+    servers = [radioServer, SimRotctld(rotorPort, **simSettings)]
+
+    simThread = SimDeviceThread(servers)
+    try:
+        simThread.start()
+    except OSError as e:
+        print("ERROR: Unable to start simulated devices on ports %d-%d: %s" % (radioPort, rotorPort, str(e)))
+        exit(2)
+
+    metricsFd, metricsLog = tempfile.mkstemp(prefix='loadharness-', suffix='.jsonl')
+    os.close(metricsFd)
+
+    cmd = trackerCommand(args, radioPort, rotorPort, metricsLog)
+    print("Running for %.0f seconds: %s" % (duration, " ".join(cmd[1:])))
+
+    if len(args.trackerlog) > 0:
+        trackerOutput = open(args.trackerlog, 'w')
+    else:
+        trackerOutput = subprocess.DEVNULL
+
+    startTime = time.monotonic()
+    tracker = subprocess.Popen(cmd, stdout=trackerOutput, stderr=subprocess.STDOUT)
+
+    try:
+        tracker.wait(timeout=duration)
+        print("WARNING: The tracker exited early with code %d." % tracker.returncode)
+    except subprocess.TimeoutExpired:
+        pass
+    except KeyboardInterrupt:
+        print("\nInterrupted, stopping the tracker.")
+
+    elapsed = time.monotonic() - startTime
+
+    # SIGINT lets the tracker write its final metrics line
+    if tracker.poll() is None:
+        tracker.send_signal(signal.SIGINT)
+        try:
+            tracker.wait(timeout=EXIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print("WARNING: The tracker did not exit after SIGINT, killing it.")
+            tracker.kill()
+            tracker.wait()
+
+    simThread.stop()
+    if trackerOutput is not subprocess.DEVNULL:
+        trackerOutput.close()
+
+    printReport(servers, readLastSnapshot(metricsLog), elapsed)
+
+    try:
+        os.remove(metricsLog)
+    except OSError:
+        pass
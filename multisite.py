@@ -0,0 +1,245 @@
+###################################################################
+#
+# Module: multisite.py
+# Author: ghostop14
+#
+# Multi-site observer fan-out for skytrack.py.  Every ground station in a
+# network tracking the same body needs its own az/el/range-rate/doppler, but
+# almost all of the work is common to them: the time scale and Earth rotation
+# (nutation/precession) for each instant, the Earth's barycentric position,
+# the body's light-time corrected barycentric position and velocity, its
+# light deflection and its illumination.  Those are solved once per time;
+# each site then only adds its own position, light-time difference,
+# aberration and horizon rotation, as numpy operations across all sites and
+# times at once.
+#
+# Differences from a full per-site skyfield apparent() solve: the per-site
+# light time is applied from the body's velocity (it differs from the
+# geocentric one by at most ~21 ms), gravitational deflection is taken from
+# the geocentre, and the Earth's own deflection (< 1 mas) is left out.
+# Together these stay far below a milliarcsecond for solar system bodies.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import signal
+import time
+from datetime import datetime
+
+import numpy as np
+
+from skyfield import almanac
+from skyfield.constants import ANGVEL, AU_M, C_AUDAY, DAY_S
+from skyfield.framelib import itrs
+from skyfield.nutationlib import iau2000b
+from skyfield.relativity import add_aberration, add_deflection
+
+from ephemtable import doppler_shift, resolveBody
+from sites import siteLabel
+from trackscheduler import DeadlineScheduler
+from tracker import STATE_DTYPE, TrackState, timestampsToTime
+from trackmetrics import TrackMetrics, schedulerCollector
+
+# -------------------  Global Vars -------------------------------------
+LIGHT_TIME_ITERATIONS = 2  # per-site light-time refinements (the first is already within microseconds)
+
+# Set in each worker process by initSiteWorker()
+workerPlanets = None
+workerTs = None
+workerSites = None
+workerTargets = None
+
+# -------------------  Global Functions ----------------------------------------
+def computeSiteStates(planets, siteArray, target, bodyName, freq, times, timestamps):
+    # Batched solve of one target for every site at every time.  times is a skyfield Time array,
+    # timestamps the same times as POSIX seconds.  Returns a STATE_DTYPE array shaped
+    # (len(timestamps), len(sites)).
+    numTimes = len(timestamps)
+
+    # ---- Shared by every site ----
+    earthAt = planets['earth'].at(times)
+    earthPosition = earthAt.position.au
+    earthVelocity = earthAt.velocity.au_per_d
+
+    geocentric = earthAt.observe(target)
+    geoPosition = geocentric.position.au
+    geoLightTime = geocentric.light_time
+    # Barycentric position/velocity of the target when the light seen at the geocentre left it
+    targetPosition = earthPosition + geoPosition
+    targetVelocity = earthVelocity + geocentric.velocity.au_per_d
+
+    # Deflection by the Sun, Jupiter and Saturn as a change in direction
+    deflected = geoPosition.copy()
+    add_deflection(deflected, earthPosition, planets, times, np.array(False))
+    geoDistance = np.sqrt(np.sum(geoPosition * geoPosition, axis=0))
+    deflection = deflected / np.sqrt(np.sum(deflected * deflected, axis=0)) - geoPosition / geoDistance
+
+    rotation = itrs.rotation_at(times)  # (3, 3, times), GCRS -> ITRS
+    illumination = almanac.fraction_illuminated(planets, bodyName, times)
+
+    # ---- Per site, (3, sites, times) ----
+    siteGcrs = np.einsum('jit,js->ist', rotation, siteArray.itrsPosition)
+    siteVelocity = np.einsum('jit,js->ist', rotation, siteArray.itrsVelocity)
+    observerPosition = earthPosition[:, np.newaxis, :] + siteGcrs
+    observerVelocity = earthVelocity[:, np.newaxis, :] + siteVelocity
+
+    targetPosition = targetPosition[:, np.newaxis, :]
+    targetVelocity = targetVelocity[:, np.newaxis, :]
+    lightTime = np.broadcast_to(geoLightTime, (siteArray.numSites, numTimes))
+    for iteration in range(LIGHT_TIME_ITERATIONS):
+        position = targetPosition + targetVelocity * (geoLightTime - lightTime) - observerPosition
+        distance = np.sqrt(np.sum(position * position, axis=0))
+        lightTime = distance / C_AUDAY
+
+    velocity = targetVelocity - observerVelocity
+    rangeRate = np.sum(position * velocity, axis=0) / distance * AU_M / DAY_S
+
+    apparent = position + deflection[:, np.newaxis, :] * distance
+    add_aberration(apparent, observerVelocity, lightTime)
+
+    # Horizon coordinates from the ITRS direction and each site's east/north/up
+    apparentItrs = np.einsum('ijt,jst->ist', rotation, apparent)
+    east = np.einsum('is,ist->st', siteArray.east, apparentItrs)
+    north = np.einsum('is,ist->st', siteArray.north, apparentItrs)
+    up = np.einsum('is,ist->st', siteArray.up, apparentItrs)
+
+    states = np.empty((numTimes, siteArray.numSites), dtype=STATE_DTYPE)
+    states['time'] = timestamps[:, np.newaxis]
+    states['azimuth'] = (np.degrees(np.arctan2(east, north)) % 360.0).T
+    states['elevation'] = np.degrees(np.arctan2(up, np.hypot(east, north))).T
+    states['range'] = (np.sqrt(np.sum(apparent * apparent, axis=0)) * AU_M).T
+    states['rangeRate'] = rangeRate.T
+    states['doppler'] = doppler_shift(freq, rangeRate.T) if freq != 0.0 else np.nan
+    states['illumination'] = np.asarray(illumination)[:, np.newaxis]
+
+    return states
+
+def computeSiteChunk(planets, ts, siteArray, targets, timestamps):
+    # Every (target, site) pair for a chunk of POSIX timestamps, sharing one Time array (and its Earth
+    # rotation) between targets.  targets is a list of (label, bodyName, target, freq).  Returns a
+    # STATE_DTYPE array shaped (len(timestamps), len(targets) * len(sites)), target-major.
+    times = timestampsToTime(ts, timestamps)
+    # IAU 2000B nutation, as in the single site export
+    times._nutation_angles = iau2000b(times.tt)
+
+    return np.concatenate([computeSiteStates(planets, siteArray, curTarget, curBody, curFreq, times, timestamps)
+                           for curLabel, curBody, curTarget, curFreq in targets], axis=1)
+
+def initSiteWorker(kernelFile, sites, targetBodies):
+    # targetBodies is a list of (label, bodyName, freq).  Loads the kernel once per worker process.
+    # Ctrl-C is left to the main process, which keeps what was exported and shuts the pool down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    global workerPlanets
+    global workerTs
+    global workerSites
+    global workerTargets
+
+    from skyfield.api import load
+    workerPlanets = load(kernelFile)
+    workerTs = load.timescale()
+    workerSites = SiteArray(sites)
+    workerTargets = [(curLabel,) + resolveBody(workerPlanets, curBody) + (curFreq,) for curLabel, curBody, curFreq in targetBodies]
+
+def siteChunk(timestamps):
+    # Runs in a worker.  computeSiteChunk() with the worker's kernel, sites and targets.
+    return computeSiteChunk(workerPlanets, workerTs, workerSites, workerTargets, timestamps)
+
+def runMultiSite(ts, planets, siteArray, targets, delay, leadTime=0.0, utcTime=None, metrics=None, output=None):
+    # Position-only loop for every target from every site.  targets is a list of (label, bodyName, target, freq).
+    # Each tick is one batched solve for the tick time (no tables), so nothing is interpolated.
+    # utcTime is an optional timezone-aware datetime to solve once for instead of looping.
+    # metrics is an optional trackmetrics.TrackMetrics, output an optional trackoutput.StateWriter that gets a
+    # record per target and site (named target@site) in place of the status table.
+    lastStatusTime = 0.0
+    scheduler = DeadlineScheduler(delay, leadTime)
+
+    if metrics is None:
+        metrics = TrackMetrics()
+    metrics.addCollector(schedulerCollector(scheduler))
+
+    try:
+        while True:
+            tickStart = time.perf_counter()
+
+            if utcTime is not None:
+                tickTime = utcTime
+            else:
+                # State is computed for when the tick takes effect, not when we woke up
+                tickTime = scheduler.tickTime()
+
+            timestamps = np.array([tickTime.timestamp()])
+            with metrics.stage('ephemeris'):
+                # One Time (and Earth rotation) shared by every target, same as the export path
+                states = computeSiteChunk(planets, ts, siteArray, targets, timestamps)[0]
+
+            showStatus = output is None and (utcTime is not None or delay >= 1.0 or (time.monotonic() - lastStatusTime) >= 1.0)
+            if showStatus:
+                lastStatusTime = time.monotonic()
+                print("\nCurrent Time: " + datetime.now().strftime("%m/%d/%Y %H:%M:%S") + "  (" + datetime.utcnow().strftime("%m/%d/%Y %H:%M:%S") + " UTC)")
+                if utcTime is not None:
+                    print("Calculating for: " + utcTime.strftime("%Y/%m/%d %H:%M:%S") + " UTC")
+                else:
+                    print(scheduler.summary())
+                print("%-16s %-16s %10s %10s %16s %12s %8s %18s" % ("Target", "Site", "Azimuth", "Elevation", "Distance (km)", "Vel (m/s)", "Illum", "Doppler Freq (Hz)"))
+
+            index = 0
+            for curLabel, curBody, curTarget, curFreq in targets:
+                for curSite in siteArray.names:
+                    curState = states[index]
+                    index += 1
+                    dopplerFreq = float(curState['doppler']) if curFreq != 0.0 else None
+
+                    if output is not None:
+                        with metrics.stage('output'):
+                            output.write(siteLabel(curLabel, curSite), TrackState(float(curState['time']), float(curState['azimuth']), float(curState['elevation']),
+                                                                                  float(curState['range']), float(curState['rangeRate']), dopplerFreq,
+                                                                                  float(curState['illumination'])))
+
+                    if showStatus:
+                        if dopplerFreq is not None:
+                            freqStr = "%.2f" % dopplerFreq
+                        else:
+                            freqStr = "-"
+
+                        print("%-16s %-16s %10.2f %10.2f %16.2f %12.2f %7.2f%% %18s" % (curLabel, curSite, curState['azimuth'], curState['elevation'],
+                                                                                  curState['range']/1000.0, curState['rangeRate'], curState['illumination']*100.0, freqStr))
+
+            metrics.observeStage('tick', time.perf_counter() - tickStart)
+
+            if utcTime is not None:
+                break
+
+            metrics.maybeLog()
+            scheduler.wait()
+    except KeyboardInterrupt:
+        pass
+
+    if utcTime is None:
+        print(scheduler.summary())
+
+# -------------------  Classes ----------------------------------------
+class SiteArray(object):
+    """
+    DESCRIPTION:
+        A list of sites.Site stacked for computeSiteStates(): Earth-fixed (ITRS) positions and
+        rotation velocities, and each site's local east/north/up unit vectors, as (3, sites) arrays.
+    INPUTS:
+        sites (list)             = sites.Site objects
+    """
+    def __init__(self, sites):
+        self.sites = list(sites)
+        self.numSites = len(self.sites)
+        self.names = [curSite.name for curSite in self.sites]
+
+        self.itrsPosition = np.stack([curSite.topos().itrs_xyz.au for curSite in self.sites], axis=1)
+        x, y, z = self.itrsPosition
+        self.itrsVelocity = ANGVEL * DAY_S * np.array((-y, x, 0.0 * z))
+
+        lat = np.radians([curSite.lat for curSite in self.sites])
+        lon = np.radians([curSite.long for curSite in self.sites])
+        self.east = np.array((-np.sin(lon), np.cos(lon), np.zeros_like(lon)))
+        self.north = np.array((-np.sin(lat) * np.cos(lon), -np.sin(lat) * np.sin(lon), np.cos(lat)))
+        self.up = np.array((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+    def __len__(self):
+        return self.numSites
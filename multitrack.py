@@ -0,0 +1,260 @@
+###################################################################
+#
+# Module: multitrack.py
+# Author: ghostop14
+#
+# Multi-target tracking for skytrack.py.  One loaded ephemeris kernel and one
+# observer serve N targets, each with its own optional radio and rotor.  All
+# target positions for a tracking window are computed together (sharing the
+# observer's position) and each tick is served from the resulting tables.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import contextlib
+import time
+from datetime import datetime
+
+from ephemtable import buildTargetTables, resolveBody, doppler_shift, DEFAULT_TABLE_WINDOW, DEFAULT_TABLE_STEP, INTERPOLATION_CUBIC
+from radiocontrol import RadioConnection, RADIOTYPE_GQRX, RADIOTYPE_SDRSHARP
+from rotorcontrol import RCmoveToPosition, getRotor, ROTOR_OK
+from rotorlimits import RotorLimits
+from rotormotion import MotionPlanner
+from trackscheduler import DeadlineScheduler
+from tracker import TrackState
+from trackdefaults import DEFAULT_RADIO_PIPELINE
+from trackmetrics import TrackMetrics, schedulerCollector, radioCollector
+
+# -------------------  Global Vars -------------------------------------
+TARGET_SPEC_KEYS = ['body', 'name', 'freq', 'radio', 'sdrsharp', 'rotor', 'rotortype', 'rotorbaud']
+
+# -------------------  Global Functions ----------------------------------------
+def parseTargetSpec(spec):
+    # Parses 'body=moon,freq=144000000,radio=127.0.0.1:7356,rotor=127.0.0.1:4533' into a dict.
+    # A bare first item is taken as the body (e.g. 'moon,freq=144000000').  name is an optional label
+    # (default is the body) for telling apart several targets on the same body.
+    params = {}
+
+    for index, item in enumerate(spec.split(',')):
+        item = item.strip()
+        if len(item) == 0:
+            continue
+
+        if '=' not in item:
+            if index == 0:
+                params['body'] = item
+                continue
+
+            raise ValueError("Bad target parameter '" + item + "'.  Expected key=value.")
+
+        key, value = item.split('=', 1)
+        key = key.strip().lower()
+        if key not in TARGET_SPEC_KEYS:
+            raise ValueError("Unknown target parameter '" + key + "'.  Options are: " + ", ".join(TARGET_SPEC_KEYS))
+
+        params[key] = value.strip()
+
+    if 'body' not in params:
+        raise ValueError("Target '" + spec + "' does not specify a body.")
+
+    if ('radio' in params or 'sdrsharp' in params) and float(params.get('freq', 0.0)) == 0.0:
+        raise ValueError("Target '" + spec + "' needs a freq to drive a radio.")
+
+    return params
+
+def checkTargetLabels(targets):
+    # Raises ValueError if two TrackTargets share a label (give them different name= values)
+    labels = set()
+    for curTarget in targets:
+        if curTarget.label in labels:
+            raise ValueError("More than one target is labelled " + curTarget.label + ".  Give each a different name=.")
+        labels.add(curTarget.label)
+
+# -------------------  Classes ----------------------------------------
+class TrackTarget(object):
+    """
+    DESCRIPTION:
+        One tracked body and its outputs.  Radio and rotor are optional.
+    INPUTS:
+        spec (str)               = target specification (see parseTargetSpec)
+        planets (SpiceKernel)    = loaded ephemeris kernel
+        rotortype (int)          = default rotctl rotor type if the spec does not give one
+        rotorbaud (int)          = default rotor baud if the spec does not give one
+        connectRadio (bool)      = open a blocking RadioConnection now (the asyncio core makes its own)
+        radioPipeline (int)      = frequency commands in flight before waiting for a reply
+    """
+    def __init__(self, spec, planets, rotortype=2, rotorbaud=9600, connectRadio=True, radioPipeline=DEFAULT_RADIO_PIPELINE):
+        params = parseTargetSpec(spec)
+
+        self.bodyName, self.target = resolveBody(planets, params['body'])
+        self.label = params.get('name', params['body'])
+        self.freq = float(params.get('freq', 0.0))
+        self.rotor = params.get('rotor', "")
+        self.rotortype = int(params.get('rotortype', rotortype))
+        self.rotorbaud = int(params.get('rotorbaud', rotorbaud))
+        self.lastElevation = -999.0
+
+        if 'sdrsharp' in params:
+            self.radioAddress = params['sdrsharp']
+            self.radioType = RADIOTYPE_SDRSHARP
+        elif 'radio' in params:
+            self.radioAddress = params['radio']
+            self.radioType = RADIOTYPE_GQRX
+        else:
+            self.radioAddress = ""
+            self.radioType = RADIOTYPE_GQRX
+
+        if connectRadio and len(self.radioAddress) > 0:
+            self.radio = RadioConnection(self.radioAddress, self.radioType, radioPipeline)
+        else:
+            self.radio = None
+
+        self.table = None
+        # Most recent tracker.TrackState, for the daemon's state query
+        self.state = None
+        # rotormotion.MotionPlanner for this target's rotor, set up by the tracking loop
+        self.motion = None
+
+    def close(self):
+        if self.radio:
+            # Collect the replies still in flight so they are counted
+            self.radio.flush()
+            self.radio.close()
+
+def runMultiTarget(ts, planets, observer, targets, delay, azoffset=0.0, rotorLimits=None, sendAosLos=False,
+                   aos_elevation=10.0, tableWindow=DEFAULT_TABLE_WINDOW, tableStep=DEFAULT_TABLE_STEP, interpolation=INTERPOLATION_CUBIC, leadTime=0.0, tableCache=None,
+                   rotorMotion=None, metrics=None, control=None, output=None):
+    # Tracking loop for a list of TrackTargets.  Runs until interrupted.
+    # rotorLimits is a rotorlimits.RotorLimits (default is no limits).
+    # tableCache is an optional tablecache.EphemerisTableCache to load/save the tables through.
+    # rotorMotion is a dict of rotormotion.MotionPlanner settings used for each target's rotor.
+    # metrics is an optional trackmetrics.TrackMetrics that stage timings and round trips are recorded in.
+    # control is an optional trackdaemon.TrackControl that changes targets between ticks; the loop then runs
+    # until it is stopped, and the target list may be empty.
+    # output is an optional trackoutput.StateWriter that gets a record per target each tick in place of the status table.
+    if rotorLimits is None:
+        rotorLimits = RotorLimits()
+
+    if rotorMotion is None:
+        rotorMotion = {'rotorLimits': rotorLimits}
+
+    for curTarget in targets:
+        curTarget.motion = MotionPlanner(**rotorMotion)
+
+    lastStatusTime = 0.0
+    scheduler = DeadlineScheduler(delay, leadTime)
+
+    if metrics is None:
+        metrics = TrackMetrics()
+    metrics.addCollector(schedulerCollector(scheduler))
+    for curTarget in targets:
+        if curTarget.radio:
+            curTarget.radio.metrics = metrics
+    # Targets can come and go under a daemon, so radios are collected from the current list
+    metrics.addCollector(lambda: [value for curTarget in list(targets) if curTarget.radio for value in radioCollector(curTarget.radio)()])
+
+    if control is not None:
+        tickLock = control.lock
+        wakeup = control.wakeup
+        control.scheduler = scheduler
+    else:
+        tickLock = contextlib.nullcontext()
+        wakeup = None
+
+    try:
+        while control is None or not control.stopped:
+            tickStart = time.perf_counter()
+
+            with tickLock:
+                # State is computed for when this tick's commands take effect, not when we woke up
+                tickTime = scheduler.tickTime()
+                t = ts.from_datetime(tickTime)
+
+                # Targets normally share one table grid and are rebuilt together.  A target added by the
+                # daemon gets its table on its own.
+                needTables = [curTarget for curTarget in targets if curTarget.table is None or not curTarget.table.covers(t)]
+                if len(needTables) > 0:
+                    if tableCache is not None:
+                        buildTables = tableCache.getTables
+                    else:
+                        buildTables = buildTargetTables
+
+                    with metrics.stage('table'):
+                        tables = buildTables(ts, observer, [curTarget.target for curTarget in needTables], t, tableWindow, tableStep,
+                                             planets, [curTarget.bodyName for curTarget in needTables], interpolation)
+                    for curTarget, curTable in zip(needTables, tables):
+                        curTarget.table = curTable
+
+                    print("[Info] Precomputed %d positions for %d targets." % (len(tables[0]), len(needTables)))
+
+                showStatus = output is None and (delay >= 1.0 or (time.monotonic() - lastStatusTime) >= 1.0)
+                if showStatus:
+                    lastStatusTime = time.monotonic()
+                    print("\nCurrent Time: " + datetime.now().strftime("%m/%d/%Y %H:%M:%S") + "  (" + datetime.utcnow().strftime("%m/%d/%Y %H:%M:%S") + " UTC)")
+                    print(scheduler.summary())
+                    print("%-20s %10s %10s %16s %12s %8s %18s" % ("Target", "Azimuth", "Elevation", "Distance (km)", "Vel (m/s)", "Illum", "Doppler Freq (Hz)"))
+
+                for curTarget in targets:
+                    with metrics.stage('ephemeris'):
+                        azimuth, elevation, distance_meters, relativeVelocity, illumination = curTarget.table.lookup(t)
+
+                    if curTarget.freq != 0.0:
+                        dopplerFreq = doppler_shift(curTarget.freq, relativeVelocity)
+                    else:
+                        dopplerFreq = None
+
+                    curTarget.state = TrackState(tickTime.timestamp(), azimuth, elevation, distance_meters, relativeVelocity, dopplerFreq, illumination)
+
+                    if output is not None:
+                        with metrics.stage('output'):
+                            output.write(curTarget.label, curTarget.state)
+
+                    if curTarget.radio and sendAosLos:
+                        with metrics.stage('radio'):
+                            if elevation >= aos_elevation and curTarget.lastElevation < aos_elevation:
+                                curTarget.radio.sendAosLos("AOS\n")
+                            elif elevation < aos_elevation and curTarget.lastElevation >= aos_elevation:
+                                curTarget.radio.sendAosLos("LOS\n")
+
+                    curTarget.lastElevation = elevation
+
+                    if len(curTarget.rotor) > 0:
+                        trueAz = (azimuth + azoffset) % 360.0
+
+                        if rotorLimits.reachable(azimuth, elevation, azoffset):
+                            rotorCommand = curTarget.motion.plan(time.monotonic(), trueAz, elevation)
+                            if rotorCommand is not None:
+                                with metrics.stage('rotor'):
+                                    rotorResult = RCmoveToPosition(curTarget.rotor, curTarget.rotortype, curTarget.rotorbaud, rotorCommand[0], rotorCommand[1],
+                                                                 curTarget.motion.azRange)
+                                if rotorResult == ROTOR_OK:
+                                    curTarget.motion.commit(time.monotonic())
+                                    metrics.observeRtt(curTarget.rotor, getRotor(curTarget.rotor).lastLatency)
+                        elif showStatus:
+                            print('[Info] ' + curTarget.label + ': Rotor would violate user-configured limits.  No move sent.')
+
+                    if curTarget.radio and dopplerFreq is not None:
+                        with metrics.stage('radio'):
+                            curTarget.radio.setFrequency(dopplerFreq)
+
+                    if showStatus:
+                        if dopplerFreq is not None:
+                            freqStr = "%.2f" % dopplerFreq
+                        else:
+                            freqStr = "-"
+
+                        print("%-20s %10.2f %10.2f %16.2f %12.2f %7.2f%% %18s" % (curTarget.label, azimuth, elevation, distance_meters/1000.0,
+                                                                            relativeVelocity, illumination*100.0, freqStr))
+
+            metrics.observeStage('tick', time.perf_counter() - tickStart)
+            metrics.maybeLog()
+
+            scheduler.wait(wakeup)
+    except KeyboardInterrupt:
+        pass
+
+    print(scheduler.summary())
+
+    for curTarget in targets:
+        if len(curTarget.rotor) > 0:
+            print(curTarget.label + ": " + curTarget.motion.summary())
+        curTarget.close()
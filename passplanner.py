@@ -0,0 +1,304 @@
+#!/usr/bin/python3
+
+###################################################################
+#
+# Application: passplanner.py
+# Author: ghostop14
+#
+# Multi-day, multi-target pass planner.  Finds every window in which each
+# body is above a chosen elevation from each site over days or weeks, and
+# reports rotors that are asked to serve overlapping passes.  The search is
+# split into (site, body, day) chunks that run in parallel in a process
+# pool, with each worker loading the ephemeris once.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from trackdefaults import DEFAULT_KERNEL
+from bodyindex import loadBodyIndex, bodyInIndex
+from sites import Site
+
+# -------------------  Global Vars -------------------------------------
+DEFAULT_MIN_ELEVATION = 10.0  # degrees
+DEFAULT_PLAN_DAYS = 7
+DEFAULT_CHUNK_DAYS = 1.0
+
+# Sample spacing used to find each pass's maximum elevation
+MAX_ELEVATION_STEP = 60.0  # seconds
+
+SECONDS_PER_DAY = 86400.0
+
+# Set in each worker process by initPlanWorker()
+workerPlanets = None
+workerTs = None
+
+# -------------------  Classes ----------------------------------------
+class Pass(object):
+    """
+    DESCRIPTION:
+        One visibility window of a body from a site.  Times are TT Julian dates.  startsOpen/endsOpen
+        mark windows cut by the edge of a search chunk, so windows split across chunks can be joined.
+    """
+    __slots__ = ('site', 'body', 'rotor', 'riseTT', 'setTT', 'maxElevation', 'maxElevationTT', 'riseAz', 'setAz', 'startsOpen', 'endsOpen')
+
+    def __init__(self, site, body, rotor, riseTT, setTT, maxElevation, maxElevationTT, riseAz, setAz, startsOpen, endsOpen):
+        self.site = site
+        self.body = body
+        self.rotor = rotor
+        self.riseTT = riseTT
+        self.setTT = setTT
+        self.maxElevation = maxElevation
+        self.maxElevationTT = maxElevationTT
+        self.riseAz = riseAz
+        self.setAz = setAz
+        self.startsOpen = startsOpen
+        self.endsOpen = endsOpen
+
+    def duration(self):
+        # seconds
+        return (self.setTT - self.riseTT) * SECONDS_PER_DAY
+
+    def overlaps(self, other):
+        return self.riseTT < other.setTT and other.riseTT < self.setTT
+
+# -------------------  Global Functions ----------------------------------------
+def initPlanWorker(kernelFile):
+    global workerPlanets
+    global workerTs
+
+    from skyfield.api import load
+    workerPlanets = load(kernelFile)
+    workerTs = load.timescale()
+
+def planChunk(site, bodyName, startTT, endTT, minElevation):
+    # Runs in a worker.  Returns the Passes of bodyName above minElevation from site between startTT and endTT.
+    import numpy as np
+    from skyfield import almanac
+    from ephemtable import resolveBody, computeTopocentric
+    from risesetcache import targetUpAt
+
+    ts = workerTs
+    bodyName, target = resolveBody(workerPlanets, bodyName)
+    observer = site.observer(workerPlanets)
+    isUp = targetUpAt(observer, target, minElevation)
+
+    times, risen = almanac.find_discrete(ts.tt_jd(startTT), ts.tt_jd(endTT), isUp)
+
+    windows = []
+    riseTT = startTT if bool(isUp(ts.tt_jd(startTT))) else None
+    for curTT, curRisen in zip(times.tt, risen):
+        if curRisen:
+            riseTT = curTT
+        elif riseTT is not None:
+            windows.append((riseTT, curTT))
+            riseTT = None
+
+    if riseTT is not None:
+        windows.append((riseTT, endTT))
+
+    passes = []
+    for riseTT, setTT in windows:
+        numSamples = max(int((setTT - riseTT) * SECONDS_PER_DAY / MAX_ELEVATION_STEP), 1) + 1
+        sampleTT = np.linspace(riseTT, setTT, numSamples)
+        azimuth, elevation, distance, rangeRate = computeTopocentric(observer, target, ts.tt_jd(sampleTT))
+        maxIndex = int(np.argmax(elevation))
+
+        passes.append(Pass(site.name, bodyName, site.rotor, float(riseTT), float(setTT), float(elevation[maxIndex]),
+                           float(sampleTT[maxIndex]), float(azimuth[0]), float(azimuth[-1]), riseTT == startTT, setTT == endTT))
+
+    return passes
+
+def mergePasses(passes):
+    # Joins windows that were split at chunk boundaries.  Returns passes sorted by site, body, rise.
+    merged = []
+
+    for curPass in sorted(passes, key=lambda p: (p.site, p.body, p.riseTT)):
+        if (len(merged) > 0 and merged[-1].site == curPass.site and merged[-1].body == curPass.body and
+                merged[-1].endsOpen and curPass.startsOpen and merged[-1].setTT == curPass.riseTT):
+            lastPass = merged[-1]
+            lastPass.setTT = curPass.setTT
+            lastPass.setAz = curPass.setAz
+            lastPass.endsOpen = curPass.endsOpen
+            if curPass.maxElevation > lastPass.maxElevation:
+                lastPass.maxElevation = curPass.maxElevation
+                lastPass.maxElevationTT = curPass.maxElevationTT
+        else:
+            merged.append(curPass)
+
+    return merged
+
+def findConflicts(passes):
+    # Returns (pass1, pass2) pairs of different site/body passes that need the same rotor at the same time
+    conflicts = []
+    byRotor = {}
+
+    for curPass in passes:
+        byRotor.setdefault(curPass.rotor, []).append(curPass)
+
+    for rotorPasses in byRotor.values():
+        rotorPasses.sort(key=lambda p: p.riseTT)
+        active = []
+
+        for curPass in rotorPasses:
+            active = [p for p in active if p.setTT > curPass.riseTT]
+            for activePass in active:
+                if (activePass.site, activePass.body) != (curPass.site, curPass.body):
+                    conflicts.append((activePass, curPass))
+
+            active.append(curPass)
+
+    return conflicts
+
+def planPasses(kernelFile, sites, bodyNames, startTT, endTT, minElevation=DEFAULT_MIN_ELEVATION, chunkDays=DEFAULT_CHUNK_DAYS, workers=None):
+    # Returns the merged list of Passes for every site/body between startTT and endTT
+    chunks = []
+    chunkStart = startTT
+    while chunkStart < endTT:
+        chunkEnd = min(chunkStart + chunkDays, endTT)
+        for curSite in sites:
+            for curBody in bodyNames:
+                chunks.append((curSite, curBody, chunkStart, chunkEnd, minElevation))
+        chunkStart = chunkEnd
+
+    passes = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=initPlanWorker, initargs=(kernelFile,)) as executor:
+        for chunkPasses in executor.map(planChunk, *zip(*chunks), chunksize=max(len(chunks) // (4 * (workers or os.cpu_count() or 1)), 1)):
+            passes.extend(chunkPasses)
+
+    return mergePasses(passes)
+
+def parseDate(datestr):
+    # year/month/day [hh:mm:ss], UTC
+    datestr = datestr.strip().strip('"').strip("'")
+    for curFormat in ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(datestr, curFormat)
+        except ValueError:
+            pass
+
+    raise ValueError("Bad date '" + datestr + "'.  Format: year/month/day [hh:mm:ss]")
+
+# ----------------------  Main Code -------------------------------------------------------
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Multi-day, multi-target pass planner')
+    argparser.add_argument('--body', help="[Required] Comma-separated bodies to plan for (e.g. moon,mars,jupiter).  Use skytrack.py --listbodies to see options.", default="", required=False)
+    argparser.add_argument('--lat', help="Observer Latitude (single site)", default=-999.0, required=False)
+    argparser.add_argument('--long', help="Observer Longitude (single site)", default=-999.0, required=False)
+    argparser.add_argument('--altitude', help="Observer altitude in meters (single site).  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--site', help="Plan for several sites.  Repeat for each site as name=<name>,lat=<deg>,long=<deg>[,alt=<m>][,rotor=<label>].  Sites sharing a rotor label share one rotor.  Replaces --lat/--long/--altitude.", action='append', default=None, required=False)
+    argparser.add_argument('--start', help="First UTC date to plan.  Format: year/month/day [hh:mm:ss].  Default is now.", default="", required=False)
+    argparser.add_argument('--days', help="Number of days to plan.  Default is " + str(DEFAULT_PLAN_DAYS) + ".", default=DEFAULT_PLAN_DAYS, required=False)
+    argparser.add_argument('--minelevation', help="Only count time above this elevation in degrees.  Default is " + str(DEFAULT_MIN_ELEVATION) + ".", default=DEFAULT_MIN_ELEVATION, required=False)
+    argparser.add_argument('--workers', help="Number of worker processes.  Default is one per CPU.", default=0, required=False)
+    argparser.add_argument('--ephemeris', help="Ephemeris kernel to load.  Default is " + DEFAULT_KERNEL, default=DEFAULT_KERNEL, required=False)
+    argparser.add_argument('--output', help="If provided, the schedule is also written to this CSV file.", default="", required=False)
+
+    args = argparser.parse_args()
+
+    if len(args.body) == 0:
+        print("ERROR: Body is required.")
+        exit(1)
+
+    bodyNames = [curBody.strip() for curBody in args.body.split(',') if len(curBody.strip()) > 0]
+    bodyIndex = loadBodyIndex(args.ephemeris)
+    if bodyIndex is not None:
+        for curBody in bodyNames:
+            if not bodyInIndex(bodyIndex, curBody):
+                print("ERROR: Unknown body: " + curBody + ".  Use skytrack.py --listbodies to see options.")
+                exit(1)
+
+    try:
+        if args.site:
+            sites = [Site.fromSpec(curSpec, "site%d" % (index + 1)) for index, curSpec in enumerate(args.site)]
+        elif float(args.lat) != -999.0 and float(args.long) != -999.0:
+            sites = [Site("observer", args.lat, args.long, args.altitude)]
+        else:
+            print("ERROR: Latitude and Longitude (or --site) are required.")
+            exit(1)
+
+        if len(args.start) > 0:
+            startDate = parseDate(args.start)
+        else:
+            startDate = datetime.utcnow()
+    except ValueError as e:
+        print("ERROR: " + str(e))
+        exit(1)
+
+    days = float(args.days)
+    if days <= 0.0:
+        print("ERROR: --days must be greater than zero.")
+        exit(1)
+
+    if args.ephemeris != DEFAULT_KERNEL and not os.path.exists(args.ephemeris):
+        print("ERROR: Unable to find ephemeris " + args.ephemeris)
+        exit(1)
+
+    from skyfield.api import load
+    ts = load.timescale()
+
+    endDate = startDate + timedelta(days=days)
+    startTT = ts.utc(startDate.year, startDate.month, startDate.day, startDate.hour, startDate.minute, startDate.second).tt
+    endTT = ts.utc(endDate.year, endDate.month, endDate.day, endDate.hour, endDate.minute, endDate.second).tt
+
+    # Load (and if needed download) the kernel here once, so the workers don't race to fetch it
+    from ephemtable import kernelCoverage
+    coverageStart, coverageEnd = kernelCoverage(load(args.ephemeris))
+    if not (coverageStart <= ts.tt_jd(startTT).tdb and ts.tt_jd(endTT).tdb <= coverageEnd):
+        print("ERROR: " + args.ephemeris + " only covers " + ts.tdb_jd(coverageStart).utc_strftime("%Y/%m/%d %H:%M:%S") + " to " +
+              ts.tdb_jd(coverageEnd).utc_strftime("%Y/%m/%d %H:%M:%S") + " UTC.")
+        exit(1)
+
+    workers = int(args.workers) if int(args.workers) > 0 else None
+    minElevation = float(args.minelevation)
+
+    planStart = datetime.now()
+    passes = planPasses(args.ephemeris, sites, bodyNames, startTT, endTT, minElevation, workers=workers)
+    conflicts = findConflicts(passes)
+    planTime = (datetime.now() - planStart).total_seconds()
+
+    def utcString(tt):
+        return ts.tt_jd(tt).utc_strftime("%Y/%m/%d %H:%M:%S")
+
+    print("Passes above %.1f degrees, %s to %s UTC (%d sites, %d bodies, %.1f s)\n" % (minElevation, startDate.strftime("%Y/%m/%d %H:%M:%S"),
+          endDate.strftime("%Y/%m/%d %H:%M:%S"), len(sites), len(bodyNames), planTime))
+    print("%-12s %-20s %-20s %-20s %9s %8s %-20s %8s %8s" % ("Site", "Body", "Rise (UTC)", "Set (UTC)", "Duration", "Max El", "Max El (UTC)", "Rise Az", "Set Az"))
+
+    for curPass in sorted(passes, key=lambda p: p.riseTT):
+        riseStr = utcString(curPass.riseTT) + ("<" if curPass.startsOpen else "")
+        setStr = utcString(curPass.setTT) + (">" if curPass.endsOpen else "")
+        print("%-12s %-20s %-20s %-20s %9s %8.2f %-20s %8.2f %8.2f" % (curPass.site, curPass.body, riseStr, setStr,
+              str(timedelta(seconds=int(curPass.duration()))), curPass.maxElevation, utcString(curPass.maxElevationTT),
+              curPass.riseAz, curPass.setAz))
+
+    print("\n< already up at the start of the plan, > still up at the end of the plan")
+
+    if len(conflicts) > 0:
+        print("\nRotor conflicts:")
+        for firstPass, secondPass in conflicts:
+            print("%-12s %s @ %s and %s @ %s overlap %s to %s UTC" % (firstPass.rotor, firstPass.body, firstPass.site, secondPass.body,
+                  secondPass.site, utcString(secondPass.riseTT), utcString(min(firstPass.setTT, secondPass.setTT))))
+    else:
+        print("\nNo rotor conflicts.")
+
+    if len(args.output) > 0:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['site', 'rotor', 'body', 'rise_utc', 'set_utc', 'duration_s', 'max_elevation', 'max_elevation_utc',
+                             'rise_az', 'set_az', 'conflict'])
+            conflicted = set()
+            for firstPass, secondPass in conflicts:
+                conflicted.add(id(firstPass))
+                conflicted.add(id(secondPass))
+
+            for curPass in sorted(passes, key=lambda p: p.riseTT):
+                writer.writerow([curPass.site, curPass.rotor, curPass.body, utcString(curPass.riseTT), utcString(curPass.setTT),
+                                 "%.0f" % curPass.duration(), "%.2f" % curPass.maxElevation, utcString(curPass.maxElevationTT),
+                                 "%.2f" % curPass.riseAz, "%.2f" % curPass.setAz, int(id(curPass) in conflicted)])
+
+        print("\nSchedule written to " + args.output)
@@ -4,83 +4,175 @@
 # For coordinate transform examples
 
 import sys
+import csv
+import numpy as np
 from astropy.coordinates import SkyCoord
 from astropy.coordinates import EarthLocation
+from astropy.coordinates import Angle
 from astropy.time import Time
 from astropy import units as u
 from astropy.coordinates import AltAz
 
 import argparse
-import socket
 import time
 
-# -------------------  Global Vars -------------------------------------
-netPortRotor = None
-lastElevation=-999.0
+import rotorcontrol
+from altaztable import AltAzTable, DEFAULT_ALTAZ_WINDOW, DEFAULT_ALTAZ_STEP
+from trackscheduler import DeadlineScheduler
+from rotorlimits import RotorLimits, loadHorizonMask, reachableWindows, nextReachable, describeWindows
+from rotormotion import MotionPlanner, parseSlewRate, parseAzRange
+from trackdefaults import OUTPUT_FORMAT_NDJSON, OUTPUT_FORMAT_BINARY, DEFAULT_OUTPUT_FLUSH, EXPORT_FORMAT_CSV, EXPORT_FORMAT_NPY, EXPORT_FORMAT_PARQUET, DEFAULT_EXPORT_STEP, DEFAULT_EXPORT_CHUNK
 
 # -------------------  Global Functions ----------------------------------------
-def socketConnect(server, port):
-    global netPortRotor
-    
-    if not netPortRotor:
-        netPortRotor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            netPortRotor.connect((server, port))
-        except:
-            print("ERROR: Unable to connect to " + server + ":" + str(port), file=sys.stderr)
-            netPortRotor = None
-            
-def RCmoveToPosition(port, azimuth, elevation):
+def RCmoveToPosition(port, azimuth, elevation, azRange=(0.0, 360.0)):
         # Port will be <ip>:<port>
-        
-        if azimuth < 0.0 or azimuth > 360.0:
-            return -1 
-
-        if elevation < 0:
-            elevation = 0
-            
-        if elevation > 360:
-            return -1 
-
         if ':' in port:
-            if not netPortRotor:
-                params = port.split(":")
-                socketConnect(params[0], int(params[1]))
-                
-            if netPortRotor:
-                cmdString = "P " + str(azimuth) + " " + str(elevation) + "\n"
-                netPortRotor.send(cmdString.encode('utf-8'))
-                
-            return 0
+            return rotorcontrol.RCmoveToPosition(port, 2, 9600, azimuth, elevation, azRange)
         else:
             print("ERROR: Bad port specification.", file=sys.stderr)
             return -1
 
+def parseUtcDate(datestr):
+    # Accepts the documented 'year/month/day hh:mm:ss' format as well as ISO 'year-month-day hh:mm:ss'
+    return Time(datestr.strip().replace('/', '-'), scale='utc')
+
+def parseCoordinate(value, unit):
+    # Plain numbers are degrees.  Otherwise parse as an angle string ('23h23m24s', '58d48.9m', '23:23:24'),
+    # with unit used for bare sexagesimal values (hourangle for RA, degrees for Dec).
+    try:
+        return float(value)
+    except ValueError:
+        return Angle(value.strip(), unit=unit).degree
+
+def loadCatalog(filename):
+    # Reads a catalog CSV of name,ra,dec rows.  Blank lines, '#' comments and a header row are skipped.
+    # Returns (names, SkyCoord array)
+    names = []
+    raDegrees = []
+    decDegrees = []
+
+    with open(filename, 'r', newline='') as f:
+        for lineNum, row in enumerate(csv.reader(f), start=1):
+            if len(row) == 0 or row[0].strip().startswith('#'):
+                continue
+
+            if len(row) < 3:
+                raise ValueError("%s line %d: expected name,ra,dec" % (filename, lineNum))
+
+            if len(names) == 0 and row[1].strip().lower() == 'ra':
+                # Header
+                continue
+
+            names.append(row[0].strip())
+            raDegrees.append(parseCoordinate(row[1], u.hourangle))
+            decDegrees.append(parseCoordinate(row[2], u.deg))
+
+    return names, SkyCoord(np.array(raDegrees)*u.deg, np.array(decDegrees)*u.deg, frame='icrs')
+
+def catalogAltAz(targets, groundLoc, obsTimes):
+    # Transforms every catalog source for every observing time in one vectorized call.
+    # Returns azimuth and elevation arrays in degrees, shaped (len(obsTimes), len(targets)).
+    # For an array of locations (--site) every site is in the same call, shaped (len(obsTimes), len(targets), len(groundLoc)).
+    obsTimes = Time(obsTimes)
+    if groundLoc.isscalar:
+        altAzFrame = AltAz(location=groundLoc, obstime=obsTimes.reshape(-1)[:, np.newaxis])
+        altAz = targets.reshape(-1)[np.newaxis, :].transform_to(altAzFrame)
+    else:
+        altAzFrame = AltAz(location=groundLoc.reshape(1, 1, -1), obstime=obsTimes.reshape(-1)[:, np.newaxis, np.newaxis])
+        altAz = targets.reshape(-1)[np.newaxis, :, np.newaxis].transform_to(altAzFrame)
+
+    return altAz.az.degree, altAz.alt.degree
+
+def printCatalogTable(names, obsTimes, azimuth, elevation, reachable, minElevation, visibleOnly):
+    print("%-24s %-23s %10s %10s %4s %10s" % ("Source", "UTC Time", "Azimuth", "Elevation", "Up", "Reachable"))
+
+    timeStrings = Time(obsTimes).reshape(-1).utc.iso
+    upCount = 0
+    reachableCount = 0
+
+    for timeIndex, timeString in enumerate(timeStrings):
+        for sourceIndex, name in enumerate(names):
+            isUp = elevation[timeIndex, sourceIndex] >= minElevation
+            isReachable = isUp and reachable[timeIndex, sourceIndex]
+            upCount += int(isUp)
+            reachableCount += int(isReachable)
+
+            if visibleOnly and not isReachable:
+                continue
+
+            print("%-24s %-23s %10.4f %10.4f %4s %10s" % (name[:24], timeString, azimuth[timeIndex, sourceIndex],
+                  elevation[timeIndex, sourceIndex], "Y" if isUp else "N", "Y" if isReachable else "N"))
+
+    print("\n%d sources x %d times: %d above %.1f degrees, %d inside rotor limits." % (len(names), len(timeStrings), upCount,
+          minElevation, reachableCount), file=sys.stderr)
+
 # -------------------  Main ----------------------------------------
 if __name__ == '__main__':
     argparser = argparse.ArgumentParser(description='RA/DEC to Az/El Converter with Rotor Control (via rotctld)')
-    argparser.add_argument('--ra', help="Target Right Ascention (can just be degrees '9.81625' or can be '<#>h<#>m<#s>')", default="", required=True)
-    argparser.add_argument('--dec', help="Target Declination (can just be degrees '10.88806' or can be '<#>d<#>m<#s>'", default="", required=True)
-    argparser.add_argument('--lat', help="Observer Latitude (decimal notation. Example: 40.1234)", default="", required=True)
-    argparser.add_argument('--long', help="Observer Longitude (decimal notation)", default="", required=True)
-    argparser.add_argument('--altitude', help="Observer Altitude (in meters)", default=-999.0, required=True)
+    argparser.add_argument('--ra', help="Target Right Ascention (can just be degrees '9.81625' or can be '<#>h<#>m<#s>').  Required unless --catalog is used.", default="", required=False)
+    argparser.add_argument('--dec', help="Target Declination (can just be degrees '10.88806' or can be '<#>d<#>m<#s>'.  Required unless --catalog is used.", default="", required=False)
+    argparser.add_argument('--lat', help="Observer Latitude (decimal notation. Example: 40.1234).  Required unless --site is used.", default="", required=False)
+    argparser.add_argument('--long', help="Observer Longitude (decimal notation).  Required unless --site is used.", default="", required=False)
+    argparser.add_argument('--altitude', help="Observer Altitude (in meters).  Required unless --site is used.", default=-999.0, required=False)
+    argparser.add_argument('--site', help="Multi-site mode.  Az/el from every site in one vectorized transform per update, with records named <target>@<site>.  Repeat for each site as name=<name>,lat=<deg>,long=<deg>[,alt=<m>].  Replaces --lat/--long/--altitude.  Works with --utcdate, --delay, --output and --export (also for a --catalog), not with --rotor.", action='append', default=None, required=False)
     argparser.add_argument('--azcorrect', help="Degrees to adjust calculated azimuth.  For example, useful if accounting for magnetic vs. true north.", default=0, required=False)
     argparser.add_argument('--rotor', help="Rotctld-compatible network rotor controller.  Specify as <ip>:<port>", default="", required=False)
     argparser.add_argument('--delay', help="Time in seconds between updates (default is single shot)", default=0, required=False)
     argparser.add_argument('--rotorleftlimit', help="If needed, can provide a rotor 'left' limit in degrees. For instance if obstructions block rotation or view.  Default is no restriction.  Note: if either left/right limit is noted, both are required.", default=-1, required=False)
     argparser.add_argument('--rotorrightlimit', help="If needed, can provide a rotor 'right' limit in degrees. For instance if obstructions block rotation or view.  Default is no restriction. Note: if either left/right limit is noted, both are required.", default=-1, required=False)
     argparser.add_argument('--rotorelevationlimit', help="If needed, can provide a rotor 'elevation' limit in degrees. For instance if obstructions block rotation or view.  Default is 90 degrees (straight up).", default=-1, required=False)
+    argparser.add_argument('--horizonmask', help="If provided, a CSV file of azimuth,min_elevation rows (degrees) describing obstructions.  The rotor is not moved to targets below the mask.", default="", required=False)
+    argparser.add_argument('--rotordeadband', help="Only move the rotor once the target has moved this many degrees (azimuth or elevation) from the last move sent.  Default is 0 (move every update).", default=0.0, required=False)
+    argparser.add_argument('--rotorslewrate', help="Rotor speed in degrees/second as 'az' or 'az,el'.  If provided, moves lead the target by the time the rotor needs to get there.  Default is 0 (unknown, no lead).", default="0", required=False)
+    argparser.add_argument('--rotorazrange', help="Azimuth values the rotor accepts as 'min,max', e.g. '-180,180' or '0,450' for a rotor with overlap.  Moves use whichever equivalent azimuth is the shortest path inside the limits.  Default is 0,360.", default="0,360", required=False)
     argparser.add_argument('--utcdate', help="[Alternate date] If provided, the UTC date and time will be used for the calculation rather than the current date/time.  Format: year/month/day hh:mm:ss", default="", required=False)
+    argparser.add_argument('--tablewindow', help="When looping, the Alt/Az transform is done once for this many seconds ahead and each update is interpolated from it.  Default is 3600 seconds.", default=DEFAULT_ALTAZ_WINDOW, required=False)
+    argparser.add_argument('--tablestep', help="Spacing in seconds between precomputed Alt/Az samples.  0 runs the full transform every update.  Default is 60 seconds.", default=DEFAULT_ALTAZ_STEP, required=False)
+    argparser.add_argument('--output', help="If provided, each update writes one machine-readable az/el record here instead of the text output: a filename (appended to), '-' for stdout, udp:<host>:<port> or unix:<path> (datagram socket).  With '-', all other messages go to stderr.  Records use the skytrack.py layout with range, range-rate, doppler and illumination empty.  Default is off.", default="", required=False)
+    argparser.add_argument('--outputformat', help="--output record format: 'ndjson' (one JSON object per line) or 'binary' (fixed-width little-endian records, see trackoutput.py).  Default is ndjson.", choices=[OUTPUT_FORMAT_NDJSON, OUTPUT_FORMAT_BINARY], default=OUTPUT_FORMAT_NDJSON, required=False)
+    argparser.add_argument('--outputflush', help="Seconds --output records are buffered before being written together.  0 writes every record as it is made.  Default is " + str(DEFAULT_OUTPUT_FLUSH) + " seconds.", default=DEFAULT_OUTPUT_FLUSH, required=False)
+    argparser.add_argument('--export', help="[Export mode] If provided, azimuth and elevation for the target (or every --catalog source) from --exportstart to --exportend every --exportstep seconds are computed in batches and written to this file in the skytrack.py export layout, then the program exits.  The format comes from the extension (.csv, .npy or .parquet) unless --exportformat is given.  Parquet needs pyarrow.", default="", required=False)
+    argparser.add_argument('--exportformat', help="[Export mode] csv, npy or parquet.  Default is from the --export file extension.", choices=[EXPORT_FORMAT_CSV, EXPORT_FORMAT_NPY, EXPORT_FORMAT_PARQUET], default="", required=False)
+    argparser.add_argument('--exportstart', help="[Export mode] First UTC time to export.  Format: year/month/day [hh:mm:ss].  Default is now.", default="", required=False)
+    argparser.add_argument('--exportend', help="[Export mode] Last UTC time to export.  Format: year/month/day [hh:mm:ss].  Default is 24 hours after --exportstart.", default="", required=False)
+    argparser.add_argument('--exportstep', help="[Export mode] Seconds between exported samples.  Default is " + str(DEFAULT_EXPORT_STEP) + " seconds.", default=DEFAULT_EXPORT_STEP, required=False)
+    argparser.add_argument('--catalog', help="[Batch mode] CSV file of name,ra,dec sources (ra/dec in the same formats as --ra/--dec).  All sources are transformed at once and a table of which are above the horizon and inside the rotor limits is printed.", default="", required=False)
+    argparser.add_argument('--obstimes', help="[Batch mode] Comma-separated UTC times to evaluate the catalog at (format: year/month/day hh:mm:ss).  Default is --utcdate or the current time.", default="", required=False)
+    argparser.add_argument('--minelevation', help="[Batch mode] Elevation in degrees a source must be above to count as up.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--visibleonly', help="[Batch mode] Only list sources that are up and inside the rotor limits.", default=False, action='store_true', required=False)
 
     # Parse Args
     args = argparser.parse_args()
-    delay= int(args.delay)
+    delay= float(args.delay)
     azcorrect = float(args.azcorrect)
     
-    # Ground point of reference / where are we?
-    earthLat = float(args.lat)*u.deg
-    earthLong = float(args.long)*u.deg
-    altitude=float(args.altitude)*u.m  # Make sure it has units of meter
+    if len(args.catalog) == 0 and (len(args.ra) == 0 or len(args.dec) == 0):
+        print("ERROR: --ra and --dec are required (or provide a --catalog).")
+        exit(1)
+
+    if args.site:
+        from sites import Site, siteLabel
+
+        if len(args.rotor) > 0:
+            print("ERROR: --site computes positions only and can't be combined with --rotor.")
+            exit(1)
+
+        if len(args.catalog) > 0 and len(args.export) == 0:
+            print("ERROR: --catalog with --site is only supported with --export.")
+            exit(1)
+
+        try:
+            sites = [Site.fromSpec(curSpec, "site%d" % (index + 1)) for index, curSpec in enumerate(args.site)]
+        except ValueError as e:
+            print("ERROR: Bad --site: " + str(e))
+            exit(1)
+
+        siteNames = [curSite.name for curSite in sites]
+    elif len(args.lat) == 0 or len(args.long) == 0 or float(args.altitude) == -999.0:
+        print("ERROR: --lat, --long and --altitude are required (or provide --site).")
+        exit(1)
+    else:
+        siteNames = None
 
     # What do we want to look at:
     # ra = 9.81625*u.deg
@@ -104,31 +196,25 @@ if __name__ == '__main__':
     else:
         useRotor = False
     
-    if ((args.rotorleftlimit != -1 and args.rotorrightlimit == -1) or
-        (args.rotorleftlimit == -1 and args.rotorrightlimit != -1)):
-        print("ERROR: if one limit is provided, both left/right must be set.")
-        exit(2)
-        
-    if args.rotorleftlimit > 360.0 or (args.rotorleftlimit < 0.0 and args.rotorleftlimit != -1):
-        print("ERROR: bad limit value.")
-        exit(2)
-        
-    if args.rotorrightlimit > 360.0 or (args.rotorrightlimit < 0.0 and args.rotorrightlimit != -1):
-        print("ERROR: bad limit value.")
-        exit(2)
-        
-    if args.rotorleftlimit != -1 and args.rotorrightlimit != -1:
-        usingRotorLimits = True
-        
-        # Depending on where your target is, left/right could span 0 degrees.  In that scenario,
-        # the left limit will be greater than the right limit (e.g. 330 degrees left, 30 degrees right)
-        if args.rotorleftlimit <= args.rotorRightLimit:
-            rotorLimitsReversed = False
+    # Depending on where your target is, left/right could span 0 degrees.  In that scenario,
+    # the left limit will be greater than the right limit (e.g. 330 degrees left, 30 degrees right)
+    try:
+        if len(args.horizonmask) > 0:
+            horizonMask = loadHorizonMask(args.horizonmask)
         else:
-            rotorLimitsReversed = True
-    else:
-        usingRotorLimits = False
-        rotorLimitsReversed = False
+            horizonMask = None
+
+        rotorLimits = RotorLimits(args.rotorleftlimit, args.rotorrightlimit, args.rotorelevationlimit, horizonMask)
+
+        rotorDeadband = float(args.rotordeadband)
+        if rotorDeadband < 0.0:
+            raise ValueError("--rotordeadband cannot be negative.")
+
+        azSlewRate, elSlewRate = parseSlewRate(args.rotorslewrate)
+        rotorPlanner = MotionPlanner(rotorDeadband, azSlewRate, elSlewRate, rotorLimits, parseAzRange(args.rotorazrange))
+    except (OSError, ValueError) as e:
+        print("ERROR: " + str(e))
+        exit(2)
 
     # Check if we have a UTC date
     if (len(args.utcdate) > 0):
@@ -143,90 +229,249 @@ if __name__ == '__main__':
     # and use EarthLocation.of_site('<name from list>')
 
     # Set up Earth observing Location
-    groundLoc = EarthLocation(lat=earthLat, lon=earthLong, height=altitude)
+    if siteNames is not None:
+        # One location array, so each transform covers every site
+        groundLoc = EarthLocation(lat=np.array([curSite.lat for curSite in sites])*u.deg, lon=np.array([curSite.long for curSite in sites])*u.deg,
+                                  height=np.array([curSite.altitude for curSite in sites])*u.m)
+    else:
+        # Ground point of reference / where are we?
+        earthLat = float(args.lat)*u.deg
+        earthLong = float(args.long)*u.deg
+        altitude=float(args.altitude)*u.m  # Make sure it has units of meter
+        groundLoc = EarthLocation(lat=earthLat, lon=earthLong, height=altitude)
+
+    if len(args.catalog) > 0:
+        try:
+            catalogNames, catalogTargets = loadCatalog(args.catalog)
+        except Exception as e:
+            print("ERROR: Unable to read catalog " + args.catalog + ": " + str(e))
+            exit(1)
+
+        if len(catalogNames) == 0:
+            print("ERROR: No sources found in " + args.catalog)
+            exit(1)
+
+    if len(args.export) > 0:
+        # Export mode: the whole range is transformed a chunk of times at a time and written out
+        from tracker import STATE_DTYPE
+        from trackexport import runExport
+
+        if len(args.catalog) > 0:
+            exportNames, exportTargets = catalogNames, catalogTargets
+        else:
+            exportNames, exportTargets = [args.ra + "," + args.dec], SkyCoord(ra, decl, frame='icrs')
+
+        chunkSize = DEFAULT_EXPORT_CHUNK
+        if siteNames is not None:
+            exportNames = [siteLabel(curName, curSite) for curName in exportNames for curSite in siteNames]
+            # Chunks hold about as many records as a single site export's
+            chunkSize = max(DEFAULT_EXPORT_CHUNK // len(siteNames), 100)
+
+        try:
+            exportStart = parseUtcDate(args.exportstart).unix if len(args.exportstart) > 0 else time.time()
+            exportEnd = parseUtcDate(args.exportend).unix if len(args.exportend) > 0 else exportStart + 86400.0
+        except ValueError as e:
+            print("ERROR: " + str(e))
+            exit(1)
+
+        def computeChunk(timestamps):
+            # Only az/el are known for RA/Dec targets, the rest of each record is NaN
+            azimuth, elevation = catalogAltAz(exportTargets, groundLoc, Time(timestamps, format='unix'))
+            # Sites are flattened into the targets
+            azimuth = azimuth.reshape(len(timestamps), -1)
+            elevation = elevation.reshape(len(timestamps), -1)
+            states = np.full(azimuth.shape, np.nan, dtype=STATE_DTYPE)
+            states['time'] = timestamps[:, np.newaxis]
+            states['azimuth'] = azimuth
+            states['elevation'] = elevation
+            return states
+
+        try:
+            runExport(args.export, args.exportformat, exportNames, exportStart, exportEnd, float(args.exportstep), computeChunk, chunkSize)
+        except (OSError, ValueError) as e:
+            print("ERROR: Export failed: " + str(e))
+            exit(2)
+
+        exit(0)
+
+    if len(args.catalog) > 0:
+        # Batch mode: every source at every time in one vectorized transform
+        if len(args.obstimes) > 0:
+            obsTimes = Time([parseUtcDate(curTime) for curTime in args.obstimes.split(',')])
+        elif len(datestr) > 0:
+            obsTimes = Time([parseUtcDate(datestr)])
+        else:
+            obsTimes = Time([Time.now()])
+
+        print("Calculating %d sources at %d times..." % (len(catalogNames), len(obsTimes)), file=sys.stderr)
+        azimuth, elevation = catalogAltAz(catalogTargets, groundLoc, obsTimes)
+        trueAz = (azimuth + azcorrect) % 360.0
+        reachable = rotorLimits.reachable(azimuth, elevation, azcorrect)
+
+        printCatalogTable(catalogNames, obsTimes, trueAz, elevation, reachable, float(args.minelevation), args.visibleonly)
+        exit(0)
 
     # Set up our target
     raDeclTarget = SkyCoord(ra, decl, frame='icrs')
 
+    if len(args.output) > 0:
+        from trackoutput import StateWriter
+        from tracker import TrackState
+
+        try:
+            output = StateWriter(args.output, args.outputformat, float(args.outputflush))
+        except (OSError, ValueError) as e:
+            print("ERROR: Unable to open --output " + args.output + ": " + str(e))
+            exit(2)
+
+        if args.output == '-':
+            # stdout only carries records from here on
+            sys.stdout = sys.stderr
+
+        outputTarget = args.ra + "," + args.dec
+    else:
+        output = None
+
     loop = True # First time through we want to execute
     
+    # Loop on fixed deadlines rather than sleeping after the work so the period doesn't drift
+    if delay > 0:
+        scheduler = DeadlineScheduler(delay)
+    else:
+        scheduler = None
+        
+    altAzTable = None
+    rotorWindows = None
+    tableWindow = float(args.tablewindow)
+    tableStep = float(args.tablestep)
+    # The table interpolates for one location.  Sites get the full transform every update.
+    useTable = tableStep > 0.0 and siteNames is None
+    
+    if useTable and tableWindow < tableStep:
+        print("ERROR: --tablewindow must be at least --tablestep.")
+        exit(1)
+    
     try:
         # If we specified a delay and we did not specify a fixed UTC time, loop.
         while (loop):
             # Calculate Az / El
             # For transforms, need to incorporate when
-            if (len(datestr) == 0):
-                observingTime = Time.now()
-            else:
-                # Can also get time from time string: Time.strptime('2019-06-25 15:00:00', '%Y-%m-%d %H:%M:%S')
-                # NOTE: time string is UTC
-                observingTime = Time.strptime(datestr)
+            if scheduler and len(datestr) == 0 and useTable:
+                # Tracking: the transform was done once over a time grid, just interpolate this tick
+                tickTime = scheduler.tickTime()
+                tickTimestamp = tickTime.timestamp()
                 
-            altAzCoord = None  # Release any previous memory if looping
-            altAzCoord = AltAz(location=groundLoc,  obstime=observingTime)
-            print("Calculating...", file=sys.stderr)
-            altAz=raDeclTarget.transform_to(altAzCoord)
+                if altAzTable is None or not altAzTable.covers(tickTimestamp):
+                    print("Precomputing Alt/Az table...", file=sys.stderr)
+                    buildStart = time.perf_counter()
+                    tableStart = Time(tickTime)
+                    altAzTable = AltAzTable(raDeclTarget, groundLoc, tableStart, tableWindow, tableStep)
+                    buildTime = time.perf_counter() - buildStart
+                    azError, elError = altAzTable.interpolationError(tableStart)
+                    print("[Info] %d positions in %.1f ms.  Max interpolation error: az %.3g deg, el %.3g deg" %
+                          (len(altAzTable), buildTime*1000.0, azError, elError), file=sys.stderr)
 
-            azimuth = altAz.az.degree
-            elevation = altAz.alt.degree
-            
-            trueAz = azimuth
-            
-            if (azcorrect != 0.0):
-                trueAz = trueAz + azcorrect
-                
-            if trueAz > 360.0:
-                trueAz = trueAz - 360.0
-            elif trueAz < 0.0:
-                trueAz = trueAz + 360.0
+                    if useRotor and rotorLimits.hasLimits():
+                        # Check the whole table against the limits once rather than finding out tick by tick
+                        rotorWindows = reachableWindows(altAzTable.startTimestamp + altAzTable.offsets,
+                                                        rotorLimits.reachable(altAzTable.azimuth, altAzTable.elevation, azcorrect))
+                        print("[Info] Rotor reachable (UTC): " + describeWindows(rotorWindows))
                 
-            print('UTC Time: ' + str(observingTime))
-            if (azcorrect == 0.0):
-                print('Azimuth: ' + '%.4f' % azimuth + ' degrees')
+                azimuth, elevation = altAzTable.lookup(tickTimestamp)
+                if output is None:
+                    observingTime = tickTime.strftime("%Y-%m-%d %H:%M:%S.%f")
             else:
-                print('Azimuth (Calculated): ' + '%.4f' % azimuth + ' degrees')
-                print('Azimuth (Corrected): ' + '%.4f' % trueAz + ' degrees')
+                if (len(datestr) == 0):
+                    if scheduler:
+                        observingTime = Time(scheduler.tickTime())
+                    else:
+                        observingTime = Time.now()
+                else:
+                    # Can also get time from time string: Time.strptime('2019-06-25 15:00:00', '%Y-%m-%d %H:%M:%S')
+                    # NOTE: time string is UTC
+                    observingTime = parseUtcDate(datestr)
+                    
+                altAzCoord = None  # Release any previous memory if looping
+                altAzCoord = AltAz(location=groundLoc,  obstime=observingTime)
+                if output is None:
+                    print("Calculating...", file=sys.stderr)
+                altAz=raDeclTarget.transform_to(altAzCoord)
+    
+                azimuth = altAz.az.degree
+                elevation = altAz.alt.degree
                 
-            print('Elevation: ' + '%.4f' % elevation + ' degrees')
+                tickTimestamp = observingTime.unix
             
+            if siteNames is not None:
+                # azimuth/elevation hold every site
+                trueAz = (azimuth + azcorrect) % 360.0
+
+                if output is None:
+                    print('UTC Time: ' + str(observingTime))
+                    print("%-16s %12s %12s" % ("Site", "Azimuth", "Elevation"))
+
+                for siteIndex, siteName in enumerate(siteNames):
+                    if output is not None:
+                        output.write(siteLabel(outputTarget, siteName), TrackState(tickTimestamp, float(azimuth[siteIndex]), float(elevation[siteIndex]), None, None))
+                    else:
+                        print("%-16s %12.4f %12.4f" % (siteName, trueAz[siteIndex], elevation[siteIndex]))
+            else:
+                trueAz = azimuth
+
+                if (azcorrect != 0.0):
+                    trueAz = trueAz + azcorrect
+
+                if trueAz > 360.0:
+                    trueAz = trueAz - 360.0
+                elif trueAz < 0.0:
+                    trueAz = trueAz + 360.0
+
+                if output is not None:
+                    output.write(outputTarget, TrackState(tickTimestamp, float(azimuth), float(elevation), None, None))
+                else:
+                    print('UTC Time: ' + str(observingTime))
+                    if (azcorrect == 0.0):
+                        print('Azimuth: ' + '%.4f' % azimuth + ' degrees')
+                    else:
+                        print('Azimuth (Calculated): ' + '%.4f' % azimuth + ' degrees')
+                        print('Azimuth (Corrected): ' + '%.4f' % trueAz + ' degrees')
+
+                    print('Elevation: ' + '%.4f' % elevation + ' degrees')
+
             if len(args.rotor) > 0:
                 # check our limits if we have any
-                executeMove = True
-                
-                if usingRotorLimits:
-                    if rotorLimitsReversed:
-                        # if we're less than the left limit but not within the right limit, don't move
-                        if trueAz < float(args.rotorleftlimit) and trueAz > float(args.rotorrightlimit):
-                            executeMove = False
-                    else:
-                        # if we're not between our set limits, don't move
-                        if trueAz < float(args.rotorleftlimit) or trueAz > float(args.rotorrightlimit):
-                            executeMove = False
-                        
-                    if args.rotorelevationlimit != -1:
-                        if elevation > float(args.rotorelevationlimit):
-                            executeMove = False
-                            
-                    if executeMove:
-                        retVal = RCmoveToPosition(args.rotor,  trueAz,  elevation)
+                if rotorLimits.reachable(azimuth, elevation, azcorrect):
+                    # Drops moves inside the deadband and picks the lead/wrap to command
+                    rotorCommand = rotorPlanner.plan(time.monotonic(), trueAz, elevation)
+                    if rotorCommand is not None:
+                        retVal = RCmoveToPosition(args.rotor,  rotorCommand[0],  rotorCommand[1], rotorPlanner.azRange)
+                        if retVal == rotorcontrol.ROTOR_OK:
+                            rotorPlanner.commit(time.monotonic())
+                elif rotorWindows is not None:
+                    nextStart = nextReachable(rotorWindows, tickTimestamp)
+                    if nextStart is not None:
+                        print('[Info] Rotor would violate user-configured limits.  No move sent.  Reachable again in %.0f seconds.' % (nextStart - tickTimestamp))
                     else:
-                        print('[Info] Rotor would violate user-configured limits.  No move sent.')
+                        print('[Info] Rotor would violate user-configured limits.  No move sent.  Not reachable within the precomputed table.')
                 else:
-                    if args.rotorelevationlimit != -1:
-                        if elevation > float(args.rotorelevationlimit):
-                            executeMove = False
-                            
-                    if executeMove:
-                        retVal = RCmoveToPosition(args.rotor, trueAz,  elevation)
-                    else:
-                        print('[Info] Rotor would violate user-configured limits.  No move sent.')
+                    print('[Info] Rotor would violate user-configured limits.  No move sent.')
 
             # Determine if we should loop and if so, delay
             if (delay > 0 and len(datestr)==0):
                 loop = True
-                time.sleep(delay)
+                scheduler.wait()
             else:
                 loop = False
             
     except KeyboardInterrupt:
         pass
+
+    if scheduler and len(datestr) == 0:
+        print(scheduler.summary(), file=sys.stderr)
+        if useRotor:
+            print(rotorPlanner.summary(), file=sys.stderr)
+
+    if output is not None:
+        if scheduler and len(datestr) == 0:
+            print(output.summary(), file=sys.stderr)
+        output.close()
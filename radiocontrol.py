@@ -0,0 +1,325 @@
+###################################################################
+#
+# Module: radiocontrol.py
+# Author: ghostop14
+#
+# Radio frequency control for skytrack.py.  Supports gqrx/gpredict-compatible
+# receivers ('F <freq>' answered with 'RPRT 0') and SDRSharp with the
+# NetRemote plugin (JSON commands).
+#
+# Replies are read into a buffer and split into whole replies (lines for
+# gqrx, JSON objects for SDRSharp), so replies that arrive split across reads
+# or several to a read are parsed correctly.  Both protocols answer in order,
+# so replies are matched to commands first-in first-out, which lets several
+# frequency commands be in flight at once instead of waiting a full round
+# trip for each.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import collections
+import errno
+import json
+import select
+import socket
+import time
+
+from trackdefaults import DEFAULT_RADIO_PIPELINE
+
+# -------------------  Global Vars -------------------------------------
+RADIOTYPE_GQRX = 1
+RADIOTYPE_SDRSHARP = 2
+
+DEFAULT_RADIO_PORT = 7356
+
+# Seconds to connect or wait for a reply.  A reply that doesn't arrive in this time is taken as lost
+# and the connection is reset, since a late reply would be matched to the wrong command.
+RADIO_TIMEOUT = 0.5
+RECV_SIZE = 4096
+
+# Seconds between reconnect attempts once the radio has gone away
+RECONNECT_INTERVAL = 1.0
+
+# Anything larger than this without a complete reply is not a reply
+MAX_REPLY_SIZE = 65536
+
+# -------------------  Global Functions ----------------------------------------
+def nextReply(buffer, radioType):
+    # Splits the first complete reply off buffer (bytes).  Returns (reply str, remaining bytes) or
+    # (None, buffer) if no complete reply has arrived yet.  gqrx replies are lines.  SDRSharp replies
+    # are JSON objects with no delimiter; anything else it sends is taken a line at a time.
+    if radioType == RADIOTYPE_SDRSHARP:
+        text = buffer.decode('utf8', errors='replace').lstrip()
+
+        if text.startswith('{'):
+            try:
+                reply, end = json.JSONDecoder().raw_decode(text)
+                return text[:end], text[end:].encode('utf8')
+            except ValueError:
+                if len(buffer) > MAX_REPLY_SIZE:
+                    # Not going to parse, take it as one (bad) reply
+                    return text, b''
+
+                return None, buffer
+
+        buffer = text.encode('utf8')
+
+    if b'\n' not in buffer:
+        if len(buffer) > MAX_REPLY_SIZE:
+            return buffer.decode('utf8', errors='replace'), b''
+
+        return None, buffer
+
+    line, buffer = buffer.split(b'\n', 1)
+    return line.decode('utf8', errors='replace').strip(), buffer
+
+def replyOk(reply, radioType):
+    if radioType == RADIOTYPE_SDRSHARP:
+        try:
+            return json.loads(reply).get('Result') == 'OK'
+        except (ValueError, AttributeError):
+            return False
+
+    return reply.startswith('RPRT 0')
+
+# -------------------  Classes ----------------------------------------
+class RadioConnection(object):
+    """
+    DESCRIPTION:
+        One frequency-control connection to a gqrx-compatible or SDRSharp receiver.
+        The connection is made at construction; a broken pipe (errno 32), a bad file
+        descriptor (errno 9) or the radio closing the connection triggers a reconnect.
+        Up to pipelineDepth frequency commands are sent before waiting for the oldest
+        reply; with a depth of 1 every command waits for its own reply.  The round trip
+        of the last acknowledged command and reconnect/error counts are kept for metrics.
+    INPUTS:
+        radio (str)              = host:port of the receiver's control port
+        radioType (int)          = RADIOTYPE_GQRX or RADIOTYPE_SDRSHARP
+        pipelineDepth (int)      = frequency commands in flight before waiting for a reply
+    """
+    def __init__(self, radio, radioType=RADIOTYPE_GQRX, pipelineDepth=DEFAULT_RADIO_PIPELINE):
+        self.radio = radio
+        self.radioType = radioType
+        self.pipelineDepth = max(int(pipelineDepth), 1)
+
+        hostparams=radio.split(":")
+        self.host=hostparams[0]
+        self.port=DEFAULT_RADIO_PORT
+        if len(hostparams) > 1:
+            self.port=int(hostparams[1])
+
+        if radioType == RADIOTYPE_SDRSHARP:
+            self.radioCommand='{"Command": "Set", "Method": "Frequency","Value": <frequency>}'
+        else:
+            self.radioCommand = "F <frequency>\n"
+
+        # Commands sent and not yet answered, oldest first: (message, send time, is frequency command)
+        self.pending = collections.deque()
+        self.recvBuffer = b''
+        self.lastConnectAttempt = 0.0
+
+        self.lastLatency = None  # seconds
+        self.acknowledged = 0
+        self.reconnects = 0
+        self.errors = 0
+        # Optional trackmetrics.TrackMetrics that round trips are recorded in
+        self.metrics = None
+
+        self.netPortFreq = None
+        self.connect()
+
+    def connect(self):
+        # Now let's see if we can connect:
+        if not self.netPortFreq:
+            self.lastConnectAttempt = time.monotonic()
+
+            try:
+                self.netPortFreq = socket.create_connection((self.host, self.port), timeout=RADIO_TIMEOUT)
+                self.netPortFreq.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except Exception as e:
+                self.netPortFreq = None
+                print("ERROR: Unable to connect to radio at " + self.radio + ". Error: " + str(e))
+
+            self.recvBuffer = b''
+            self.pending.clear()
+
+        return self.netPortFreq is not None
+
+    def reconnect(self):
+        self.close()
+
+        print("Attempting to reconnect to radio...")
+        if self.connect():
+            self.reconnects += 1
+            print("Reconnected.")
+
+    def close(self):
+        if self.netPortFreq:
+            try:
+                self.netPortFreq.close()
+            except:
+                pass
+
+        self.netPortFreq = None
+        self.recvBuffer = b''
+        self.pending.clear()
+
+    def receive(self, wait):
+        # Reads what has arrived into the buffer.  If wait, blocks up to RADIO_TIMEOUT for data.
+        if not wait:
+            readable, writable, failed = select.select([self.netPortFreq], [], [], 0)
+            if len(readable) == 0:
+                return
+
+        data = self.netPortFreq.recv(RECV_SIZE)
+        if not data:
+            # Same handling as a broken pipe on the next send
+            raise BrokenPipeError(errno.EPIPE, "Radio closed the connection")
+
+        self.recvBuffer += data
+
+    def matchReplies(self):
+        # Hands every complete reply in the buffer to the oldest pending command.  Returns False if
+        # any frequency command was rejected.
+        allOk = True
+
+        while True:
+            reply, self.recvBuffer = nextReply(self.recvBuffer, self.radioType)
+            if reply is None:
+                break
+            if len(reply) == 0:
+                continue
+
+            if len(self.pending) == 0:
+                # Unsolicited (e.g. left over from a command that was given up on)
+                continue
+
+            message, sendTime, isFrequency = self.pending.popleft()
+            if not isFrequency:
+                continue
+
+            if replyOk(reply, self.radioType):
+                self.lastLatency = time.monotonic() - sendTime
+                self.acknowledged += 1
+                if self.metrics is not None:
+                    self.metrics.observeRtt(self.radio, self.lastLatency)
+            else:
+                allOk = False
+                self.errors += 1
+                if 'Not tunable' in reply:
+                    print("ERROR: Does not look like the receiver is started.  Start SDRSharp receiving then tuning should work.")
+                else:
+                    print("ERROR setting frequency.  Radio returned error message:" + reply)
+
+        return allOk
+
+    def waitForReplies(self, maxPending):
+        # Reads replies until no more than maxPending commands are outstanding.  Returns
+        # (all frequency commands acknowledged, timed out).
+        allOk = self.matchReplies()
+
+        while len(self.pending) > maxPending:
+            try:
+                self.receive(True)
+            except socket.timeout:
+                return allOk, True
+
+            allOk = self.matchReplies() and allOk
+
+        return allOk, False
+
+    def replyTimedOut(self):
+        # The oldest command went unanswered for RADIO_TIMEOUT.  Counts it once and starts a fresh
+        # connection so later commands don't wait behind (or get matched to) the lost reply.
+        self.errors += 1
+        print("ERROR: No reply from radio at " + self.radio + " within %.1f seconds." % RADIO_TIMEOUT)
+        self.reconnect()
+
+    def send(self, message, isFrequency):
+        # Sends message once there is room in the pipeline.  Returns (sent, all replies so far acknowledged).
+        # Connection errors are handled by the caller.
+        allOk, timedOut = self.waitForReplies(self.pipelineDepth - 1)
+        if timedOut:
+            allOk = False
+            self.replyTimedOut()
+            if not self.netPortFreq:
+                return False, allOk
+
+        self.pending.append((message, time.monotonic(), isFrequency))
+        self.netPortFreq.sendall(message.encode())
+
+        return True, allOk
+
+    def handleError(self, e, action):
+        self.errors += 1
+        errorNum = getattr(e, 'errno', None)
+        print("ERROR " + action + ": " + str(e) + " (" + str(errorNum) + ")")
+
+        if errorNum == errno.EPIPE or errorNum == errno.EBADF:
+            self.reconnect()
+        else:
+            print("ERROR: Unable to talk to radio at " + self.radio + ". Error: " + str(e))
+
+    def ensureConnected(self):
+        if self.netPortFreq:
+            return True
+
+        # Keep trying, but don't stall every tick on a radio that's gone
+        if time.monotonic() - self.lastConnectAttempt < RECONNECT_INTERVAL:
+            return False
+
+        if self.connect():
+            self.reconnects += 1
+            print("Reconnected to radio.")
+            return True
+
+        return False
+
+    def sendAosLos(self, message):
+        # message is "AOS\n" or "LOS\n"
+        if not self.ensureConnected():
+            return
+
+        try:
+            sent, allOk = self.send(message, False)
+            if sent and self.pipelineDepth == 1:
+                self.waitForReplies(0)
+        except Exception as e:
+            self.handleError(e, "sending " + message.strip() + " to radio")
+
+    def setFrequency(self, frequency):
+        # Returns True if the radio acknowledged the new frequency.  With a pipeline depth above 1 the
+        # reply is matched on a later call, so True means sent with no error replies received since the last call.
+        message = self.radioCommand.replace("<frequency>", str(int(frequency)))
+        if not self.ensureConnected():
+            return False
+
+        try:
+            sent, allOk = self.send(message, True)
+            if not sent:
+                return False
+
+            if self.pipelineDepth == 1:
+                allOk, timedOut = self.waitForReplies(0)
+                if timedOut:
+                    self.replyTimedOut()
+                    return False
+
+            return allOk
+        except Exception as e:
+            self.handleError(e, "sending data to radio")
+
+        return False
+
+    def flush(self, timeout=RADIO_TIMEOUT):
+        # Waits up to timeout seconds for the replies to commands still in flight (e.g. before exiting)
+        if not self.netPortFreq:
+            return
+
+        endTime = time.monotonic() + timeout
+        try:
+            while len(self.pending) > 0 and time.monotonic() < endTime:
+                self.netPortFreq.settimeout(max(endTime - time.monotonic(), 0.001))
+                self.receive(True)
+                self.matchReplies()
+        except Exception:
+            pass
@@ -0,0 +1,134 @@
+###################################################################
+#
+# Module: risesetcache.py
+# Author: ghostop14
+#
+# Target rise/set times only change once per local day, but finding them
+# with almanac.find_discrete is the most expensive part of a skytrack tick.
+# This module caches the result keyed by (body, observer, local date) so the
+# search runs once per day, optionally persisting results to disk so that
+# restarts do not pay for it either.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import json
+import os
+from datetime import timedelta
+import pytz
+
+from skyfield import almanac
+from skyfield.nutationlib import iau2000b
+
+# -------------------  Global Functions ----------------------------------------
+def targetUpAt(observer,target,horizon=-0.8333):
+    # horizon is the elevation in degrees that counts as risen (default allows for refraction)
+    topos_at = observer.at
+    def is_target_up_at(t):
+        """Return `True` if the target has risen by time `t`."""
+        t._nutation_angles = iau2000b(t.tt)
+        return topos_at(t).observe(target).apparent().altaz()[0].degrees > horizon
+    is_target_up_at.rough_period = 0.5  # twice a day
+    return is_target_up_at
+
+def localDayBounds(ts, timeCheck):
+    # Given a timezone-aware local datetime, return skyfield Times for hour zero and
+    # end of that local day.
+    startTime = timeCheck - timedelta(hours=timeCheck.hour) - timedelta(minutes=timeCheck.minute) - timedelta(seconds=timeCheck.second) - timedelta(microseconds=timeCheck.microsecond)
+    endTime = startTime + timedelta(hours=23) +  timedelta(minutes=59) + timedelta(seconds=59)
+    # convert to UTC
+    utcStart=startTime.astimezone(pytz.utc)
+    utcEnd=endTime.astimezone(pytz.utc)
+    t0 = ts.utc(utcStart.year, utcStart.month, utcStart.day, utcStart.hour,  utcStart.minute,  utcStart.second)
+    t1 = ts.utc(utcEnd.year, utcEnd.month, utcEnd.day, utcEnd.hour,  utcEnd.minute,  utcEnd.second)
+
+    return t0, t1
+
+def computeRiseSet(ts, observer, target, timeCheck):
+    # Returns (targetrise, targetset) skyfield Times (or None) for the local day containing timeCheck
+    t0, t1 = localDayBounds(ts, timeCheck)
+    t, y = almanac.find_discrete(t0, t1, targetUpAt(observer,target))
+
+    targetrise = None
+    targetset = None
+
+    if len(y) > 0:
+        if y[0] == True:
+            targetrise = t[0]
+            if len(t) > 1:
+                targetset = t[1]
+            else:
+                targetset = None
+        else:
+            if len(t) > 1:
+                targetrise = t[1]
+            else:
+                targetrise = None
+
+            targetset = t[0]
+
+    return targetrise, targetset
+
+# -------------------  Classes ----------------------------------------
+class RiseSetCache(object):
+    """
+    DESCRIPTION:
+        Caches computeRiseSet() results keyed by (body, observer lat/long, local date).
+        Entries for other local dates are dropped when a new day is computed, so the cache
+        is naturally invalidated at local midnight.  Changing the observer changes the key.
+    INPUTS:
+        ts (Timescale)           = skyfield timescale used to rebuild cached Times
+        cacheFile (str)          = optional JSON file to persist results across runs
+    """
+    def __init__(self, ts, cacheFile=None):
+        self.ts = ts
+        self.cacheFile = cacheFile
+        self.entries = {}
+
+        if cacheFile and os.path.isfile(cacheFile):
+            try:
+                with open(cacheFile, 'r') as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                print("WARNING: Unable to read rise/set cache " + cacheFile + ": " + str(e))
+                self.entries = {}
+
+    @staticmethod
+    def makeKey(bodyName, lat, long, localDate):
+        return "%s|%.6f|%.6f|%s" % (bodyName, float(lat), float(long), localDate.isoformat())
+
+    def get(self, bodyName, lat, long, observer, target, timeCheck):
+        # timeCheck is a timezone-aware local datetime.  Returns (targetrise, targetset).
+        localDate = timeCheck.date()
+        key = self.makeKey(bodyName, lat, long, localDate)
+
+        if key in self.entries:
+            riseTT, setTT = self.entries[key]
+        else:
+            targetrise, targetset = computeRiseSet(self.ts, observer, target, timeCheck)
+            riseTT = float(targetrise.tt) if targetrise is not None else None
+            setTT = float(targetset.tt) if targetset is not None else None
+
+            # Anything from a previous day is stale now
+            dateSuffix = "|" + localDate.isoformat()
+            for oldKey in [k for k in self.entries if not k.endswith(dateSuffix)]:
+                del self.entries[oldKey]
+
+            self.entries[key] = [riseTT, setTT]
+            self.save()
+
+        targetrise = self.ts.tt_jd(riseTT) if riseTT is not None else None
+        targetset = self.ts.tt_jd(setTT) if setTT is not None else None
+
+        return targetrise, targetset
+
+    def save(self):
+        if not self.cacheFile:
+            return
+
+        try:
+            tmpFile = self.cacheFile + ".tmp"
+            with open(tmpFile, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmpFile, self.cacheFile)
+        except Exception as e:
+            print("WARNING: Unable to write rise/set cache " + self.cacheFile + ": " + str(e))
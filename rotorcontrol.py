@@ -0,0 +1,265 @@
+###################################################################
+#
+# Module: rotorcontrol.py
+# Author: ghostop14
+#
+# Long-lived rotor backends shared by skytrack.py and radecl.py.
+#
+# Network rotors (rotctld / gpredict-compatible) keep one reusable socket
+# that reconnects on failure, and every move waits for the RPRT reply so the
+# move is acknowledged and its round trip measured.  Serial rotors no longer
+# fork rotctl per move: a rotctld child process is started once against the
+# serial device and driven over the same network path.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import socket
+import subprocess
+import time
+import atexit
+
+# -------------------  Global Vars -------------------------------------
+DEFAULT_ROTOR_TIMEOUT = 2.0  # seconds to wait for an RPRT reply
+ROTCTLD_BASE_PORT = 4590  # local ports used for managed rotctld children
+
+# Return codes.  Non-zero hamlib RPRT codes are passed through as-is (and printed).
+ROTOR_OK = 0
+ROTOR_BAD_POSITION = -1
+ROTOR_NOT_CONNECTED = -2
+ROTOR_TIMEOUT = -3
+ROTOR_BAD_REPLY = -4
+
+# port string -> backend
+rotorBackends = {}
+
+# -------------------  Classes ----------------------------------------
+class NetworkRotor(object):
+    """
+    DESCRIPTION:
+        Persistent connection to a rotctld-compatible rotor.  The socket is opened on first
+        use and reopened after any error.  moveTo() waits for the 'RPRT <n>' acknowledgement
+        and records its round trip time.
+    """
+    def __init__(self, host, port, timeout=DEFAULT_ROTOR_TIMEOUT):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.sock = None
+        self.recvBuffer = b''
+        self.everConnected = False
+        self.reconnects = 0
+        self.lastLatency = None  # seconds
+        self.totalLatency = 0.0
+        self.acknowledgedMoves = 0
+
+    def connect(self):
+        if self.sock:
+            return True
+
+        try:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.recvBuffer = b''
+            return True
+        except Exception as e:
+            print("Rotor Error connecting to " + self.host + ":" + str(self.port) + ". Error: " + str(e))
+            self.sock = None
+            return False
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except:
+                pass
+
+        self.sock = None
+        self.recvBuffer = b''
+
+    def readLine(self):
+        # Returns the next newline-terminated reply line (without the newline)
+        while b'\n' not in self.recvBuffer:
+            data = self.sock.recv(1024)
+            if not data:
+                raise ConnectionResetError("Rotor closed the connection")
+            self.recvBuffer += data
+
+        line, self.recvBuffer = self.recvBuffer.split(b'\n', 1)
+        return line.decode('ascii', errors='replace').strip()
+
+    def moveTo(self, azimuth, elevation):
+        # Sends 'P az el' and waits for the RPRT acknowledgement.  Returns the RPRT code
+        # (0 is success) or one of the ROTOR_ error codes.
+        if not self.sock:
+            if not self.connect():
+                return ROTOR_NOT_CONNECTED
+
+            if self.everConnected:
+                self.reconnects += 1
+
+            self.everConnected = True
+
+        cmdString = "P " + str(azimuth) + " " + str(elevation) + "\n"
+
+        try:
+            startTime = time.monotonic()
+            self.sock.sendall(cmdString.encode('utf-8'))
+
+            # Some implementations echo other lines first, so read until we see the report
+            while True:
+                reply = self.readLine()
+                if reply.startswith('RPRT'):
+                    break
+
+            self.lastLatency = time.monotonic() - startTime
+            self.totalLatency += self.lastLatency
+            self.acknowledgedMoves += 1
+
+            try:
+                rotorResult = int(reply.split()[1])
+            except:
+                print("ROTOR ERROR: unexpected reply: " + reply)
+                return ROTOR_BAD_REPLY
+
+            if rotorResult != 0:
+                print("ROTOR ERROR: rotor returned " + reply)
+
+            return rotorResult
+        except socket.timeout:
+            print("ROTOR ERROR: no reply from " + self.host + ":" + str(self.port))
+            self.close()
+            return ROTOR_TIMEOUT
+        except Exception as e:
+            print("ROTOR ERROR: " + str(e) + ".  Will reconnect on next move.")
+            self.close()
+            return ROTOR_NOT_CONNECTED
+
+    def averageLatency(self):
+        if self.acknowledgedMoves == 0:
+            return None
+
+        return self.totalLatency / self.acknowledgedMoves
+
+class RotctldRotor(NetworkRotor):
+    """
+    DESCRIPTION:
+        Serial rotor driven through a managed rotctld child process.  The child opens the
+        serial device and initializes the rotor once, then moves go over a local socket.
+        If the child exits it is restarted on the next move.
+    """
+    def __init__(self, device, controllerType, baud, localPort, timeout=DEFAULT_ROTOR_TIMEOUT):
+        NetworkRotor.__init__(self, '127.0.0.1', localPort, timeout)
+        self.device = device
+        self.controllerType = controllerType
+        self.baud = baud
+        self.process = None
+
+    def startDaemon(self):
+        if self.process and self.process.poll() is None:
+            return True
+
+        cmd = [ 'rotctld' , '-m' , str(self.controllerType) , '-r' , str(self.device), '-s', str(self.baud),
+                '-T', self.host, '-t', str(self.port) ]
+
+        try:
+            self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except Exception as e:
+            print("ROTOR ERROR: Unable to start rotctld: " + str(e))
+            self.process = None
+            return False
+
+        # Give rotctld a moment to open the device and start listening
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                # Note: unable to connect to port is returncode 2
+                print("ROTOR ERROR: rotctld exited with code " + str(self.process.returncode) + " (check the device, type and baud)")
+                self.process = None
+                return False
+
+            try:
+                probe = socket.create_connection((self.host, self.port), timeout=0.2)
+                probe.close()
+                return True
+            except Exception:
+                time.sleep(0.05)
+
+        print("ROTOR ERROR: timed out waiting for rotctld to listen on port " + str(self.port))
+        return False
+
+    def connect(self):
+        if self.sock:
+            return True
+
+        if not self.startDaemon():
+            return False
+
+        return NetworkRotor.connect(self)
+
+    def shutdown(self):
+        self.close()
+
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+        self.process = None
+
+# -------------------  Global Functions ----------------------------------------
+def getRotor(port, controllerType=2, baud=9600):
+    # Returns the shared backend for a rotor port spec, creating it on first use.
+    # port can be <ip>:<port> or a serial device like /dev/ttyUSB0
+    if port in rotorBackends:
+        return rotorBackends[port]
+
+    if ':' in port:
+        params = port.split(":")
+        backend = NetworkRotor(params[0], int(params[1]))
+    else:
+        # First local port not already used (closeRotor() can free one in the middle)
+        usedPorts = set(b.port for b in rotorBackends.values() if isinstance(b, RotctldRotor))
+        localPort = ROTCTLD_BASE_PORT
+        while localPort in usedPorts:
+            localPort += 1
+        backend = RotctldRotor(port, controllerType, baud, localPort)
+
+    rotorBackends[port] = backend
+    return backend
+
+def closeRotor(port):
+    # Shuts down and forgets the backend for port (if any), so the next getRotor() starts a new one
+    backend = rotorBackends.pop(port, None)
+    if isinstance(backend, RotctldRotor):
+        backend.shutdown()
+    elif backend is not None:
+        backend.close()
+
+def RCmoveToPosition(port, controllerType, baud,  azimuth, elevation, azRange=(0.0, 360.0)):
+        # Port can be /dev/ttyUSB0 type of port, or:
+        # <ip>:<port>
+        # azRange is the (min, max) azimuth the rotor accepts, e.g. (-180, 180) or (0, 450) with overlap
+
+        if azimuth < azRange[0] or azimuth > azRange[1]:
+            return ROTOR_BAD_POSITION
+
+        if elevation < 0:
+            elevation = 0
+
+        if elevation > 360:
+            return ROTOR_BAD_POSITION
+
+        return getRotor(port, controllerType, baud).moveTo(azimuth, elevation)
+
+def closeRotors():
+    for backend in rotorBackends.values():
+        if isinstance(backend, RotctldRotor):
+            backend.shutdown()
+        else:
+            backend.close()
+
+    rotorBackends.clear()
+
+atexit.register(closeRotors)
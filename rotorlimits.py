@@ -0,0 +1,159 @@
+###################################################################
+#
+# Module: rotorlimits.py
+# Author: ghostop14
+#
+# Rotor limit and obstruction checks shared by skytrack.py and radecl.py.
+# Left/right azimuth limits, an elevation limit and an optional
+# azimuth-dependent horizon mask (from a CSV of azimuth -> minimum elevation)
+# are checked together on numpy arrays, so a whole pass can be checked in
+# one call to find when the target will be reachable.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import csv
+from datetime import datetime, timezone
+
+import numpy as np
+
+# -------------------  Global Vars -------------------------------------
+NO_LIMIT = -1.0
+
+# -------------------  Classes ----------------------------------------
+class HorizonMask(object):
+    """
+    DESCRIPTION:
+        Minimum usable elevation as a function of (geographic) azimuth, for trees, buildings
+        and other obstructions.  Linearly interpolated between points, wrapping through north.
+    INPUTS:
+        azimuths (list)          = azimuths in degrees
+        minElevations (list)     = minimum elevation in degrees at each azimuth
+    """
+    def __init__(self, azimuths, minElevations):
+        azimuths = np.asarray(azimuths, dtype=np.float64) % 360.0
+        minElevations = np.asarray(minElevations, dtype=np.float64)
+
+        if len(azimuths) == 0 or len(azimuths) != len(minElevations):
+            raise ValueError("Horizon mask needs at least one azimuth,elevation point.")
+
+        order = np.argsort(azimuths)
+        self.azimuths = azimuths[order]
+        self.minElevations = minElevations[order]
+
+    def minElevation(self, azimuth):
+        # Scalar or array of azimuths (degrees) -> minimum elevation (degrees)
+        return np.interp(np.asarray(azimuth, dtype=np.float64) % 360.0, self.azimuths, self.minElevations, period=360.0)
+
+class RotorLimits(object):
+    """
+    DESCRIPTION:
+        User-configured rotor limits.  -1 means no limit.  If the left limit is greater than
+        the right, the allowed arc spans 0 degrees (e.g. 330 degrees left, 30 degrees right).
+        Azimuth limits apply to the rotor azimuth (geographic azimuth plus azoffset), the horizon
+        mask to the geographic azimuth.  Raises ValueError for an invalid combination.
+    INPUTS:
+        left (float)             = rotor left azimuth limit in degrees
+        right (float)            = rotor right azimuth limit in degrees
+        elevation (float)        = maximum rotor elevation in degrees
+        horizonMask (HorizonMask)= optional obstruction profile
+    """
+    def __init__(self, left=NO_LIMIT, right=NO_LIMIT, elevation=NO_LIMIT, horizonMask=None):
+        self.left = float(left)
+        self.right = float(right)
+        self.elevation = float(elevation)
+        self.horizonMask = horizonMask
+
+        if (self.left != NO_LIMIT) != (self.right != NO_LIMIT):
+            raise ValueError("if one limit is provided, both left/right must be set.")
+
+        for curLimit in (self.left, self.right):
+            if curLimit > 360.0 or (curLimit < 0.0 and curLimit != NO_LIMIT):
+                raise ValueError("bad limit value.")
+
+    def hasLimits(self):
+        return self.left != NO_LIMIT or self.elevation != NO_LIMIT or self.horizonMask is not None
+
+    def azimuthAllowed(self, rotorAz):
+        # Rotor azimuth (degrees, any wrap, scalar or array) -> boolean array for the left/right limits only
+        rotorAz = np.asarray(rotorAz, dtype=np.float64) % 360.0
+
+        if self.left == NO_LIMIT:
+            return np.ones(rotorAz.shape, dtype=bool)
+        elif self.left > self.right:
+            return ~((rotorAz < self.left) & (rotorAz > self.right))
+        else:
+            return ~((rotorAz < self.left) | (rotorAz > self.right))
+
+    def reachable(self, azimuth, elevation, azoffset=0.0):
+        # Geographic azimuth/elevation (degrees, scalars or arrays) -> bool or boolean array
+        azimuth = np.asarray(azimuth, dtype=np.float64)
+        elevation = np.asarray(elevation, dtype=np.float64)
+        allowed = np.ones(np.broadcast(azimuth, elevation).shape, dtype=bool)
+
+        if self.left != NO_LIMIT:
+            allowed &= self.azimuthAllowed(azimuth + azoffset)
+
+        if self.elevation != NO_LIMIT:
+            allowed &= ~(elevation > self.elevation)
+
+        if self.horizonMask is not None:
+            allowed &= elevation >= self.horizonMask.minElevation(azimuth)
+
+        if allowed.ndim == 0:
+            return bool(allowed)
+
+        return allowed
+
+# -------------------  Global Functions ----------------------------------------
+def loadHorizonMask(filename):
+    # Reads a CSV of azimuth,min_elevation rows (degrees).  Blank lines, '#' comments and a header row are skipped.
+    azimuths = []
+    minElevations = []
+
+    with open(filename, 'r', newline='') as f:
+        for lineNum, row in enumerate(csv.reader(f), start=1):
+            if len(row) == 0 or row[0].strip().startswith('#'):
+                continue
+
+            if len(row) < 2:
+                raise ValueError("%s line %d: expected azimuth,min_elevation" % (filename, lineNum))
+
+            try:
+                azimuth = float(row[0])
+                minElevation = float(row[1])
+            except ValueError:
+                if len(azimuths) == 0:
+                    # Header
+                    continue
+                raise ValueError("%s line %d: expected azimuth,min_elevation" % (filename, lineNum))
+
+            azimuths.append(azimuth)
+            minElevations.append(minElevation)
+
+    return HorizonMask(azimuths, minElevations)
+
+def reachableWindows(timestamps, reachable):
+    # POSIX timestamps of a run of samples and the matching reachable() result -> list of
+    # (startTimestamp, endTimestamp) windows in which the target can be reached
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    edges = np.diff(np.concatenate(([0], np.asarray(reachable, dtype=np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+
+    return [(float(timestamps[start]), float(timestamps[end])) for start, end in zip(starts, ends)]
+
+def nextReachable(windows, timestamp):
+    # Start of the first window that begins after timestamp, or None
+    for windowStart, windowEnd in windows:
+        if windowStart > timestamp:
+            return windowStart
+
+    return None
+
+def describeWindows(windows):
+    # 'hh:mm:ss-hh:mm:ss, ...' (UTC) for a list of reachableWindows(), or 'none'
+    if len(windows) == 0:
+        return "none"
+
+    return ", ".join(datetime.fromtimestamp(windowStart, tz=timezone.utc).strftime("%H:%M:%S") + "-" +
+                     datetime.fromtimestamp(windowEnd, tz=timezone.utc).strftime("%H:%M:%S") for windowStart, windowEnd in windows)
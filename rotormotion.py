@@ -0,0 +1,221 @@
+###################################################################
+#
+# Module: rotormotion.py
+# Author: ghostop14
+#
+# Rotor motion planning for the tracking loops.  Sending 'P az el' every tick
+# when the target has moved a hundredth of a degree wastes bus traffic and
+# wears the rotor, and a slow rotor that is only ever sent the current position
+# always lags behind the target.  The planner drops moves smaller than a
+# deadband, leads the target by the time the rotor needs to get there, and
+# picks which equivalent azimuth to command (e.g. 10 or 370 on a rotor with
+# overlap) so the rotor takes the shortest path that stays inside the limits.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import numpy as np
+
+from rotorlimits import RotorLimits
+
+# -------------------  Global Vars -------------------------------------
+DEFAULT_AZ_RANGE = (0.0, 360.0)
+
+# Spacing used to check that a slew path stays inside the azimuth limits
+PATH_CHECK_STEP = 1.0  # degrees
+
+# Longest lead applied.  Past this the rotor is catching up from far away (start of a pass,
+# target change) and the rate estimate is not worth extrapolating that far.
+MAX_LEAD = 10.0  # seconds
+
+# -------------------  Global Functions ----------------------------------------
+def parseSlewRate(value):
+    # 'az' or 'az,el' in degrees/second -> (azRate, elRate).  0 means unknown (no lead).
+    rates = [float(curRate) for curRate in str(value).split(',')]
+    if len(rates) == 1:
+        rates.append(rates[0])
+
+    if len(rates) != 2 or rates[0] < 0.0 or rates[1] < 0.0:
+        raise ValueError("Slew rate must be 'az' or 'az,el' in degrees per second.")
+
+    return rates[0], rates[1]
+
+def parseAzRange(value):
+    # 'min,max' rotor azimuth range in degrees, e.g. '0,360', '-180,180' or '0,450' for a rotor with overlap
+    azRange = [float(curValue) for curValue in str(value).split(',')]
+
+    if len(azRange) != 2 or azRange[1] - azRange[0] < 360.0:
+        raise ValueError("Rotor azimuth range must be 'min,max' and span at least 360 degrees.")
+
+    return azRange[0], azRange[1]
+
+def angleDiff(a, b):
+    # Signed smallest difference a - b in degrees (-180 to 180]
+    return (a - b + 180.0) % 360.0 - 180.0
+
+# -------------------  Classes ----------------------------------------
+class MotionPlanner(object):
+    """
+    DESCRIPTION:
+        Decides what (if anything) to send a rotor each tick.  The rotor position is estimated
+        by moving it toward the last command at the slew rate.  A command is only sent when the
+        target has moved more than the deadband from the last command.  With a known slew rate,
+        the command leads the target by the estimated slew time, using the target's azimuth and
+        elevation rates from the previous update.  The commanded azimuth is whichever equivalent
+        value in azRange is the shortest legal path from the estimated position.  plan() only
+        proposes a move; call commit() once the rotor has accepted it so a rejected or failed
+        move does not move the position estimate or the deadband reference.
+    INPUTS:
+        deadband (float)         = degrees of target motion (az or el) before a new move is sent (0 = every tick)
+        azSlewRate (float)       = rotor azimuth speed in degrees/second (0 = unknown, no lead)
+        elSlewRate (float)       = rotor elevation speed in degrees/second (0 = unknown, no lead)
+        rotorLimits (RotorLimits)= limits the slew path must stay inside
+        azRange (tuple)          = (min, max) azimuth values the rotor accepts
+    """
+    def __init__(self, deadband=0.0, azSlewRate=0.0, elSlewRate=0.0, rotorLimits=None, azRange=DEFAULT_AZ_RANGE):
+        self.deadband = float(deadband)
+        self.azSlewRate = float(azSlewRate)
+        self.elSlewRate = float(elSlewRate)
+        self.rotorLimits = rotorLimits if rotorLimits is not None else RotorLimits()
+        self.azRange = (float(azRange[0]), float(azRange[1]))
+
+        # Last command sent (rotor azimuth in azRange coordinates) and the target position it was sent for
+        self.commandAz = None
+        self.commandEl = None
+        self.commandTargetAz = None
+        self.commandTargetEl = None
+        # Estimated rotor position and when it was estimated
+        self.positionAz = None
+        self.positionEl = None
+        self.positionTime = None
+        # Previous target sample for rate estimates
+        self.lastTargetAz = None
+        self.lastTargetEl = None
+        self.lastTargetTime = None
+
+        # Move returned by plan() that has not been committed yet: (az, el, targetAz, targetEl, lead)
+        self.pendingCommand = None
+
+        self.sent = 0
+        self.suppressed = 0
+        self.lastLead = 0.0
+
+    def estimatePosition(self, now):
+        # Moves the estimated rotor position toward the last command for the time since the last estimate
+        if self.positionTime is None:
+            return
+
+        elapsed = max(now - self.positionTime, 0.0)
+        self.positionTime = now
+
+        if self.azSlewRate > 0.0:
+            azStep = self.azSlewRate * elapsed
+            self.positionAz += max(min(self.commandAz - self.positionAz, azStep), -azStep)
+        else:
+            self.positionAz = self.commandAz
+
+        if self.elSlewRate > 0.0:
+            elStep = self.elSlewRate * elapsed
+            self.positionEl += max(min(self.commandEl - self.positionEl, elStep), -elStep)
+        else:
+            self.positionEl = self.commandEl
+
+    def slewTime(self, rotorAz, elevation):
+        # Seconds from the estimated position to rotorAz/elevation.  0 if the slew rate is unknown.
+        if self.positionAz is None or self.azSlewRate <= 0.0 or self.elSlewRate <= 0.0:
+            return 0.0
+
+        return max(abs(rotorAz - self.positionAz) / self.azSlewRate, abs(elevation - self.positionEl) / self.elSlewRate)
+
+    def commandAzimuth(self, rotorAz):
+        # Picks the representation of rotorAz (+/- 360) inside azRange that is the shortest legal slew
+        # from the estimated position.  Falls back to the shortest path if none stays inside the limits.
+        baseAz = rotorAz % 360.0
+        candidates = [baseAz + 360.0 * k for k in range(int(np.floor((self.azRange[0] - baseAz) / 360.0)),
+                                                        int(np.ceil((self.azRange[1] - baseAz) / 360.0)) + 1)]
+        candidates = [curAz for curAz in candidates if self.azRange[0] <= curAz <= self.azRange[1]]
+
+        if self.positionAz is None:
+            # Rotor position unknown: leave the most travel either way
+            rangeCenter = (self.azRange[0] + self.azRange[1]) / 2.0
+            return min(candidates, key=lambda curAz: abs(curAz - rangeCenter))
+
+        candidates.sort(key=lambda curAz: abs(curAz - self.positionAz))
+
+        for curAz in candidates:
+            numPoints = max(int(abs(curAz - self.positionAz) / PATH_CHECK_STEP), 1) + 1
+            if np.all(self.rotorLimits.azimuthAllowed(np.linspace(self.positionAz, curAz, numPoints))):
+                return curAz
+
+        return candidates[0]
+
+    def plan(self, now, rotorAz, elevation):
+        # Returns (az, el) to command now, or None if the move is inside the deadband.
+        # now is a monotonic time in seconds, rotorAz/elevation the target's rotor azimuth and elevation.
+        # Nothing about the command is recorded until commit() is called for it.
+        self.estimatePosition(now)
+        self.pendingCommand = None
+
+        azRate = 0.0
+        elRate = 0.0
+        if self.lastTargetTime is not None and now > self.lastTargetTime:
+            azRate = angleDiff(rotorAz, self.lastTargetAz) / (now - self.lastTargetTime)
+            elRate = (elevation - self.lastTargetEl) / (now - self.lastTargetTime)
+
+        self.lastTargetAz = rotorAz
+        self.lastTargetEl = elevation
+        self.lastTargetTime = now
+
+        if self.commandAz is not None:
+            moved = max(abs(angleDiff(rotorAz, self.commandTargetAz)), abs(elevation - self.commandTargetEl))
+            if moved < self.deadband:
+                self.suppressed += 1
+                return None
+
+        targetAz = rotorAz
+        targetEl = elevation
+
+        # Lead the target by the time it takes to get there (one refinement is plenty at tracking rates)
+        lead = self.slewTime(self.commandAzimuth(rotorAz), elevation)
+        if 0.0 < lead <= MAX_LEAD:
+            ledAz = rotorAz + azRate * lead
+            ledEl = elevation + elRate * lead
+            lead = min(self.slewTime(self.commandAzimuth(ledAz), ledEl), MAX_LEAD)
+            ledAz = rotorAz + azRate * lead
+            ledEl = elevation + elRate * lead
+
+            # Never lead the rotor out of its limits
+            if self.rotorLimits.azimuthAllowed(ledAz) and (self.rotorLimits.elevation == -1 or ledEl <= self.rotorLimits.elevation):
+                rotorAz = ledAz
+                elevation = ledEl
+            else:
+                lead = 0.0
+        else:
+            lead = 0.0
+
+        commandAz = self.commandAzimuth(rotorAz)
+        commandEl = min(max(elevation, 0.0), 90.0)
+        self.pendingCommand = (commandAz, commandEl, targetAz, targetEl, lead)
+
+        return commandAz, commandEl
+
+    def commit(self, now, pendingCommand=None):
+        # Records the move returned by the last plan() as sent.  Only call this when the rotor accepted it.
+        # pendingCommand is a saved pendingCommand, for moves acknowledged after later plan() calls.
+        if pendingCommand is None:
+            pendingCommand = self.pendingCommand
+        if pendingCommand is None:
+            return
+
+        self.commandAz, self.commandEl, self.commandTargetAz, self.commandTargetEl, self.lastLead = pendingCommand
+        if pendingCommand is self.pendingCommand:
+            self.pendingCommand = None
+
+        if self.positionAz is None:
+            self.positionAz = self.commandAz
+            self.positionEl = self.commandEl
+            self.positionTime = now
+
+        self.sent += 1
+
+    def summary(self):
+        return "Rotor moves: %d sent, %d suppressed by deadband, lead %.1f s" % (self.sent, self.suppressed, self.lastLead)
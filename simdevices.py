@@ -0,0 +1,336 @@
+#!/usr/bin/python3
+
+###################################################################
+#
+# Application: simdevices.py
+# Author: ghostop14
+#
+# Stand-in radio and rotor servers for testing skytrack.py and radecl.py
+# without hardware.  Speaks the gqrx remote control protocol ('F <freq>'
+# answered with 'RPRT 0'), the SDRSharp NetRemote JSON protocol and the
+# rotctld protocol ('P az el' answered with 'RPRT 0').  Every server can
+# add reply latency and jitter, answer with errors and drop connections at
+# configurable rates, and counts what it received.  loadharness.py runs
+# these in-process to load test the trackers.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+# -------------------  Global Vars -------------------------------------
+DEFAULT_GQRX_PORT = 7356
+DEFAULT_SDRSHARP_PORT = 4532
+DEFAULT_ROTCTLD_PORT = 4533
+
+DEFAULT_STATS_INTERVAL = 10.0  # seconds
+
+# -------------------  Classes ----------------------------------------
+class SimServer(object):
+    """
+    DESCRIPTION:
+        Base for a simulated TCP device.  Subclasses split the byte stream into commands
+        (nextCommand) and answer them (reply).  Each command waits latency +/- jitter seconds
+        before the reply, gets an error reply with probability errorRate, and has its connection
+        closed without a reply with probability dropRate.
+    INPUTS:
+        name (str)               = label used in stats output
+        port (int)               = TCP port to listen on
+        host (str)               = address to listen on
+        latency (float)          = seconds before each reply
+        jitter (float)           = +/- seconds of uniform random variation on the latency
+        errorRate (float)        = fraction of commands answered with an error (0-1)
+        dropRate (float)         = fraction of commands that close the connection instead (0-1)
+        seed (int)               = random seed, for repeatable error/drop patterns
+    """
+    def __init__(self, name, port, host='127.0.0.1', latency=0.0, jitter=0.0, errorRate=0.0, dropRate=0.0, seed=None):
+        self.name = name
+        self.host = host
+        self.port = int(port)
+        self.latency = float(latency)
+        self.jitter = float(jitter)
+        self.errorRate = float(errorRate)
+        self.dropRate = float(dropRate)
+        self.random = random.Random(seed)
+        self.server = None
+
+        self.connections = 0
+        self.activeConnections = 0
+        self.commands = 0
+        self.errors = 0
+        self.drops = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handleConnection, self.host, self.port)
+        return self.server
+
+    def close(self):
+        if self.server:
+            self.server.close()
+
+    def nextCommand(self, buffer):
+        # Returns (command, remaining buffer) or (None, buffer) if no complete command is buffered.
+        # Default framing is one command per line.
+        if b'\n' not in buffer:
+            return None, buffer
+
+        line, buffer = buffer.split(b'\n', 1)
+        return line.decode('utf-8', errors='replace').strip(), buffer
+
+    def reply(self, command, isError):
+        # Returns the bytes to answer command with (None for no reply)
+        raise NotImplementedError()
+
+    async def handleConnection(self, reader, writer):
+        self.connections += 1
+        self.activeConnections += 1
+        buffer = b''
+
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+
+                buffer += data
+                while True:
+                    command, buffer = self.nextCommand(buffer)
+                    if command is None:
+                        break
+                    if len(command) == 0:
+                        continue
+
+                    self.commands += 1
+
+                    delay = self.latency
+                    if self.jitter > 0.0:
+                        delay = max(delay + self.random.uniform(-self.jitter, self.jitter), 0.0)
+                    if delay > 0.0:
+                        await asyncio.sleep(delay)
+
+                    if self.dropRate > 0.0 and self.random.random() < self.dropRate:
+                        self.drops += 1
+                        return
+
+                    isError = self.errorRate > 0.0 and self.random.random() < self.errorRate
+                    if isError:
+                        self.errors += 1
+
+                    response = self.reply(command, isError)
+                    if response:
+                        writer.write(response)
+                        await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.activeConnections -= 1
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        return {'name': self.name, 'port': self.port, 'connections': self.connections, 'active': self.activeConnections,
+                'commands': self.commands, 'errors': self.errors, 'drops': self.drops}
+
+    def summary(self):
+        return ("%-10s :%-5d %8d commands, %6d errors sent, %6d drops, %4d connections (%d open)" %
+                (self.name, self.port, self.commands, self.errors, self.drops, self.connections, self.activeConnections))
+
+class SimGqrx(SimServer):
+    # gqrx remote control: 'F <hz>' -> 'RPRT 0', 'f' -> '<hz>', AOS/LOS -> 'RPRT 0'
+    def __init__(self, port=DEFAULT_GQRX_PORT, **kwargs):
+        SimServer.__init__(self, 'gqrx', port, **kwargs)
+        self.frequency = 0
+
+    def reply(self, command, isError):
+        if isError:
+            return b'RPRT 1\n'
+
+        if command.startswith('F '):
+            try:
+                self.frequency = int(float(command[2:]))
+            except ValueError:
+                return b'RPRT 1\n'
+        elif command == 'f':
+            return ("%d\n" % self.frequency).encode('utf-8')
+
+        return b'RPRT 0\n'
+
+class SimSdrSharp(SimServer):
+    # SDRSharp NetRemote: back to back JSON objects with no delimiter, answered with JSON
+    def __init__(self, port=DEFAULT_SDRSHARP_PORT, **kwargs):
+        SimServer.__init__(self, 'sdrsharp', port, **kwargs)
+        self.frequency = 0
+        self.decoder = json.JSONDecoder()
+
+    def nextCommand(self, buffer):
+        text = buffer.decode('utf-8', errors='replace').lstrip()
+        if len(text) == 0:
+            return None, b''
+
+        if not text.startswith('{'):
+            # Plain text (e.g. AOS/LOS lines) is taken a line at a time
+            return SimServer.nextCommand(self, text.encode('utf-8'))
+
+        try:
+            command, end = self.decoder.raw_decode(text)
+        except ValueError:
+            # Incomplete object, wait for more
+            return None, buffer
+
+        return command, text[end:].encode('utf-8')
+
+    def reply(self, command, isError):
+        if isError:
+            return b'{"Result":"Error","Message":"Not tunable"}'
+
+        if isinstance(command, dict) and command.get('Method') == 'Frequency':
+            if command.get('Command') == 'Get':
+                return json.dumps({'Result': 'OK', 'Method': 'Frequency', 'Value': self.frequency}).encode('utf-8')
+
+            try:
+                self.frequency = int(command.get('Value'))
+            except (TypeError, ValueError):
+                return b'{"Result":"Error","Message":"Bad value"}'
+
+        return b'{"Result":"OK"}'
+
+class SimRotctld(SimServer):
+    # rotctld: 'P az el' -> 'RPRT 0', 'p' -> 'az\nel\n', 'S' -> 'RPRT 0'
+    def __init__(self, port=DEFAULT_ROTCTLD_PORT, **kwargs):
+        SimServer.__init__(self, 'rotctld', port, **kwargs)
+        self.azimuth = 0.0
+        self.elevation = 0.0
+
+    def reply(self, command, isError):
+        if isError:
+            return b'RPRT -1\n'
+
+        params = command.split()
+        if params[0] == 'P':
+            try:
+                azimuth = float(params[1])
+                elevation = float(params[2])
+            except (IndexError, ValueError):
+                return b'RPRT -1\n'
+
+            if not (-180.0 <= azimuth <= 540.0) or not (-90.0 <= elevation <= 180.0):
+                return b'RPRT -1\n'
+
+            self.azimuth = azimuth
+            self.elevation = elevation
+        elif params[0] == 'p':
+            return ("%f\n%f\n" % (self.azimuth, self.elevation)).encode('utf-8')
+
+        return b'RPRT 0\n'
+
+class SimDeviceThread(object):
+    """
+    DESCRIPTION:
+        Runs a set of SimServers on an asyncio loop in a background thread, for use from
+        blocking code such as loadharness.py.
+    INPUTS:
+        servers (list)           = SimServers to run
+    """
+    def __init__(self, servers):
+        self.servers = servers
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, name='simdevices', daemon=True)
+        self.started = threading.Event()
+        self.startError = None
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+
+        try:
+            for curServer in self.servers:
+                self.loop.run_until_complete(curServer.start())
+        except Exception as e:
+            self.startError = e
+            self.started.set()
+            return
+
+        self.started.set()
+        self.loop.run_forever()
+
+    def start(self):
+        # Raises the server's error if a port could not be opened
+        self.thread.start()
+        self.started.wait()
+
+        if self.startError is not None:
+            raise self.startError
+
+    def stop(self):
+        for curServer in self.servers:
+            self.loop.call_soon_threadsafe(curServer.close)
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=2.0)
+
+# -------------------  Global Functions ----------------------------------------
+def makeServers(gqrxPort=0, sdrsharpPort=0, rotctldPort=0, **kwargs):
+    # Servers for every non-zero port.  kwargs are the SimServer latency/error settings.
+    servers = []
+
+    if gqrxPort:
+        servers.append(SimGqrx(gqrxPort, **kwargs))
+    if sdrsharpPort:
+        servers.append(SimSdrSharp(sdrsharpPort, **kwargs))
+    if rotctldPort:
+        servers.append(SimRotctld(rotctldPort, **kwargs))
+
+    return servers
+
+async def runServers(servers, statsInterval):
+    for curServer in servers:
+        await curServer.start()
+        print("[Info] Simulated %s listening on %s:%d" % (curServer.name, curServer.host, curServer.port))
+
+    startTime = time.monotonic()
+    while True:
+        await asyncio.sleep(statsInterval)
+        print("\n%.0f seconds" % (time.monotonic() - startTime))
+        for curServer in servers:
+            print(curServer.summary())
+
+# ----------------------  Main Code -------------------------------------------------------
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Simulated gqrx, SDRSharp NetRemote and rotctld servers')
+    argparser.add_argument('--gqrx', help="Port for a simulated gqrx remote control server.  Default is off (" + str(DEFAULT_GQRX_PORT) + " is gqrx's own port).", default=0, required=False)
+    argparser.add_argument('--sdrsharp', help="Port for a simulated SDRSharp NetRemote server.  Default is off.", default=0, required=False)
+    argparser.add_argument('--rotctld', help="Port for a simulated rotctld server.  Default is off (" + str(DEFAULT_ROTCTLD_PORT) + " is rotctld's own port).", default=0, required=False)
+    argparser.add_argument('--host', help="Address to listen on.  Default is 127.0.0.1", default='127.0.0.1', required=False)
+    argparser.add_argument('--latency', help="Milliseconds before each reply.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--jitter', help="+/- milliseconds of random variation on --latency.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--errorrate', help="Fraction of commands (0-1) answered with an error reply.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--droprate', help="Fraction of commands (0-1) that close the connection without a reply.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--seed', help="Random seed for repeatable error/drop patterns.  Default is random.", default=None, required=False)
+    argparser.add_argument('--statsinterval', help="Seconds between stats lines.  Default is " + str(DEFAULT_STATS_INTERVAL) + ".", default=DEFAULT_STATS_INTERVAL, required=False)
+
+    args = argparser.parse_args()
+
+    servers = makeServers(int(args.gqrx), int(args.sdrsharp), int(args.rotctld), host=args.host, latency=float(args.latency)/1000.0,
+                          jitter=float(args.jitter)/1000.0, errorRate=float(args.errorrate), dropRate=float(args.droprate),
+                          seed=int(args.seed) if args.seed is not None else None)
+
+    if len(servers) == 0:
+        print("ERROR: Provide at least one of --gqrx, --sdrsharp or --rotctld.")
+        exit(1)
+
+    try:
+        asyncio.run(runServers(servers, float(args.statsinterval)))
+    except OSError as e:
+        print("ERROR: " + str(e))
+        exit(2)
+    except KeyboardInterrupt:
+        pass
+
+    for curServer in servers:
+        print(curServer.summary())
@@ -0,0 +1,81 @@
+###################################################################
+#
+# Module: sites.py
+# Author: ghostop14
+#
+# Ground station (observer site) specifications shared by the tracking and
+# planning tools.  A site is given on the command line as
+# name=<name>,lat=<deg>,long=<deg>[,alt=<m>][,rotor=<label>].
+##################################################################
+
+# -------------------  Global Vars -------------------------------------
+SITE_SPEC_KEYS = ['name', 'lat', 'long', 'alt', 'rotor']
+
+# -------------------  Global Functions ----------------------------------------
+def siteLabel(targetName, siteName):
+    # Record name for one target seen from one site
+    return targetName + "@" + siteName
+
+def parseSiteSpec(spec):
+    # Parses 'name=home,lat=40.1,long=-75.2,alt=120' into a dict.  A bare first item is taken as the name.
+    params = {}
+
+    for index, item in enumerate(spec.split(',')):
+        item = item.strip()
+        if len(item) == 0:
+            continue
+
+        if '=' not in item:
+            if index == 0:
+                params['name'] = item
+                continue
+
+            raise ValueError("Bad site parameter '" + item + "'.  Expected key=value.")
+
+        key, value = item.split('=', 1)
+        key = key.strip().lower()
+        if key not in SITE_SPEC_KEYS:
+            raise ValueError("Unknown site parameter '" + key + "'.  Options are: " + ", ".join(SITE_SPEC_KEYS))
+
+        params[key] = value.strip()
+
+    if 'lat' not in params or 'long' not in params:
+        raise ValueError("Site '" + spec + "' needs both lat and long.")
+
+    return params
+
+# -------------------  Classes ----------------------------------------
+class Site(object):
+    """
+    DESCRIPTION:
+        One observer location.  The rotor label names the antenna/rotor that serves the site;
+        sites that share a label share the rotor.  It defaults to the site name.
+    INPUTS:
+        name (str)               = site name used in output
+        lat (float)              = latitude in degrees
+        long (float)             = longitude in degrees
+        altitude (float)         = altitude in meters
+        rotor (str)              = rotor label (default is the site name)
+    """
+    def __init__(self, name, lat, long, altitude=0.0, rotor=None):
+        self.name = name
+        self.lat = float(lat)
+        self.long = float(long)
+        self.altitude = float(altitude)
+        self.rotor = rotor if rotor else name
+
+        if self.lat < -90.0 or self.lat > 90.0 or self.long < -180.0 or self.long > 360.0:
+            raise ValueError("Site '" + name + "' has an invalid lat/long.")
+
+    @classmethod
+    def fromSpec(cls, spec, defaultName="site"):
+        params = parseSiteSpec(spec)
+        return cls(params.get('name', defaultName), params['lat'], params['long'], params.get('alt', 0.0), params.get('rotor'))
+
+    def topos(self):
+        # skyfield is only imported by the code paths that compute positions
+        from skyfield.api import Topos
+        return Topos(latitude_degrees=self.lat, longitude_degrees=self.long, elevation_m=self.altitude)
+
+    def observer(self, planets):
+        return planets['earth'] + self.topos()
@@ -0,0 +1,400 @@
+#!/usr/bin/python3
+
+###################################################################
+#
+# Application: skybench.py
+# Author: ghostop14
+#
+# Offline benchmark suite for the skytrack.py and radecl.py hot paths:
+# the per-tick observe().apparent().altaz() solve, rise/set searches with
+# find_discrete, illumination, doppler_shift and radecl's transform_to.
+# Everything runs against a local kernel at a fixed UTC epoch and observer,
+# so runs on the same machine are comparable.  Each operation is timed at
+# several batch sizes and reported as latency per call, latency per sample
+# and samples per second.  Results can be saved to CSV and compared against
+# an earlier run to quantify regressions or the gain from a new engine.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import argparse
+import csv
+import os
+import platform
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from trackdefaults import DEFAULT_KERNEL
+
+# -------------------  Global Vars -------------------------------------
+# Fixed inputs so every run solves exactly the same problem
+BENCH_UTC = (2024, 1, 1, 0, 0, 0)
+BENCH_LAT = 40.0
+BENCH_LONG = -75.0
+BENCH_ALTITUDE = 100.0  # meters
+BENCH_BODY = 'moon'
+BENCH_FREQ = 144000000.0  # Hz
+# Cassiopeia A
+BENCH_RA = 350.85  # degrees
+BENCH_DEC = 58.815  # degrees
+
+DEFAULT_SIZES = "1,10,100,1000,10000"
+DEFAULT_RISESET_DAYS = "1,7,30"
+DEFAULT_REPEAT = 5
+
+# Each timed repeat runs the operation enough times to take at least this long
+MIN_REPEAT_TIME = 0.05  # seconds
+
+# -------------------  Classes ----------------------------------------
+class BenchContext(object):
+    """
+    DESCRIPTION:
+        Loaded kernel, timescale, observer and astropy objects shared by every benchmark.
+        astropy is only imported (and its IERS downloads disabled) if a radecl benchmark runs.
+    INPUTS:
+        kernelFile (str)         = ephemeris kernel to load (never downloaded)
+    """
+    def __init__(self, kernelFile):
+        from skyfield.api import load, Topos
+        from ephemtable import resolveBody
+
+        self.kernelFile = kernelFile
+        self.planets = load(kernelFile)
+        self.ts = load.timescale()
+        self.bodyName, self.target = resolveBody(self.planets, BENCH_BODY)
+        self.observer = self.planets['earth'] + Topos(latitude_degrees=BENCH_LAT, longitude_degrees=BENCH_LONG, elevation_m=BENCH_ALTITUDE)
+        self.epoch = self.ts.utc(*BENCH_UTC)
+        self.astropyReady = False
+
+    def times(self, size, step=1.0):
+        # size == 1 gives a scalar Time, the way the tracking loops call it each tick
+        if size == 1:
+            return self.epoch
+
+        return self.ts.tt_jd(self.epoch.tt + np.arange(size, dtype=np.float64) * step / 86400.0)
+
+    def setupAstropy(self):
+        if self.astropyReady:
+            return
+
+        from astropy.utils import iers
+        from astropy.coordinates import SkyCoord, EarthLocation
+        from astropy.time import Time
+        from astropy import units as u
+
+        # Offline: use the IERS tables bundled with astropy
+        iers.conf.auto_download = False
+        iers.conf.auto_max_age = None
+        warnings.filterwarnings('ignore', module='astropy')
+
+        self.groundLoc = EarthLocation(lat=BENCH_LAT*u.deg, lon=BENCH_LONG*u.deg, height=BENCH_ALTITUDE*u.m)
+        self.raDecTarget = SkyCoord(BENCH_RA*u.deg, BENCH_DEC*u.deg, frame='icrs')
+        self.astropyEpoch = Time("%04d-%02d-%02d %02d:%02d:%02d" % BENCH_UTC, scale='utc')
+        self.astropyReady = True
+
+# -------------------  Benchmarks ----------------------------------------
+# Each benchmark takes (context, size) and returns a no-argument callable that does the work for
+# size samples.  Setup done before returning the callable is not timed.
+def benchApparent(ctx, size):
+    # skytrack's original per-tick solve
+    t = ctx.times(size)
+    observer = ctx.observer
+    target = ctx.target
+
+    def run():
+        observer.at(t).observe(target).apparent().altaz()
+
+    return run
+
+def benchTopocentric(ctx, size):
+    # The solve used to build tracking tables (az/el/range plus range-rate from the same call)
+    from ephemtable import computeTopocentric
+
+    t = ctx.times(size)
+
+    def run():
+        computeTopocentric(ctx.observer, ctx.target, t)
+
+    return run
+
+def benchTableLookup(ctx, size):
+    # Serving ticks from a precomputed (default one hour, 10 second step) cubic table
+    from ephemtable import EphemerisTable
+
+    table = EphemerisTable(ctx.ts, ctx.observer, ctx.target, ctx.epoch, planets=ctx.planets, bodyName=ctx.bodyName)
+    if size == 1:
+        offsets = 1234.5
+    else:
+        offsets = np.linspace(0.0, table.offsets[-1], size)
+
+    def run():
+        table.lookupOffset(offsets)
+
+    return run
+
+def benchRiseSet(ctx, days):
+    # find_discrete rise/set search over a number of days
+    from skyfield import almanac
+    from risesetcache import targetUpAt
+
+    t0 = ctx.epoch
+    t1 = ctx.ts.tt_jd(ctx.epoch.tt + days)
+    isUp = targetUpAt(ctx.observer, ctx.target)
+
+    def run():
+        almanac.find_discrete(t0, t1, isUp)
+
+    return run
+
+def benchIllumination(ctx, size):
+    from skyfield import almanac
+
+    t = ctx.times(size)
+
+    def run():
+        almanac.fraction_illuminated(ctx.planets, ctx.bodyName, t)
+
+    return run
+
+def benchDoppler(ctx, size):
+    from ephemtable import doppler_shift
+
+    if size == 1:
+        velocities = -65.0
+    else:
+        velocities = np.linspace(-1000.0, 1000.0, size)
+
+    def run():
+        doppler_shift(BENCH_FREQ, velocities)
+
+    return run
+
+def benchTransform(ctx, size):
+    # radecl's ICRS -> AltAz transform_to
+    from astropy.coordinates import AltAz
+    from astropy import units as u
+
+    ctx.setupAstropy()
+    if size == 1:
+        obstime = ctx.astropyEpoch
+    else:
+        obstime = ctx.astropyEpoch + np.arange(size, dtype=np.float64)*u.s
+
+    def run():
+        ctx.raDecTarget.transform_to(AltAz(obstime=obstime, location=ctx.groundLoc))
+
+    return run
+
+def benchAltAzLookup(ctx, size):
+    # Serving radecl ticks from a precomputed (default one hour, 60 second step) Alt/Az table
+    from altaztable import AltAzTable
+
+    ctx.setupAstropy()
+    table = AltAzTable(ctx.raDecTarget, ctx.groundLoc, ctx.astropyEpoch)
+    if size == 1:
+        timestamps = table.startTimestamp + 1234.5
+    else:
+        timestamps = np.linspace(table.startTimestamp, table.endTimestamp, size)
+
+    def run():
+        table.lookup(timestamps)
+
+    return run
+
+# name -> (setup function, True if sizes are days of rise/set search rather than samples, description)
+BENCHMARKS = [
+    ('apparent', benchApparent, False, "observe().apparent().altaz()"),
+    ('topocentric', benchTopocentric, False, "ephemtable.computeTopocentric (az/el/range/range-rate)"),
+    ('tablelookup', benchTableLookup, False, "EphemerisTable cubic lookup"),
+    ('riseset', benchRiseSet, True, "almanac.find_discrete rise/set (size is days)"),
+    ('illumination', benchIllumination, False, "almanac.fraction_illuminated"),
+    ('doppler', benchDoppler, False, "doppler_shift"),
+    ('transform', benchTransform, False, "astropy transform_to(AltAz)"),
+    ('altazlookup', benchAltAzLookup, False, "AltAzTable cubic lookup"),
+]
+
+# -------------------  Global Functions ----------------------------------------
+def timeOperation(run, repeat):
+    # Returns (calls per repeat, list of seconds per call for each repeat).
+    # The call count is doubled until one repeat takes MIN_REPEAT_TIME, like timeit's autorange.
+    run()
+
+    calls = 1
+    while True:
+        startTime = time.perf_counter()
+        for i in range(calls):
+            run()
+        elapsed = time.perf_counter() - startTime
+
+        if elapsed >= MIN_REPEAT_TIME:
+            break
+
+        calls *= 2
+
+    perCall = [elapsed / calls]
+    for i in range(repeat - 1):
+        startTime = time.perf_counter()
+        for i in range(calls):
+            run()
+        perCall.append((time.perf_counter() - startTime) / calls)
+
+    return calls, perCall
+
+def runBenchmarks(ctx, names, sizes, risesetDays, repeat):
+    # Returns a list of result dicts, one per benchmark and size
+    results = []
+
+    for name, setup, sizeIsDays, description in BENCHMARKS:
+        if name not in names:
+            continue
+
+        for size in (risesetDays if sizeIsDays else sizes):
+            calls, perCall = timeOperation(setup(ctx, size), repeat)
+            median = float(np.median(perCall))
+
+            # Rise/set throughput is in days searched per second
+            results.append({'operation': name, 'size': size, 'calls': calls, 'median': median, 'best': float(np.min(perCall)),
+                            'persample': median / size, 'throughput': size / median})
+
+    return results
+
+def formatSeconds(seconds):
+    if seconds >= 1.0:
+        return "%.3f s" % seconds
+    elif seconds >= 1e-3:
+        return "%.3f ms" % (seconds*1e3)
+    elif seconds >= 1e-6:
+        return "%.3f us" % (seconds*1e6)
+
+    return "%.1f ns" % (seconds*1e9)
+
+def loadResults(filename):
+    # Previous --output CSV -> {(operation, size): median seconds}
+    baseline = {}
+
+    with open(filename, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            baseline[(row['operation'], int(row['size']))] = float(row['median_s'])
+
+    return baseline
+
+def saveResults(filename, results):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['operation', 'size', 'calls', 'median_s', 'best_s', 'per_sample_s', 'throughput_per_s'])
+        for curResult in results:
+            writer.writerow([curResult['operation'], curResult['size'], curResult['calls'], "%.9g" % curResult['median'],
+                             "%.9g" % curResult['best'], "%.9g" % curResult['persample'], "%.9g" % curResult['throughput']])
+
+def parseSizes(value, option):
+    try:
+        sizes = [int(curSize) for curSize in value.split(',') if len(curSize.strip()) > 0]
+    except ValueError:
+        sizes = []
+
+    if len(sizes) == 0 or min(sizes) < 1:
+        raise ValueError(option + " must be a comma-separated list of positive integers.")
+
+    return sizes
+
+# ----------------------  Main Code -------------------------------------------------------
+
+if __name__ == '__main__':
+    benchNames = [curBench[0] for curBench in BENCHMARKS]
+
+    argparser = argparse.ArgumentParser(description='Offline benchmark suite for skytrack.py and radecl.py')
+    argparser.add_argument('--ephemeris', help="Local ephemeris kernel to benchmark against (never downloaded).  Must cover " +
+                           "%04d/%02d/%02d.  Default is %s" % (BENCH_UTC[0], BENCH_UTC[1], BENCH_UTC[2], DEFAULT_KERNEL), default=DEFAULT_KERNEL, required=False)
+    argparser.add_argument('--ops', help="Comma-separated operations to run.  Options are: " + ", ".join(benchNames) + ".  Default is all.", default=",".join(benchNames), required=False)
+    argparser.add_argument('--sizes', help="Comma-separated batch sizes (number of times evaluated per call).  Default is " + DEFAULT_SIZES, default=DEFAULT_SIZES, required=False)
+    argparser.add_argument('--risesetdays', help="Comma-separated rise/set search lengths in days.  Default is " + DEFAULT_RISESET_DAYS, default=DEFAULT_RISESET_DAYS, required=False)
+    argparser.add_argument('--repeat', help="Timed repeats per operation and size.  The median is reported.  Default is " + str(DEFAULT_REPEAT), default=DEFAULT_REPEAT, required=False)
+    argparser.add_argument('--output', help="If provided, results are also written to this CSV file.", default="", required=False)
+    argparser.add_argument('--baseline', help="If provided, a CSV file from an earlier --output run to compare against.", default="", required=False)
+
+    args = argparser.parse_args()
+
+    names = [curName.strip().lower() for curName in args.ops.split(',') if len(curName.strip()) > 0]
+    for curName in names:
+        if curName not in benchNames:
+            print("ERROR: Unknown operation " + curName + ".  Options are: " + ", ".join(benchNames))
+            exit(1)
+
+    try:
+        sizes = parseSizes(args.sizes, "--sizes")
+        risesetDays = parseSizes(args.risesetdays, "--risesetdays")
+    except ValueError as e:
+        print("ERROR: " + str(e))
+        exit(1)
+
+    repeat = int(args.repeat)
+    if repeat < 1:
+        print("ERROR: --repeat must be at least 1.")
+        exit(1)
+
+    if not os.path.exists(args.ephemeris):
+        print("ERROR: Unable to find ephemeris " + args.ephemeris + ".  The benchmark runs offline and does not download kernels.")
+        exit(1)
+
+    baseline = None
+    if len(args.baseline) > 0:
+        try:
+            baseline = loadResults(args.baseline)
+        except (OSError, KeyError, ValueError) as e:
+            print("ERROR: Unable to read baseline " + args.baseline + ": " + str(e))
+            exit(1)
+
+    ctx = BenchContext(args.ephemeris)
+
+    from ephemtable import kernelCoverage
+    coverageStart, coverageEnd = kernelCoverage(ctx.planets)
+    # Tables cover an hour, rise/set searches run for up to max(risesetDays)
+    coverageDays = max(risesetDays) if 'riseset' in names else 1.0
+    if not (coverageStart <= ctx.epoch.tdb <= coverageEnd - coverageDays):
+        print("ERROR: " + args.ephemeris + " does not cover the benchmark epoch plus %g days." % coverageDays)
+        exit(1)
+
+    import skyfield
+    print("Python %s, numpy %s, skyfield %s, %s" % (platform.python_version(), np.__version__, skyfield.__version__, platform.machine()))
+    print("Kernel %s, epoch %04d/%02d/%02d %02d:%02d:%02d UTC, body %s, observer %.1f, %.1f, %.0f m\n" % ((args.ephemeris,) + BENCH_UTC +
+          (BENCH_BODY, BENCH_LAT, BENCH_LONG, BENCH_ALTITUDE)))
+
+    for name, setup, sizeIsDays, description in BENCHMARKS:
+        if name in names:
+            print("%-13s %s" % (name, description))
+    print("")
+
+    header = "%-13s %7s %8s %12s %12s %12s %14s" % ("Operation", "Size", "Calls", "Median", "Best", "Per sample", "Samples/s")
+    if baseline is not None:
+        header += " %10s" % "vs base"
+    print(header)
+
+    results = []
+    try:
+        for name, setup, sizeIsDays, description in BENCHMARKS:
+            if name not in names:
+                continue
+
+            for curResult in runBenchmarks(ctx, [name], sizes, risesetDays, repeat):
+                line = "%-13s %7d %8d %12s %12s %12s %14.1f" % (curResult['operation'], curResult['size'], curResult['calls'],
+                                                                formatSeconds(curResult['median']), formatSeconds(curResult['best']),
+                                                                formatSeconds(curResult['persample']), curResult['throughput'])
+                if baseline is not None:
+                    baseMedian = baseline.get((curResult['operation'], curResult['size']))
+                    if baseMedian is not None:
+                        # > 1 is faster than the baseline
+                        line += " %9.2fx" % (baseMedian / curResult['median'])
+                    else:
+                        line += " %10s" % "-"
+
+                print(line)
+                sys.stdout.flush()
+                results.append(curResult)
+    except KeyboardInterrupt:
+        print("\nInterrupted, keeping the results so far.")
+
+    if len(args.output) > 0:
+        saveResults(args.output, results)
+        print("\nResults written to " + args.output)
@@ -13,114 +13,19 @@
 ##################################################################
 
 # -----------------------imports -------------------------------------
+# skyfield, numpy and the tracking modules are imported once the arguments are known to need
+# them, so --help, --listbodies and argument errors return without paying for them.
 import argparse
-import socket
+import os
+import sys
 import time
-import subprocess
 from datetime import datetime
-from datetime import timedelta
-from tzlocal import get_localzone
-from dateutil import parser
-import pytz
 
-from skyfield.api import load,Topos
-from skyfield import almanac
-from skyfield.nutationlib import iau2000b
+from trackdefaults import DEFAULT_KERNEL, DEFAULT_TABLE_WINDOW, DEFAULT_TABLE_STEP, INTERPOLATION_CUBIC, INTERPOLATION_LINEAR, DEFAULT_DEVICE_TIMEOUT, DEFAULT_TABLE_CACHE_SIZE, DEFAULT_METRICS_INTERVAL, DEFAULT_RADIO_PIPELINE, DEFAULT_CONTROL_ADDRESS, OUTPUT_FORMAT_NDJSON, OUTPUT_FORMAT_BINARY, DEFAULT_OUTPUT_FLUSH, EXPORT_FORMAT_CSV, EXPORT_FORMAT_NPY, EXPORT_FORMAT_PARQUET, DEFAULT_EXPORT_STEP, DEFAULT_EXPORT_CHUNK
+from bodyindex import loadBodyIndex, buildBodyIndex, bodyInIndex
 
-netPortRotor = None
-netPortFreq = None
 lastElevation=-999.0
 
-# -------------------  Global Functions ----------------------------------------
-def socketConnect(server, port):
-    global netPortRotor
-    
-    if not netPortRotor:
-        netPortRotor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            netPortRotor.connect((server, port))
-        except:
-            print("Rotor Error connecting to " + server + ":" + str(port))
-            netPortRotor = None
-            
-def targetUpAt(observer,target):
-    topos_at = observer.at
-    def is_target_up_at(t):
-        """Return `True` if the target has risen by time `t`."""
-        t._nutation_angles = iau2000b(t.tt)
-        return topos_at(t).observe(target).apparent().altaz()[0].degrees > -0.8333
-    is_target_up_at.rough_period = 0.5  # twice a day
-    return is_target_up_at
-
-def doppler_shift(frequency, relativeVelocity):
-    """
-    DESCRIPTION:
-        This function calculates the doppler shift of a given frequency when actual
-        frequency and the relative velocity is passed.
-        The function for the doppler shift is f' = f - f*(v/c).
-    INPUTS:
-        frequency (float)        = satlitte's beacon frequency in Hz
-        relativeVelocity (float) = Velocity at which the satellite is moving
-                                   towards or away from observer in m/s
-    RETURNS:
-        Param1 (float)           = The frequency experienced due to doppler shift in Hz
-    AFFECTS:
-        None
-    EXCEPTIONS:
-        None
-    DEPENDENCIES:
-        ephem.Observer(...), ephem.readtle(...)
-    Note: relativeVelocity is positive when moving away from the observer
-          and negative when moving towards
-    """
-    return  (frequency - frequency * (relativeVelocity/3e8)) 
-
-def RCmoveToPosition(port, controllerType, baud,  azimuth, elevation):
-        # Port can be /dev/ttyUSB0 type of port, or:
-        # <ip>:<port>
-        
-        if azimuth < 0.0 or azimuth > 360.0:
-            return -1 
-
-        if elevation < 0:
-            elevation = 0
-            
-        if elevation > 360:
-            return -1 
-
-        # -m is type, type 2 is hamlib compatible, 1401 is Celestron/Nextar.  man rotctl can provide a better overview
-        if ':' in port:
-            # Network connection.  rotctl sends a lot of extra dump_states.  So let's do it by hand.
-            # cmd = [ 'rotctl' , '-m' , str(controllerType) , '-r' , str(port), 'P', str(azimuth) , str(elevation) ]
-            if not netPortRotor:
-                params = port.split(":")
-                socketConnect(params[0], int(params[1]))
-                
-            if netPortRotor:
-                cmdString = "P " + str(azimuth) + " " + str(elevation) + "\n"
-                netPortRotor.send(cmdString.encode('utf-8'))
-                
-            return 0
-        else:
-            cmd = [ 'rotctl' , '-m' , str(controllerType) , '-r' , str(port), '-s',str(baud),'P', str(azimuth), str(elevation) ]
-            
-            try:
-                cpval = subprocess.run(cmd,timeout=2,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-                
-                if cpval.returncode == 0:
-                    return 0 
-                else:
-                    # Note: unable to connect to port is returncode 2
-                    rotorResult = cpval.stdout.decode('ASCII')
-                    print('ROTOR ERROR: ')
-                    print(rotorResult)
-                    
-                    return cpval.returncode
-            except subprocess.TimeoutExpired as e:
-                return -3
-            except subprocess.CalledProcessError as e:
-                return -4
-
 # ----------------------  Main Code -------------------------------------------------------
 
 if __name__ == '__main__':
@@ -129,13 +34,15 @@ if __name__ == '__main__':
     argparser.add_argument('--lat', help="[Required] Observer Latitude", default=-999.0)
     argparser.add_argument('--long', help="[Required] Observer Longitude", default=-999.0)
     argparser.add_argument('--listbodies', help="List options for the --body parameter", default=False, action='store_true')
+    argparser.add_argument('--ephemeris', help="Ephemeris kernel to load.  Default is " + DEFAULT_KERNEL + ".  A kernel trimmed to your bodies and dates with kernelexcerpt.py loads faster and uses less memory.", default=DEFAULT_KERNEL, required=False)
 
     argparser.add_argument('--freq', help="If provided, a doppler shift will be calculated", default=0.0, required=False)
     argparser.add_argument('--radio', help="If provided, gqrx/gpredict-compatible frequency control commands will be sent to the specified host:port (Note: This disables any value in the --date parameter and the --freq parameter is required and causes the program to continue to loop, sending updates)", default="", required=False)
     argparser.add_argument('--send-aos-los', help="Send AOS/LOS messages to radio above the specified elevation (Default is not to send)", default=False, action='store_true', required=False)
     argparser.add_argument('--aos-elevation', help="Set the AOS/LOS elevation boundary in degrees (Default is 10 degrees)", default=10.0, required=False)
     argparser.add_argument('--sdrsharp', help="If provided, frequency control commands will be sent the NetRemote plugin for SDRSharp on the specified host:port (Note: This disables any value in the --date parameter and the --freq parameter is required and causes the program to continue to loop)", default="", required=False)
-    argparser.add_argument('--delay', help="Time in seconds between radio and rotor updates (default=30 seconds)", default=30, required=False)
+    argparser.add_argument('--radiopipeline', help="Frequency commands sent to the radio before waiting for a reply.  Replies are matched to commands in order, so high update rates are not held to one radio round trip per update.  Default is " + str(DEFAULT_RADIO_PIPELINE) + " (wait for each reply).", default=DEFAULT_RADIO_PIPELINE, required=False)
+    argparser.add_argument('--delay', help="Time in seconds between radio and rotor updates (default=30 seconds).  Fractional values (e.g. 0.05 for 20 Hz) enable sub-second updates, with the display limited to once per second.", default=30, required=False)
     argparser.add_argument('--rotor', help="HamLib compatible rotor control (matches gpredict rotor/rotctl).  Can be <ip>:<port> or device like /dev/ttyUSB0", default="", required=False)
     argparser.add_argument('--rotortype', help="rotctl rotor type (use rotctl -l to show numbers).  Default is 2 (hamlib/net), Celestron is 1401, SPID is 901 or 902 depending on mode.", default=2, required=False)
     argparser.add_argument('--rotorbaud', help="If needed, can provide a rotor baud.  Default is 9600", default=9600, required=False)
@@ -143,30 +50,56 @@ if __name__ == '__main__':
     argparser.add_argument('--rotorleftlimit', help="If needed, can provide a rotor 'left' limit in degrees. For instance if obstructions block rotation or view.  Default is no restriction.  Note: if either left/right limit is noted, both are required.", default=-1, required=False)
     argparser.add_argument('--rotorrightlimit', help="If needed, can provide a rotor 'right' limit in degrees. For instance if obstructions block rotation or view.  Default is no restriction. Note: if either left/right limit is noted, both are required.", default=-1, required=False)
     argparser.add_argument('--rotorelevationlimit', help="If needed, can provide a rotor 'elevation' limit in degrees. For instance if obstructions block rotation or view.  Default is 90 degrees (straight up).", default=-1, required=False)
+    argparser.add_argument('--horizonmask', help="If provided, a CSV file of azimuth,min_elevation rows (degrees) describing obstructions.  The rotor is not moved to targets below the mask.", default="", required=False)
+    argparser.add_argument('--rotordeadband', help="Only move the rotor once the target has moved this many degrees (azimuth or elevation) from the last move sent.  Default is 0 (move every update).", default=0.0, required=False)
+    argparser.add_argument('--rotorslewrate', help="Rotor speed in degrees/second as 'az' or 'az,el'.  If provided, moves lead the target by the time the rotor needs to get there.  Default is 0 (unknown, no lead).", default="0", required=False)
+    argparser.add_argument('--rotorazrange', help="Azimuth values the rotor accepts as 'min,max', e.g. '-180,180' or '0,450' for a rotor with overlap.  Moves use whichever equivalent azimuth is the shortest path inside the limits.  Default is 0,360.", default="0,360", required=False)
+    argparser.add_argument('--target', help="Multi-target mode.  Track several bodies in one process, each with its own outputs.  Repeat for each target as body=<name>[,name=<label>][,freq=<hz>][,radio=<host:port>][,sdrsharp=<host:port>][,rotor=<port>][,rotortype=<n>][,rotorbaud=<n>].  Replaces --body/--freq/--radio/--rotor.  name defaults to the body and must be unique.", action='append', default=None, required=False)
+    argparser.add_argument('--site', help="Multi-site mode.  Positions and doppler for --body (or each --target) from every site in one batched solve per update, with records named <target>@<site>.  Repeat for each site as name=<name>,lat=<deg>,long=<deg>[,alt=<m>].  Replaces --lat/--long.  Works with --utcdate, --output and --export, not with radios, rotors, --async or --daemon.", action='append', default=None, required=False)
+    argparser.add_argument('--workers', help="[Export mode] With --site, worker processes that solve export chunks in parallel.  0 is one per CPU.  Default is 1 (solve in this process).", default=1, required=False)
+    argparser.add_argument('--async', dest='use_async', help="Run radio, rotor and ephemeris I/O as independent asyncio tasks so a slow device never stalls the others.  Works with --body or --target.", default=False, action='store_true', required=False)
+    argparser.add_argument('--daemon', help="Run as a daemon controlled over a local socket, keeping the kernel, observer and device connections loaded.  Targets can be added, removed, retuned and queried with skytrackctl.py (JSON, one request per line).  Value is a Unix socket path or a TCP port / host:port, e.g. " + DEFAULT_CONTROL_ADDRESS + " or 9200.  Starts with any --body/--target given, or with none.", nargs='?', const=DEFAULT_CONTROL_ADDRESS, default="", required=False)
+    argparser.add_argument('--devicetimeout', help="In --async mode, seconds to wait for a radio or rotor to connect or reply before reconnecting.  Default is 2 seconds.", default=DEFAULT_DEVICE_TIMEOUT, required=False)
+    argparser.add_argument('--leadtime', help="Updates run on fixed deadlines every --delay seconds.  Positions and doppler are computed for this many seconds after each deadline to cover radio/rotor latency.  Default is 0.", default=0.0, required=False)
+    argparser.add_argument('--tablewindow', help="When looping for a radio or rotor, positions are precomputed in one batch for this many seconds ahead and each update is served from that table.  Default is 3600 seconds.", default=DEFAULT_TABLE_WINDOW, required=False)
+    argparser.add_argument('--tablestep', help="Spacing in seconds between precomputed table samples.  Updates between samples are interpolated.  Default is 10 seconds.", default=DEFAULT_TABLE_STEP, required=False)
+    argparser.add_argument('--interpolation', help="How updates between precomputed table samples are interpolated: 'cubic' or 'linear'.  Default is cubic.", choices=[INTERPOLATION_CUBIC, INTERPOLATION_LINEAR], default=INTERPOLATION_CUBIC, required=False)
+    argparser.add_argument('--tablecache', help="If provided, precomputed position tables are cached in this directory and reused by later runs (and other trackers) for the same body, location, window, step and ephemeris.  Tables then start on --tablewindow boundaries.  Default is no cache.", default="", required=False)
+    argparser.add_argument('--tablecachesize', help="Maximum size of the --tablecache directory in MB.  Least recently used tables are removed beyond this.  Default is " + str(DEFAULT_TABLE_CACHE_SIZE) + " MB.", default=DEFAULT_TABLE_CACHE_SIZE, required=False)
+    argparser.add_argument('--metricsport', help="If provided, per-stage loop timings, radio/rotor round trips and reconnect counts are served in Prometheus text format at http://127.0.0.1:<port>/metrics.  Default is off.", default=0, required=False)
+    argparser.add_argument('--metricslog', help="If provided, a JSON line of per-stage timing percentiles, round trips and counters is appended to this file ('-' for stdout) every --metricsinterval seconds.  Default is off.", default="", required=False)
+    argparser.add_argument('--metricsinterval', help="Seconds between --metricslog lines.  Default is " + str(DEFAULT_METRICS_INTERVAL) + " seconds.", default=DEFAULT_METRICS_INTERVAL, required=False)
+    argparser.add_argument('--output', help="If provided, each update writes one machine-readable record per target here instead of the status text: a filename (appended to), '-' for stdout, udp:<host>:<port> or unix:<path> (datagram socket).  With '-', all other messages go to stderr.  Without a radio or rotor this keeps updating every --delay seconds (unless --utcdate is given).  Default is off.", default="", required=False)
+    argparser.add_argument('--outputformat', help="--output record format: 'ndjson' (one JSON object per line) or 'binary' (fixed-width little-endian records, see trackoutput.py).  Default is ndjson.", choices=[OUTPUT_FORMAT_NDJSON, OUTPUT_FORMAT_BINARY], default=OUTPUT_FORMAT_NDJSON, required=False)
+    argparser.add_argument('--outputflush', help="Seconds --output records are buffered before being written together.  0 writes every record as it is made.  Default is " + str(DEFAULT_OUTPUT_FLUSH) + " seconds.", default=DEFAULT_OUTPUT_FLUSH, required=False)
+    argparser.add_argument('--export', help="[Export mode] If provided, azimuth, elevation, range, range-rate, doppler frequency and illumination for --body (or each --target) from --exportstart to --exportend every --exportstep seconds are computed in batches and written to this file, then the program exits.  The format comes from the extension (.csv, .npy or .parquet) unless --exportformat is given.  Parquet needs pyarrow.", default="", required=False)
+    argparser.add_argument('--exportformat', help="[Export mode] csv, npy or parquet.  Default is from the --export file extension.", choices=[EXPORT_FORMAT_CSV, EXPORT_FORMAT_NPY, EXPORT_FORMAT_PARQUET], default="", required=False)
+    argparser.add_argument('--exportstart', help="[Export mode] First UTC time to export.  Format: year/month/day [hh:mm:ss].  Default is now.", default="", required=False)
+    argparser.add_argument('--exportend', help="[Export mode] Last UTC time to export.  Format: year/month/day [hh:mm:ss].  Default is 24 hours after --exportstart.", default="", required=False)
+    argparser.add_argument('--exportstep', help="[Export mode] Seconds between exported samples.  Default is " + str(DEFAULT_EXPORT_STEP) + " seconds.", default=DEFAULT_EXPORT_STEP, required=False)
+    argparser.add_argument('--risesetcache', help="If provided, rise/set results are cached in this file so restarts on the same day do not recalculate them.  Default is to cache in memory only.", default="", required=False)
     argparser.add_argument('--utcdate', help="[Alternate date] If provided, the UTC date and time will be used for the rise/set calculation rather than the current date/time.  Format: year/month/day hh:mm:ss", default="", required=False)
 
-    # Load data files
-    planets=load('de421.bsp')
-    ts = load.timescale()
-    
     # Parse Args
     args = argparser.parse_args()
 
+    kernelFile = args.ephemeris
+
+    # The default kernel is downloaded on first use, anything else has to exist already
+    if kernelFile != DEFAULT_KERNEL and not os.path.exists(kernelFile):
+        print("ERROR: Unable to find ephemeris " + kernelFile)
+        exit(1)
+
+    bodyIndex = loadBodyIndex(kernelFile)
+
     # Check if this is just a listbodies call:
     if args.listbodies:
-        bodyNames = planets.names()
-        printedNames=[]
-        
-        for curKey in bodyNames:
-            curSet = bodyNames[curKey]
-            
-            for curObject in curSet:
-                printedNames.append(str(curObject))
-        
-        # Now sort for printing
-        sortedNames = sorted(printedNames)
-            
-        for curName in sortedNames:
+        if bodyIndex is None:
+            # No index for this kernel yet.  Open it once to build one.
+            from skyfield.api import load
+            bodyIndex = buildBodyIndex(load(kernelFile), kernelFile)
+
+        for curName in bodyIndex:
             print(curName)
         
         exit(0)
@@ -174,37 +107,341 @@ if __name__ == '__main__':
     azoffset = float(args.azoffset)
     
     # Check we have the parameters we need:
-    if len(args.body) == 0:
+    if len(args.body) == 0 and not args.target and len(args.daemon) == 0:
         print("ERROR: Body is required.")
         exit(1)
+
+    if len(args.daemon) > 0 and args.use_async:
+        print("ERROR: --daemon runs the multi-target loop and can't be combined with --async.")
+        exit(1)
         
-    if (args.lat==-999.0 or args.long==-999.0):
-        print("ERROR: Latitude and Longitude are required.")
+    if args.site:
+        from sites import Site, siteLabel
+
+        if len(args.radio) > 0 or len(args.sdrsharp) > 0 or len(args.rotor) > 0 or args.use_async or len(args.daemon) > 0:
+            print("ERROR: --site computes positions only and can't be combined with --radio, --sdrsharp, --rotor, --async or --daemon.")
+            exit(1)
+
+        try:
+            sites = [Site.fromSpec(curSpec, "site%d" % (index + 1)) for index, curSpec in enumerate(args.site)]
+        except ValueError as e:
+            print("ERROR: Bad --site: " + str(e))
+            exit(1)
+    elif (args.lat==-999.0 or args.long==-999.0):
+        print("ERROR: Latitude and Longitude (or --site) are required.")
         exit(1)
 
     aos_elevation = float(args.aos_elevation)
     planetaryBody=args.body
+
+    if len(planetaryBody) > 0 and bodyIndex is not None and not bodyInIndex(bodyIndex, planetaryBody):
+        print('ERROR: Unknown body: ' + planetaryBody + '.  Use --listbodies to see options.')
+        exit(1)
+
+    datestr = args.utcdate.strip('"')
+    datestr = datestr.strip("'")
+    delay= float(args.delay)
+    tableWindow = float(args.tablewindow)
+    tableStep = float(args.tablestep)
+    
+    leadTime = float(args.leadtime)
+
+    if delay <= 0.0:
+        print("ERROR: --delay must be greater than zero.")
+        exit(1)
+
+    if tableStep <= 0.0 or tableWindow < tableStep:
+        print("ERROR: --tablestep must be greater than zero and no larger than --tablewindow.")
+        exit(1)
+
+    if int(args.radiopipeline) < 1:
+        print("ERROR: --radiopipeline must be at least 1.")
+        exit(1)
+
+    if args.output == '-' and args.metricslog == '-':
+        print("ERROR: --output and --metricslog can't both be written to stdout.")
+        exit(1)
+
+    try:
+        from rotorlimits import RotorLimits, loadHorizonMask
+
+        if len(args.horizonmask) > 0:
+            horizonMask = loadHorizonMask(args.horizonmask)
+        else:
+            horizonMask = None
+
+        rotorLimits = RotorLimits(args.rotorleftlimit, args.rotorrightlimit, args.rotorelevationlimit, horizonMask)
+
+        from rotormotion import MotionPlanner, parseSlewRate, parseAzRange
+
+        rotorDeadband = float(args.rotordeadband)
+        rotorSlewRate = parseSlewRate(args.rotorslewrate)
+        rotorAzRange = parseAzRange(args.rotorazrange)
+        if rotorDeadband < 0.0:
+            raise ValueError("--rotordeadband cannot be negative.")
+
+        # Settings for each rotor's MotionPlanner
+        rotorMotion = {'deadband': rotorDeadband, 'azSlewRate': rotorSlewRate[0], 'elSlewRate': rotorSlewRate[1],
+                       'rotorLimits': rotorLimits, 'azRange': rotorAzRange}
+    except (OSError, ValueError) as e:
+        print("ERROR: " + str(e))
+        exit(2)
+
+    # Load data files
+    from skyfield.api import load,Topos
+    from ephemtable import resolveBody, kernelCoverage
+    from rotorcontrol import closeRotors
+
+    planets=load(kernelFile)
+    ts = load.timescale()
+    coverageStart, coverageEnd = kernelCoverage(planets)
+
+    if len(datestr) > 0:
+        from dateutil import parser
+        targetTime = parser.parse(datestr)
+        t = ts.utc(targetTime.year, targetTime.month,  targetTime.day,  targetTime.hour, targetTime.minute, targetTime.second)
+    else:
+        t = ts.now()
+        targetTime = datetime.now()
+
+    if not (coverageStart <= t.tdb <= coverageEnd):
+        print("ERROR: " + kernelFile + " only covers " + ts.tdb_jd(coverageStart).utc_strftime("%Y/%m/%d %H:%M:%S") + " to " +
+              ts.tdb_jd(coverageEnd).utc_strftime("%Y/%m/%d %H:%M:%S") + " UTC.")
+        exit(1)
+
     # Get object descriptors
     earth = planets['earth']
     
-    try:
-        target = planets[planetaryBody]
-    except Exception as e:
+    if len(planetaryBody) > 0:
         try:
             # May be barycenter (center of mass of orbiting bodies.  e.g. saturn is like this in the db file.
-            planetaryBody = planetaryBody + ' barycenter'
-            target = planets[planetaryBody]
-        except:
+            planetaryBody, target = resolveBody(planets, planetaryBody)
+        except Exception as e:
             print('ERROR: Unknown body: ' + planetaryBody)
             print(str(e))
             exit(1)
         
-    datestr = args.utcdate.strip('"')
-    datestr = datestr.strip("'")
-    delay= int(args.delay)
+    # Calculate observer's position
+    if args.site:
+        from multisite import SiteArray
+        siteArray = SiteArray(sites)
+        observer = None
+    else:
+        topoPosition = Topos(float(args.lat), float(args.long))
+        observer = earth + topoPosition
+
+    if len(args.export) > 0:
+        # Export mode: the whole range is solved in chunks and written out, nothing is tracked
+        import numpy as np
+        from multitrack import TrackTarget, checkTargetLabels
+        from tracker import computeStates, timestampsToTime
+        from skyfield.nutationlib import iau2000b
+        from trackexport import runExport, parseUtcDate
+
+        try:
+            if args.target:
+                exportTargets = [TrackTarget(curSpec, planets, connectRadio=False) for curSpec in args.target]
+                checkTargetLabels(exportTargets)
+                exportTargets = [(curTarget.label, curTarget.bodyName, curTarget.target, curTarget.freq) for curTarget in exportTargets]
+            else:
+                exportTargets = [(args.body, planetaryBody, target, float(args.freq))]
+
+            exportStart = parseUtcDate(args.exportstart) if len(args.exportstart) > 0 else time.time()
+            exportEnd = parseUtcDate(args.exportend) if len(args.exportend) > 0 else exportStart + 86400.0
+        except Exception as e:
+            print("ERROR: " + str(e))
+            exit(1)
+
+        exportRange = timestampsToTime(ts, np.array([exportStart, exportEnd]))
+        if not (coverageStart <= exportRange.tdb[0] and exportRange.tdb[1] <= coverageEnd):
+            print("ERROR: " + kernelFile + " only covers " + ts.tdb_jd(coverageStart).utc_strftime("%Y/%m/%d %H:%M:%S") + " to " +
+                  ts.tdb_jd(coverageEnd).utc_strftime("%Y/%m/%d %H:%M:%S") + " UTC.")
+            exit(1)
+
+        exportNames = [curTarget[0] for curTarget in exportTargets]
+        chunkSize = DEFAULT_EXPORT_CHUNK
+        executor = None
+
+        if args.site:
+            from multisite import computeSiteChunk, initSiteWorker, siteChunk
+
+            exportNames = [siteLabel(curLabel, curSite) for curLabel in exportNames for curSite in siteArray.names]
+            # Chunks hold about as many records as a single site export's
+            chunkSize = max(DEFAULT_EXPORT_CHUNK // len(siteArray), 100)
+            workers = int(args.workers)
+
+            if workers == 1:
+                def computeChunk(timestamps):
+                    # Every target from every site for this chunk of times, in this process
+                    return computeSiteChunk(planets, ts, siteArray, exportTargets, timestamps)
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+
+                # Each worker loads the kernel once and solves whole chunks
+                executor = ProcessPoolExecutor(max_workers=workers if workers > 0 else None, initializer=initSiteWorker,
+                                               initargs=(kernelFile, sites, [(curLabel, curBody, curFreq) for curLabel, curBody, curTarget, curFreq in exportTargets]))
+                computeChunk = siteChunk
+        else:
+            def computeChunk(timestamps):
+                # Every target for this chunk of times, sharing the observer's position
+                times = timestampsToTime(ts, timestamps)
+                # IAU 2000B nutation, as in the rise/set search: ~1 milliarcsecond from the full series at a fraction of the cost
+                times._nutation_angles = iau2000b(times.tt)
+                observerAt = observer.at(times)
+                return np.stack([computeStates(planets, observer, curTarget, curBody, curFreq, times, timestamps, observerAt)
+                                 for curLabel, curBody, curTarget, curFreq in exportTargets], axis=1)
+
+        try:
+            runExport(args.export, args.exportformat, exportNames, exportStart, exportEnd, float(args.exportstep), computeChunk, chunkSize, executor)
+        except (OSError, ValueError) as e:
+            print("ERROR: Export failed: " + str(e))
+            exit(2)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        exit(0)
+
+    if len(args.tablecache) > 0 and not args.site:
+        from tablecache import EphemerisTableCache
+        tableCache = EphemerisTableCache(args.tablecache, kernelFile, args.lat, args.long, 0.0, args.tablecachesize)
+    else:
+        tableCache = None
+
+    if len(args.output) > 0:
+        from trackoutput import StateWriter
+
+        try:
+            output = StateWriter(args.output, args.outputformat, float(args.outputflush))
+        except (OSError, ValueError) as e:
+            print("ERROR: Unable to open --output " + args.output + ": " + str(e))
+            exit(2)
+
+        if args.output == '-':
+            # stdout only carries records from here on
+            sys.stdout = sys.stderr
+    else:
+        output = None
+
+    from trackmetrics import TrackMetrics, startMetricsServer, rotorBackendCollector, radioCollector, tableCacheCollector, schedulerCollector
+
+    metrics = TrackMetrics()
+    metrics.addCollector(rotorBackendCollector())
+    if tableCache is not None:
+        metrics.addCollector(tableCacheCollector(tableCache))
+
+    try:
+        if len(args.metricslog) > 0:
+            metrics.openLog(args.metricslog, args.metricsinterval)
+
+        if int(args.metricsport) > 0:
+            startMetricsServer(metrics, args.metricsport)
+    except (OSError, ValueError) as e:
+        print("ERROR: Unable to start metrics: " + str(e))
+        exit(2)
+
+    if args.site:
+        # Multi-site mode: every target from every site, solved together each update
+        from multisite import runMultiSite
+        from multitrack import TrackTarget, checkTargetLabels
+
+        try:
+            if args.target:
+                siteTargets = [TrackTarget(curSpec, planets, connectRadio=False) for curSpec in args.target]
+                checkTargetLabels(siteTargets)
+                if any(len(curTarget.radioAddress) > 0 or len(curTarget.rotor) > 0 for curTarget in siteTargets):
+                    raise ValueError("--site computes positions only.  Targets can't have a radio or rotor.")
+                siteTargets = [(curTarget.label, curTarget.bodyName, curTarget.target, curTarget.freq) for curTarget in siteTargets]
+            else:
+                siteTargets = [(args.body, planetaryBody, target, float(args.freq))]
+        except Exception as e:
+            print("ERROR: Bad --target: " + str(e))
+            exit(1)
+
+        # As with a single site, only streaming records for the current time keeps updating
+        tracking = output is not None and len(datestr) == 0
+        runMultiSite(ts, planets, siteArray, siteTargets, delay, leadTime, None if tracking else t.utc_datetime(), metrics, output)
+
+        if tracking:
+            print(metrics.summary())
+        metrics.close()
+        if output is not None:
+            if tracking:
+                print(output.summary())
+            output.close()
+        exit(0)
+
+    if args.target or args.use_async or len(args.daemon) > 0:
+        # Multi-target / asyncio / daemon mode: one kernel and observer, N targets with their own radios/rotors
+        from multitrack import TrackTarget, checkTargetLabels, runMultiTarget
+
+        if args.target:
+            targetSpecs = args.target
+        elif len(args.body) == 0:
+            # Daemon started empty
+            targetSpecs = []
+        else:
+            # Single --body expressed as one target
+            targetSpec = "body=" + args.body
+            if float(args.freq) != 0.0:
+                targetSpec += ",freq=" + str(args.freq)
+            if len(args.sdrsharp) > 0:
+                targetSpec += ",sdrsharp=" + args.sdrsharp
+            elif len(args.radio) > 0:
+                targetSpec += ",radio=" + args.radio
+            if len(args.rotor) > 0:
+                targetSpec += ",rotor=" + args.rotor
+            targetSpecs = [targetSpec]
+
+        try:
+            targets = [TrackTarget(curSpec, planets, int(args.rotortype), int(args.rotorbaud), not args.use_async, int(args.radiopipeline)) for curSpec in targetSpecs]
+            checkTargetLabels(targets)
+        except Exception as e:
+            print("ERROR: Bad --target: " + str(e))
+            exit(1)
+
+        if args.use_async:
+            from asynctrack import runAsyncTracking
+
+            runAsyncTracking(ts, planets, observer, targets, delay, azoffset=azoffset, rotorLimits=rotorLimits,
+                             sendAosLos=args.send_aos_los, aos_elevation=aos_elevation, tableWindow=tableWindow,
+                             tableStep=tableStep, interpolation=args.interpolation, deviceTimeout=float(args.devicetimeout),
+                             leadTime=leadTime, tableCache=tableCache, rotorMotion=rotorMotion, metrics=metrics, output=output)
+        elif len(args.daemon) > 0:
+            from trackdaemon import TrackControl, startControlServer, stopControlServer
+
+            control = TrackControl(planets, targets, rotorLimits, rotorMotion, int(args.rotortype), int(args.rotorbaud), int(args.radiopipeline), metrics)
+            try:
+                controlServer = startControlServer(control, args.daemon)
+            except OSError as e:
+                print("ERROR: Unable to start the control socket on " + args.daemon + ": " + str(e))
+                closeRotors()
+                exit(2)
+
+            print("[Info] Daemon control socket listening on " + args.daemon)
+            runMultiTarget(ts, planets, observer, targets, delay, azoffset, rotorLimits, args.send_aos_los, aos_elevation, tableWindow, tableStep, args.interpolation,
+                           leadTime, tableCache, rotorMotion, metrics, control, output)
+            stopControlServer(controlServer, args.daemon)
+        else:
+            runMultiTarget(ts, planets, observer, targets, delay, azoffset, rotorLimits, args.send_aos_los, aos_elevation, tableWindow, tableStep, args.interpolation,
+                           leadTime, tableCache, rotorMotion, metrics, None, output)
+        print(metrics.summary())
+        metrics.close()
+        if output is not None:
+            print(output.summary())
+            output.close()
+        closeRotors()
+        exit(0)
+
+    from ephemtable import EphemerisTable, computeTopocentric, doppler_shift
+    from risesetcache import RiseSetCache
+    from rotorcontrol import RCmoveToPosition, getRotor
+    from rotorlimits import reachableWindows, nextReachable, describeWindows
+    from radiocontrol import RadioConnection, RADIOTYPE_GQRX, RADIOTYPE_SDRSHARP
+    from trackscheduler import DeadlineScheduler
+    from tracker import TrackState
+    from tzlocal import get_localzone
 
-    host="127.0.0.1"
-    port=7356
     useRadio = False
     firstTime = True
 
@@ -212,25 +449,16 @@ if __name__ == '__main__':
         useRotor = True
     else:
         useRotor = False
-        
-    RADIOTYPE_GQRX = 1
-    RADIOTYPE_SDRSHARP = 2
-
-    radioType = RADIOTYPE_GQRX
-    radioCommand = "F <frequency>\n"
-    #BUFFER_SIZE=7
-    BUFFER_SIZE=7
 
+    rotorPlanner = MotionPlanner(**rotorMotion)
+        
     radio = args.radio
-    
-    if len(radio) > 0:
-        radioType = RADIOTYPE_GQRX
+    radioType = RADIOTYPE_GQRX
+    radioConn = None
 
     if len(args.sdrsharp) > 0:
         radio = args.sdrsharp
         radioType = RADIOTYPE_SDRSHARP
-        BUFFER_SIZE=200
-        radioCommand='{"Command": "Set", "Method": "Frequency","Value": <frequency>}'
         
     if len(radio) > 0:
         if args.freq == 0.0:
@@ -238,98 +466,84 @@ if __name__ == '__main__':
             exit(1)
 
         useRadio = True
-        hostparams=radio.split(":")
-        host=hostparams[0]
-        if len(hostparams) > 1:
-            port=int(hostparams[1])
-
-        # Now let's see if we can connect:
-        if not netPortFreq:
-            netPortFreq = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        
-            try:
-                netPortFreq.connect((host, port))
-                netPortFreq.settimeout(0.5)
-            except Exception as e:
-                netPortFreq = None
-                print("ERROR: Unable to connect to radio at " + args.radio + ". Error: " + str(e))
-
-    if ((args.rotorleftlimit != -1 and args.rotorrightlimit == -1) or
-        (args.rotorleftlimit == -1 and args.rotorrightlimit != -1)):
-        print("ERROR: if one limit is provided, both left/right must be set.")
-        exit(2)
-        
-    if float(args.rotorleftlimit) > 360.0 or (float(args.rotorleftlimit) < 0.0 and args.rotorleftlimit != -1):
-        print("ERROR: bad limit value.")
-        exit(2)
-        
-    if float(args.rotorrightlimit) > 360.0 or (float(args.rotorrightlimit) < 0.0 and args.rotorrightlimit != -1):
-        print("ERROR: bad limit value.")
-        exit(2)
-        
-    if args.rotorleftlimit != -1 and args.rotorrightlimit != -1:
-        usingRotorLimits = True
-        
-        # Depending on where your target is, left/right could span 0 degrees.  In that scenario,
-        # the left limit will be greater than the right limit (e.g. 330 degrees left, 30 degrees right)
-        if args.rotorleftlimit <= args.rotorrightlimit:
-            rotorLimitsReversed = False
-        else:
-            rotorLimitsReversed = True
-    else:
-        usingRotorLimits = False
-        rotorLimitsReversed = False
-        
-    # Calculate observer's position
-    topoPosition = Topos(float(args.lat), float(args.long))
-    observer = earth + topoPosition
+        radioConn = RadioConnection(radio, radioType, int(args.radiopipeline))
 
-    if len(datestr) > 0:
-        targetTime = parser.parse(datestr)
-        t = ts.utc(targetTime.year, targetTime.month,  targetTime.day,  targetTime.hour, targetTime.minute, targetTime.second)
-    else:
-        t = ts.now()
-        targetTime = datetime.now()
-        
-    deltaT = 10
+    # Keep updating while there's a device to drive, or records to stream for the current time
+    tracking = useRadio or useRotor or (output is not None and len(datestr) == 0)
+
+    ephemTable = None
+    rotorWindows = None
+    lastStatusTime = 0.0
+    scheduler = DeadlineScheduler(delay, leadTime)
+    riseSetCache = RiseSetCache(ts, args.risesetcache if len(args.risesetcache) > 0 else None)
+
+    metrics.addCollector(schedulerCollector(scheduler))
+    if radioConn:
+        radioConn.metrics = metrics
+        metrics.addCollector(radioCollector(radioConn))
     
     try:
-        while (firstTime or useRadio or useRotor):
+        while (firstTime or tracking):
             firstTime = False
+            tickStart = time.perf_counter()
 
-            now = datetime.now()
-            utcnow = datetime.utcnow()
+            # In sub-second mode the radio/rotor run at full rate but the display is throttled to once a second.
+            # --output replaces the display.
+            showStatus = output is None and (delay >= 1.0 or (time.monotonic() - lastStatusTime) >= 1.0)
             
-            print("\nCurrent Time: " + now.strftime("%m/%d/%Y %H:%M:%S") + "  (" + utcnow.strftime("%m/%d/%Y %H:%M:%S") + " UTC)")
-            if len(datestr) > 0:
-                print("Calculating for: " + datestr + " UTC")
- 
-            print('Target: ' + args.body)
+            if showStatus:
+                lastStatusTime = time.monotonic()
+                now = datetime.now()
+                utcnow = datetime.utcnow()
+                
+                print("\nCurrent Time: " + now.strftime("%m/%d/%Y %H:%M:%S") + "  (" + utcnow.strftime("%m/%d/%Y %H:%M:%S") + " UTC)")
+                if len(datestr) > 0:
+                    print("Calculating for: " + datestr + " UTC")
+     
+                print('Target: ' + args.body)
             
             # For the radio, we're using real time
-            if useRadio or useRotor:
-                t = ts.now()
+            if tracking:
+                # State is computed for when this tick's commands take effect, not when we woke up
+                tickTime = scheduler.tickTime()
+                tickTimestamp = tickTime.timestamp()
+                t = ts.from_datetime(tickTime)
                 targetTime = datetime.now()
 
-            astrometric = observer.at(t).observe(target)
-            elevationTmp, azimuthTmp, dist_AU = astrometric.apparent().altaz()
+                # Serve the tick from the precomputed table, rebuilding it once we run off the end
+                if ephemTable is None or not ephemTable.covers(t):
+                    tableStart = time.perf_counter()
+                    if tableCache is not None:
+                        ephemTable = tableCache.getTable(ts, observer, target, t, tableWindow, tableStep, planets, planetaryBody, args.interpolation)
+                        print("[Info] Position table for %d samples (table cache: %d hits, %d misses)" % (len(ephemTable), tableCache.hits, tableCache.misses))
+                    else:
+                        ephemTable = EphemerisTable(ts, observer, target, t, tableWindow, tableStep, planets, planetaryBody, args.interpolation)
+                        tableError = ephemTable.interpolationError(float(args.freq))
+                        print("[Info] Precomputed %d positions (%s interpolation).  Max interpolation error: az %.3g deg, el %.3g deg, doppler %.3g Hz" %
+                              (len(ephemTable), args.interpolation, tableError['azimuth'], tableError['elevation'], tableError['doppler']))
+
+                    if useRotor and rotorLimits.hasLimits():
+                        # Check the whole table against the limits once rather than finding out tick by tick
+                        tableTimestamps = ephemTable.times[0].utc_datetime().timestamp() + ephemTable.offsets
+                        rotorWindows = reachableWindows(tableTimestamps, rotorLimits.reachable(ephemTable.azimuth, ephemTable.elevation, azoffset))
+                        print("[Info] Rotor reachable (UTC): " + describeWindows(rotorWindows))
+
+                    metrics.observeStage('table', time.perf_counter() - tableStart)
+                    
+                with metrics.stage('ephemeris'):
+                    azimuth, elevation, distance_meters, relativeVelocity, illumination = ephemTable.lookup(t)
+            else:
+                from skyfield import almanac
 
-            azimuth = azimuthTmp.to('deg').value
-            elevation = elevationTmp.to('deg').value
-            distance_meters = dist_AU.to("m").value
-            distance=dist_AU.to("m").value*0.00062137
+                # Radial velocity comes from the same solve's velocity vector, no second ephemeris call needed
+                with metrics.stage('ephemeris'):
+                    azimuth, elevation, distance_meters, relativeVelocity = computeTopocentric(observer, target, t)
+                with metrics.stage('illumination'):
+                    illumination = almanac.fraction_illuminated(planets,planetaryBody,t)
 
-            futureTime = t.utc_datetime()
-            futureTime = futureTime + timedelta(seconds=int(deltaT))
+                tickTimestamp = t.utc_datetime().timestamp()
 
-            futureT = ts.utc(futureTime.year, futureTime.month,  futureTime.day,  futureTime.hour, futureTime.minute, futureTime.second)
-            astrometricFuture = observer.at(futureT).observe(target)
-            elevationTmp, azimuthTmp, dist_AU = astrometricFuture.apparent().altaz()
-            futureDistance = dist_AU.to("m").value
-            
-            # This will calculate in m/s
-            # moon - moonFuture will produce the correct sign, - for towards, + for away
-            relativeVelocity=(futureDistance - distance_meters) / float(deltaT)
+            distance=distance_meters*0.00062137
 
             # Check if we have to notify the radio about AOS (Acquisition of Signal) / LOS (Loss of Signal)
             if (useRadio and args.send_aos_los):
@@ -337,177 +551,128 @@ if __name__ == '__main__':
                     # See if we transitioned up:
                     if lastElevation < aos_elevation:
                         # We transitioned:
-                        message="AOS\n"
-                        netPortFreq.send(bytes(message.encode()))
-                        data = netPortFreq.recv(BUFFER_SIZE)
-                        result=data.decode('utf8')
+                        with metrics.stage('radio'):
+                            radioConn.sendAosLos("AOS\n")
                 else:
                     # See if we transitioned down:
                     if lastElevation >= aos_elevation:
                         # We transitioned:
-                        message="LOS\n"
-                        netPortFreq.send(bytes(message.encode()))
-                        data = netPortFreq.recv(BUFFER_SIZE)
-                        result=data.decode('utf8')
+                        with metrics.stage('radio'):
+                            radioConn.sendAosLos("LOS\n")
                     
                 lastElevation = elevation
                 
             if len(args.rotor) > 0:
-                # check our limits if we have any
-                executeMove = True
-                
                 trueAz = azimuth + azoffset
                 if trueAz > 360.0:
                     trueAz = trueAz - 360.0
                 elif trueAz < 0.0:
                     trueAz = trueAz + 360.0
                 
-                if usingRotorLimits:
-                    if rotorLimitsReversed:
-                        # if we're less than the left limit but not within the right limit, don't move
-                        if trueAz < float(args.rotorleftlimit) and trueAz > float(args.rotorrightlimit):
-                            executeMove = False
-                    else:
-                        # if we're not between our set limits, don't move
-                        if trueAz < float(args.rotorleftlimit) or trueAz > float(args.rotorrightlimit):
-                            executeMove = False
-                        
-                    if args.rotorelevationlimit != -1:
-                        if elevation > float(args.rotorelevationlimit):
-                            executeMove = False
-                            
-                    if executeMove:
-                        retVal = RCmoveToPosition(args.rotor, int(args.rotortype),  int(args.rotorbaud),  trueAz,  elevation)
-                    else:
-                        print('[Info] Rotor would violate user-configured limits.  No move sent.')
-                else:
-                    if args.rotorelevationlimit != -1:
-                        if elevation > float(args.rotorelevationlimit):
-                            executeMove = False
-                            
-                    if executeMove:
-                        retVal = RCmoveToPosition(args.rotor, int(args.rotortype),  int(args.rotorbaud),  trueAz,  elevation)
+                # check our limits if we have any
+                if rotorLimits.reachable(azimuth, elevation, azoffset):
+                    # Drops moves inside the deadband and picks the lead/wrap to command
+                    rotorCommand = rotorPlanner.plan(time.monotonic(), trueAz, elevation)
+                    if rotorCommand is not None:
+                        with metrics.stage('rotor'):
+                            retVal = RCmoveToPosition(args.rotor, int(args.rotortype),  int(args.rotorbaud),  rotorCommand[0],  rotorCommand[1], rotorPlanner.azRange)
+                        if retVal == 0:
+                            rotorPlanner.commit(time.monotonic())
+                            metrics.observeRtt(args.rotor, getRotor(args.rotor).lastLatency)
+                elif showStatus:
+                    nextStart = None
+                    if rotorWindows is not None:
+                        nextStart = nextReachable(rotorWindows, tickTimestamp)
+
+                    if nextStart is not None:
+                        print('[Info] Rotor would violate user-configured limits.  No move sent.  Reachable again in %.0f seconds.' % (nextStart - tickTimestamp))
                     else:
                         print('[Info] Rotor would violate user-configured limits.  No move sent.')
                 
-            print("\nGeo Aziumuth:\t%.2f degrees" % azimuth)
-            if azoffset != 0.0:
-                print("Mag Aziumuth:\t%.2f degrees" % trueAz)
-                
-            print("Elevation:\t%.2f degrees" % elevation)
-            print("Distance:\t%.2f miles  / %.2f km" % (distance, (distance_meters/1000.0)))
-            print("Percent illumination:\t%.2f%%" % (almanac.fraction_illuminated(planets,planetaryBody,t)*100.0))
-            print("Relative Velocity:\t%.2f m/s [- is towards, + is away]" % (relativeVelocity,))
             if args.freq != 0:
-                print("\nFrequency: %.2f Hz" % float(args.freq))
                 dopplerFreq = doppler_shift(float(args.freq),relativeVelocity)
                 dopplerShift = dopplerFreq - float(args.freq)
-                print("Doppler Shift: %.2f Hz" % dopplerShift)
-                print("Doppler Frequency: %.2f Hz" % dopplerFreq)
-
-            local_tz = get_localzone()
-            # Get now in local time
-            timeCheck = datetime.now(local_tz)
-            # Get hour zero and end of day in local time
-            startTime = newtime=timeCheck - timedelta(hours=timeCheck.hour) - timedelta(minutes=timeCheck.minute) - timedelta(seconds=timeCheck.second)
-            endTime = newtime=startTime + timedelta(hours=23) +  timedelta(minutes=59) + timedelta(seconds=59)
-            # convert to UTC
-            utcStart=startTime.astimezone(pytz.utc)
-            utcEnd=endTime.astimezone(pytz.utc)
-            # Build objects and get rise/set
-            t0 = ts.utc(utcStart.year, utcStart.month, utcStart.day, utcStart.hour,  utcStart.minute,  utcStart.second)
-            t1 = ts.utc(utcEnd.year, utcEnd.month, utcEnd.day, utcEnd.hour,  utcEnd.minute,  utcEnd.second)
-            t, y = almanac.find_discrete(t0, t1, targetUpAt(observer,target))
-
-            targetrise = None
-            targetset = None
-            
-            if len(y) > 0:
-                if y[0] == True:
-                    targetrise = t[0]
-                    if len(t) > 1:
-                        targetset = t[1]
-                    else:
-                        targetset = None
-                else:
-                    if len(t) > 1:
-                        targetrise = t[1]
-                    else:
-                        targetrise = None
-                        
-                    targetset = t[0]
-
-            if targetrise is not None:
-                print("\nTarget Rise in the next 24 hours: " + targetrise.astimezone(local_tz).strftime("%m/%d/%Y %H:%M:%S") + " [" + str(local_tz) + "]")
             else:
-                print("\nTarget Rise in the next 24 hours: None")
+                dopplerFreq = None
+
+            if output is not None:
+                with metrics.stage('output'):
+                    output.write(args.body, TrackState(tickTimestamp, float(azimuth), float(elevation), float(distance_meters), float(relativeVelocity),
+                                                       float(dopplerFreq) if dopplerFreq is not None else None, float(illumination)))
+
+            if showStatus:
+                statusStart = time.perf_counter()
+                print("\nGeo Aziumuth:\t%.2f degrees" % azimuth)
+                if azoffset != 0.0:
+                    print("Mag Aziumuth:\t%.2f degrees" % trueAz)
                 
-            if targetset is not None:
-                print("Target Set in the next 24 hours: " + targetset.astimezone(local_tz).strftime("%m/%d/%Y %H:%M:%S") + " [" + str(local_tz) + "]")
-            else:
-                print("\nTarget Set in the next 24 hours: None")
+                print("Elevation:\t%.2f degrees" % elevation)
+                print("Distance:\t%.2f miles  / %.2f km" % (distance, (distance_meters/1000.0)))
+                print("Percent illumination:\t%.2f%%" % (illumination*100.0))
+                print("Relative Velocity:\t%.2f m/s [- is towards, + is away]" % (relativeVelocity,))
+                if useRotor:
+                    print(rotorPlanner.summary())
+                if useRotor and getRotor(args.rotor).lastLatency is not None:
+                    print("Rotor Ack Latency:\t%.1f ms (avg %.1f ms)" % (getRotor(args.rotor).lastLatency*1000.0, getRotor(args.rotor).averageLatency()*1000.0))
+                if args.freq != 0:
+                    print("\nFrequency: %.2f Hz" % float(args.freq))
+                    print("Doppler Shift: %.2f Hz" % dopplerShift)
+                    print("Doppler Frequency: %.2f Hz" % dopplerFreq)
+
+                local_tz = get_localzone()
+                # Get now in local time
+                timeCheck = datetime.now(local_tz)
+                # Rise/set only changes once a local day, so this is served from the cache after the first call
+                with metrics.stage('riseset'):
+                    targetrise, targetset = riseSetCache.get(planetaryBody, args.lat, args.long, observer, target, timeCheck)
+
+                if targetrise is not None:
+                    print("\nTarget Rise in the next 24 hours: " + targetrise.astimezone(local_tz).strftime("%m/%d/%Y %H:%M:%S") + " [" + str(local_tz) + "]")
+                else:
+                    print("\nTarget Rise in the next 24 hours: None")
+                
+                if targetset is not None:
+                    print("Target Set in the next 24 hours: " + targetset.astimezone(local_tz).strftime("%m/%d/%Y %H:%M:%S") + " [" + str(local_tz) + "]")
+                else:
+                    print("\nTarget Set in the next 24 hours: None")
 
-            print("")
+                print("")
+                metrics.observeStage('status', time.perf_counter() - statusStart)
 
             if useRadio:
-                #message="F " + str(dopplerFreq) + "\n"
-                message = radioCommand.replace("<frequency>", str(int(dopplerFreq)))
-                if netPortFreq:
-                    try:
-                        netPortFreq.send(bytes(message.encode()))
-                        data = netPortFreq.recv(BUFFER_SIZE)
-                        result=data.decode('utf8')
-                        
-                        if len(result) > 0:
-                            if (radioType == RADIOTYPE_GQRX):
-                                if not ('RPRT 0' in result):
-                                    print("ERROR setting frequency.  Radio returned error message:" + result)
-                            else:
-                                if (radioType == RADIOTYPE_SDRSHARP):
-                                    if not ('{"Result":"OK"}' in result):
-                                        if 'Not tunable' in result:
-                                            print("ERROR: Does not look like the receiver is started.  Start SDRSharp receiving then tuning should work.")
-                                        else:
-                                            print("ERROR setting frequency.  Radio returned error message:" + result)
-                    except Exception as e:
-                        print("ERROR sending data to radio: " + str(e) + " (" + str(e.errno) + ")")
-                        if e.errno == 32:
-                            # Attempt to reconnect
-                            netPortFreq.close()
-                            netPortFreq = None
-                            
-                        if e.errno == 32 or e.errno == 9:
-                            try:
-                                print("Attempting to reconnect to radio...")
-                                netPortFreq = None
-                                netPortFreq = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                                netPortFreq.connect((host, port))
-                                print("Reconnected.")
-                            except Exception as e:
-                                print("ERROR: Unable to reconnect to radio at " + args.radio + ". Error: " + str(e))
-                        else:
-                            print("ERROR: Unable to talk to radio at " + args.radio + ". Error: " + str(e))
+                with metrics.stage('radio'):
+                    radioConn.setFrequency(dopplerFreq)
+
+            metrics.observeStage('tick', time.perf_counter() - tickStart)
                     
-            if useRadio or useRotor:
-                print("Sleeping " + str(delay) + " seconds...")
-                time.sleep(delay)
+            if tracking:
+                metrics.maybeLog()
+                if showStatus:
+                    print(scheduler.summary())
+                    print("Next update in " + str(delay) + " seconds...")
+                scheduler.wait()
     except KeyboardInterrupt:
         pass
 
-    if netPortFreq:
-        try:
-            netPortFreq.close()
-            netPortFreq = None
-        except:
-            pass
-        
-    if netPortRotor:
-        try:
-            netPortRotor.close()
-            netPortRotor = None
-        except:
-            pass
-        
-    if useRadio:
-        s.close()
+    if radioConn:
+        # Collect the replies still in flight so they are counted
+        radioConn.flush()
 
+    if tracking:
+        print(scheduler.summary())
+        print(metrics.summary())
+
+    metrics.close()
+
+    if output is not None:
+        if tracking:
+            print(output.summary())
+        output.close()
+
+    if useRotor:
+        print(rotorPlanner.summary())
+
+    if radioConn:
+        radioConn.close()
+        
+    closeRotors()
@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+
+###################################################################
+#
+# Application: skytrackctl.py
+# Author: ghostop14
+#
+# Command line client for a skytrack.py --daemon.  Adds, removes and
+# retunes targets, changes rotor limits and shows state without restarting
+# the tracker.  Each call sends one JSON request to the control socket and
+# prints the reply.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import argparse
+import json
+
+from trackdaemon import sendCommand
+from trackdefaults import DEFAULT_CONTROL_ADDRESS
+
+# -------------------  Global Functions ----------------------------------------
+def parseSettings(items):
+    # ['freq=144000000', 'rotor=127.0.0.1:4533'] -> dict.  Numeric values are sent as numbers.
+    settings = {}
+
+    for item in items:
+        if '=' not in item:
+            raise ValueError("Expected key=value, got '" + item + "'.")
+
+        key, value = item.split('=', 1)
+        try:
+            settings[key.strip().lower()] = float(value)
+        except ValueError:
+            settings[key.strip().lower()] = value.strip()
+
+    return settings
+
+def buildRequest(command, params):
+    if command == 'add':
+        if len(params) != 1:
+            raise ValueError("add takes one target specification, e.g. body=mars,freq=144000000,rotor=127.0.0.1:4533")
+        return {'command': 'add', 'target': params[0]}
+    elif command == 'remove':
+        if len(params) != 1:
+            raise ValueError("remove takes the name (or body) of the target to remove.")
+        return {'command': 'remove', 'target': params[0]}
+    elif command == 'set':
+        if len(params) < 2:
+            raise ValueError("set takes a body and one or more key=value settings (freq, radio, sdrsharp, rotor, rotortype, rotorbaud).")
+        request = parseSettings(params[1:])
+        # Addresses stay strings even if they look like numbers
+        for key in ('radio', 'sdrsharp', 'rotor'):
+            if key in request:
+                request[key] = str(request[key])
+        request.update({'command': 'set', 'target': params[0]})
+        return request
+    elif command == 'limits':
+        request = parseSettings(params)
+        request['command'] = 'limits'
+        return request
+
+    return {'command': command}
+
+def printState(reply):
+    print("%-20s %10s %10s %16s %12s %8s %18s" % ("Target", "Azimuth", "Elevation", "Distance (km)", "Vel (m/s)", "Illum", "Doppler Freq (Hz)"))
+
+    for curState in reply['targets']:
+        if 'azimuth' not in curState:
+            print("%-20s %10s" % (curState['target'], "(pending)"))
+            continue
+
+        if curState['doppler'] is not None:
+            freqStr = "%.2f" % curState['doppler']
+        else:
+            freqStr = "-"
+
+        print("%-20s %10.2f %10.2f %16.2f %12.2f %7.2f%% %18s" % (curState['target'], curState['azimuth'], curState['elevation'],
+                                                                 curState['range']/1000.0, curState['rangeRate'], curState['illumination']*100.0, freqStr))
+
+    limits = reply['limits']
+    print("\nRotor limits: left %g, right %g, elevation %g%s" % (limits['left'], limits['right'], limits['elevation'],
+                                                                 ", horizon mask" if limits['horizonmask'] else ""))
+    if reply['scheduler'] is not None:
+        print("Scheduler: %d ticks, %d missed deadlines" % (reply['scheduler']['ticks'], reply['scheduler']['missed']))
+    print("Up %.0f seconds, %d control commands" % (reply['uptime'], reply['commands']))
+
+# ----------------------  Main Code -------------------------------------------------------
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Control a running skytrack.py --daemon',
+                                        epilog="Commands: add <target spec> | remove <target> | set <target> key=value ... | " +
+                                               "limits [left=<deg>] [right=<deg>] [elevation=<deg>] | state | stop")
+    argparser.add_argument('--control', help="Daemon control socket (Unix socket path or TCP port / host:port).  Default is " + DEFAULT_CONTROL_ADDRESS, default=DEFAULT_CONTROL_ADDRESS, required=False)
+    argparser.add_argument('--json', help="Print the raw JSON reply", default=False, action='store_true', required=False)
+    argparser.add_argument('command', help="add, remove, set, limits, state or stop", choices=['add', 'remove', 'set', 'limits', 'state', 'stop'])
+    argparser.add_argument('params', help="Command parameters", nargs='*')
+
+    args = argparser.parse_args()
+
+    try:
+        request = buildRequest(args.command, args.params)
+    except ValueError as e:
+        print("ERROR: " + str(e))
+        exit(1)
+
+    try:
+        reply = sendCommand(args.control, request)
+    except (OSError, ValueError) as e:
+        print("ERROR: Unable to talk to the daemon at " + args.control + ": " + str(e))
+        exit(2)
+
+    if args.json:
+        print(json.dumps(reply, indent=2))
+    elif not reply.get('ok'):
+        print("ERROR: " + reply.get('error', 'unknown error'))
+    elif args.command == 'state':
+        printState(reply)
+    else:
+        print("OK")
+
+    exit(0 if reply.get('ok') else 3)
@@ -0,0 +1,172 @@
+###################################################################
+#
+# Module: tablecache.py
+# Author: ghostop14
+#
+# On-disk cache of precomputed ephemeris tables.  Restarting skytrack.py
+# mid-pass, or running several trackers for the same body and site, would
+# otherwise solve the same az/el/range series again each time.  Tables are
+# stored as .npz files keyed by body, observer, time span, step and kernel,
+# start on a fixed grid so separate runs land on the same key, and the
+# least recently used files are evicted once the cache passes its size limit.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import glob
+import hashlib
+import math
+import os
+
+import numpy as np
+
+from ephemtable import EphemerisTable, buildTargetTables, SECONDS_PER_DAY, INTERPOLATION_CUBIC
+from trackdefaults import DEFAULT_TABLE_CACHE_SIZE
+
+# -------------------  Global Vars -------------------------------------
+TABLE_CACHE_SUFFIX = '.npz'
+
+# -------------------  Classes ----------------------------------------
+class EphemerisTableCache(object):
+    """
+    DESCRIPTION:
+        Loads and saves EphemerisTables in a cache directory.  Table start times are snapped
+        down to a multiple of the table duration (in TT) so that any run needing a table for
+        the same window asks for the same key.  Cache files are touched on every hit so the
+        eviction order is least recently used.
+    INPUTS:
+        cacheDir (str)           = directory for cache files (created if needed)
+        kernelFile (str)         = ephemeris kernel the tables are computed from (part of the key)
+        lat (float)              = observer latitude (degrees)
+        long (float)             = observer longitude (degrees)
+        altitude (float)         = observer altitude (meters)
+        maxSize (float)          = cache size limit in MB
+    """
+    def __init__(self, cacheDir, kernelFile, lat, long, altitude=0.0, maxSize=DEFAULT_TABLE_CACHE_SIZE):
+        self.cacheDir = cacheDir
+        self.lat = float(lat)
+        self.long = float(long)
+        self.altitude = float(altitude)
+        self.maxBytes = int(float(maxSize) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+        # A replaced or re-trimmed kernel must not serve old tables
+        kernelPath = os.path.realpath(kernelFile)
+        try:
+            kernelStat = os.stat(kernelPath)
+            self.kernelId = "%s|%d|%d" % (kernelPath, kernelStat.st_size, int(kernelStat.st_mtime))
+        except OSError:
+            self.kernelId = kernelPath
+
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def alignedStart(self, ts, startTime, duration):
+        # Returns (TT seconds, Time) of the grid point at or before startTime
+        alignedSeconds = math.floor(startTime.tt * SECONDS_PER_DAY / duration) * duration
+        return alignedSeconds, ts.tt_jd(alignedSeconds / SECONDS_PER_DAY)
+
+    def makeKey(self, targetCode, alignedSeconds, duration, step, withIllumination):
+        return "%d|%.6f|%.6f|%.1f|%.3f|%.3f|%.3f|%d|%s" % (targetCode, self.lat, self.long, self.altitude, alignedSeconds,
+                                                           float(duration), float(step), int(withIllumination), self.kernelId)
+
+    def cacheFile(self, key):
+        return os.path.join(self.cacheDir, hashlib.sha1(key.encode('utf-8')).hexdigest() + TABLE_CACHE_SUFFIX)
+
+    def load(self, key):
+        # Returns the cached samples dict for key or None
+        cacheFile = self.cacheFile(key)
+
+        if not os.path.isfile(cacheFile):
+            return None
+
+        try:
+            with np.load(cacheFile) as data:
+                samples = dict((curName, data[curName]) for curName in data.files)
+
+            os.utime(cacheFile)
+            return samples
+        except Exception as e:
+            print("WARNING: Discarding unreadable table cache file " + cacheFile + ": " + str(e))
+            try:
+                os.remove(cacheFile)
+            except OSError:
+                pass
+
+            return None
+
+    def save(self, key, table):
+        cacheFile = self.cacheFile(key)
+
+        try:
+            tmpFile = cacheFile + ".tmp"
+            with open(tmpFile, 'wb') as f:
+                np.savez(f, **table.samples())
+            os.replace(tmpFile, cacheFile)
+        except Exception as e:
+            print("WARNING: Unable to write table cache file " + cacheFile + ": " + str(e))
+            return
+
+        self.evict(cacheFile)
+
+    def evict(self, keepFile=None):
+        # Removes least recently used files until the cache fits in maxBytes
+        cacheFiles = []
+        for curFile in glob.glob(os.path.join(self.cacheDir, '*' + TABLE_CACHE_SUFFIX)):
+            try:
+                fileStat = os.stat(curFile)
+                cacheFiles.append((fileStat.st_mtime, fileStat.st_size, curFile))
+            except OSError:
+                pass
+
+        totalBytes = sum(curEntry[1] for curEntry in cacheFiles)
+
+        for mtime, size, curFile in sorted(cacheFiles):
+            if totalBytes <= self.maxBytes:
+                break
+
+            if curFile == keepFile:
+                continue
+
+            try:
+                os.remove(curFile)
+                totalBytes -= size
+            except OSError:
+                pass
+
+    def getTables(self, ts, observer, targets, startTime, duration, step, planets=None, bodyNames=None,
+                  interpolation=INTERPOLATION_CUBIC):
+        # Same as ephemtable.buildTargetTables() except the tables start on the cache grid at or before
+        # startTime, and are loaded from the cache where possible.  Missing tables are built together
+        # and saved.
+        alignedSeconds, alignedTime = self.alignedStart(ts, startTime, duration)
+        withIllumination = planets is not None and bodyNames is not None
+
+        tables = [None] * len(targets)
+        # Kernel code of the body (e.g. 301 for the moon), since the name may be an alias or absent
+        keys = [self.makeKey(target.target, alignedSeconds, duration, step, withIllumination) for target in targets]
+
+        for index, key in enumerate(keys):
+            samples = self.load(key)
+            if samples is not None:
+                tables[index] = EphemerisTable(ts, observer, targets[index], alignedTime, duration, step,
+                                               interpolation=interpolation, samples=samples)
+
+        missing = [index for index in range(len(targets)) if tables[index] is None]
+        self.hits += len(targets) - len(missing)
+        self.misses += len(missing)
+
+        if len(missing) > 0:
+            builtTables = buildTargetTables(ts, observer, [targets[index] for index in missing], alignedTime, duration, step,
+                                            planets, [bodyNames[index] for index in missing] if withIllumination else None,
+                                            interpolation)
+
+            for index, curTable in zip(missing, builtTables):
+                tables[index] = curTable
+                self.save(keys[index], curTable)
+
+        return tables
+
+    def getTable(self, ts, observer, target, startTime, duration, step, planets=None, bodyName=None, interpolation=INTERPOLATION_CUBIC):
+        # Single-target version of getTables()
+        return self.getTables(ts, observer, [target], startTime, duration, step, planets,
+                              [bodyName] if bodyName is not None else None, interpolation)[0]
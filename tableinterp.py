@@ -0,0 +1,29 @@
+###################################################################
+#
+# Module: tableinterp.py
+# Author: ghostop14
+#
+# Interpolation helpers shared by the precomputed position tables
+# (ephemtable.py for skytrack, altaztable.py for radecl).  Pure numpy so
+# neither tool picks up the other's astronomy library.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import numpy as np
+
+# -------------------  Global Functions ----------------------------------------
+def unwrapDegrees(angles):
+    # Removes 0/360 jumps so a series of azimuths can be interpolated across north
+    return np.degrees(np.unwrap(np.radians(angles)))
+
+def cubicHermite(offset, x, y, dydx):
+    # Cubic Hermite interpolation of samples y (with slopes dydx) taken at x, evaluated at offset.
+    # offset may be a scalar or an array; values outside x are clamped to the end intervals.
+    idx = np.clip(np.searchsorted(x, offset, side='right') - 1, 0, len(x) - 2)
+    h = x[idx + 1] - x[idx]
+    s = (offset - x[idx]) / h
+    s2 = s * s
+    s3 = s2 * s
+
+    return ((2.0*s3 - 3.0*s2 + 1.0) * y[idx] + (s3 - 2.0*s2 + s) * h * dydx[idx] +
+            (-2.0*s3 + 3.0*s2) * y[idx + 1] + (s3 - s2) * h * dydx[idx + 1])
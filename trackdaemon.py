@@ -0,0 +1,338 @@
+###################################################################
+#
+# Module: trackdaemon.py
+# Author: ghostop14
+#
+# Daemon mode for skytrack.py.  The multi-target tracking loop keeps running
+# with the kernel, timescale, observer, rotor backends and radio connections
+# loaded, while a local control socket accepts JSON commands to add and
+# remove targets, retune them, change rotor limits and query state.  A
+# change is applied between ticks and wakes the loop, so retargeting takes
+# effect in milliseconds instead of a process restart.
+#
+# Protocol: one JSON object per line in, one JSON object per line out.
+#   {"command": "add", "target": "body=mars,freq=144000000,rotor=127.0.0.1:4533"}
+#   {"command": "remove", "target": "mars"}
+#   {"command": "set", "target": "moon", "freq": 432000000, "radio": "127.0.0.1:7356", "rotor": "127.0.0.1:4533"}
+#   {"command": "limits", "left": 330, "right": 30, "elevation": 80}
+#   {"command": "state"}
+#   {"command": "stop"}
+# Replies are {"ok": true, ...} or {"ok": false, "error": "..."}.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from datetime import datetime, timezone
+
+from multitrack import TrackTarget
+from radiocontrol import RadioConnection, RADIOTYPE_GQRX, RADIOTYPE_SDRSHARP
+from rotorcontrol import closeRotor
+from rotorlimits import RotorLimits
+from rotormotion import MotionPlanner
+from trackdefaults import DEFAULT_RADIO_PIPELINE
+
+# -------------------  Global Vars -------------------------------------
+CONTROL_TIMEOUT = 5.0  # seconds a client waits for a reply
+
+# -------------------  Global Functions ----------------------------------------
+def isTcpAddress(address):
+    # '9200', ':9200' and 'host:9200' are TCP, anything else is a Unix socket path
+    address = str(address)
+    return address.isdigit() or (':' in address and address.rsplit(':', 1)[1].isdigit())
+
+def splitTcpAddress(address):
+    address = str(address)
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+    else:
+        host, port = '', address
+
+    return (host if len(host) > 0 else '127.0.0.1'), int(port)
+
+def sendCommand(address, request, timeout=CONTROL_TIMEOUT):
+    # Sends one request dict to a running daemon and returns its reply dict
+    if isTcpAddress(address):
+        sock = socket.create_connection(splitTcpAddress(address), timeout=timeout)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(address)
+
+    try:
+        sock.sendall((json.dumps(request) + "\n").encode('utf-8'))
+
+        reply = b''
+        while b'\n' not in reply:
+            data = sock.recv(65536)
+            if not data:
+                break
+            reply += data
+    finally:
+        sock.close()
+
+    return json.loads(reply.decode('utf-8'))
+
+# -------------------  Classes ----------------------------------------
+class TrackControl(object):
+    """
+    DESCRIPTION:
+        Shared state between multitrack.runMultiTarget() and the control server.  The loop holds
+        lock for each tick; commands change the target list under the same lock and then set
+        wakeup so the loop runs a tick straight away.  Radio connections for new targets are
+        made before taking the lock so a slow radio doesn't stall tracking.
+    INPUTS:
+        planets (SpiceKernel)    = loaded ephemeris kernel
+        targets (list)           = the TrackTarget list the loop is running (changed in place)
+        rotorLimits (RotorLimits)= limits shared with the loop and every MotionPlanner (changed in place)
+        rotorMotion (dict)       = MotionPlanner settings for new targets
+        rotortype (int)          = default rotctl rotor type for new targets
+        rotorbaud (int)          = default rotor baud for new targets
+        radioPipeline (int)      = radio pipeline depth for new radio connections
+        metrics (TrackMetrics)   = metrics new radios record round trips in
+    """
+    def __init__(self, planets, targets, rotorLimits, rotorMotion, rotortype=2, rotorbaud=9600, radioPipeline=DEFAULT_RADIO_PIPELINE,
+                 metrics=None):
+        self.planets = planets
+        self.targets = targets
+        self.rotorLimits = rotorLimits
+        self.rotorMotion = rotorMotion
+        self.rotortype = rotortype
+        self.rotorbaud = rotorbaud
+        self.radioPipeline = radioPipeline
+        self.metrics = metrics
+
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        # Set by the tracking loop
+        self.scheduler = None
+
+        self.startTime = time.monotonic()
+        self.commands = 0
+
+    def findTarget(self, label):
+        for curTarget in self.targets:
+            if curTarget.label == label:
+                return curTarget
+
+        raise ValueError("Not tracking " + str(label) + ".")
+
+    def handle(self, request):
+        # Request dict -> reply dict
+        handlers = {'add': self.cmdAdd, 'remove': self.cmdRemove, 'set': self.cmdSet, 'limits': self.cmdLimits,
+                    'state': self.cmdState, 'stop': self.cmdStop}
+
+        if not isinstance(request, dict) or request.get('command') not in handlers:
+            return {'ok': False, 'error': "Expected a JSON object with a command of: " + ", ".join(handlers)}
+
+        self.commands += 1
+
+        try:
+            reply = handlers[request['command']](request)
+        except (ValueError, KeyError, TypeError) as e:
+            return {'ok': False, 'error': str(e)}
+
+        reply['ok'] = True
+        return reply
+
+    def cmdAdd(self, request):
+        newTarget = TrackTarget(str(request['target']), self.planets, self.rotortype, self.rotorbaud, True, self.radioPipeline)
+        newTarget.motion = MotionPlanner(**self.rotorMotion)
+        if newTarget.radio:
+            newTarget.radio.metrics = self.metrics
+
+        with self.lock:
+            if any(curTarget.label == newTarget.label for curTarget in self.targets):
+                newTarget.close()
+                raise ValueError("Already tracking " + newTarget.label + ".")
+
+            self.targets.append(newTarget)
+
+        self.wakeup.set()
+        print("[Info] Control: added " + newTarget.label)
+        return {'target': newTarget.label}
+
+    def cmdRemove(self, request):
+        with self.lock:
+            oldTarget = self.findTarget(request['target'])
+            self.targets.remove(oldTarget)
+
+        oldTarget.close()
+        print("[Info] Control: removed " + oldTarget.label)
+        return {'target': oldTarget.label}
+
+    def cmdSet(self, request):
+        # Any of freq, radio, sdrsharp, rotor, rotortype, rotorbaud.  An empty radio/rotor turns it off.
+        label = request['target']
+        with self.lock:
+            self.findTarget(label)
+
+        newRadio = None
+        if 'radio' in request or 'sdrsharp' in request:
+            radioType = RADIOTYPE_SDRSHARP if 'sdrsharp' in request else RADIOTYPE_GQRX
+            radioAddress = str(request.get('sdrsharp', request.get('radio', '')))
+
+            if len(radioAddress) > 0:
+                newRadio = RadioConnection(radioAddress, radioType, self.radioPipeline)
+                newRadio.metrics = self.metrics
+
+        with self.lock:
+            curTarget = self.findTarget(label)
+            oldRadio = None
+
+            if 'freq' in request:
+                curTarget.freq = float(request['freq'])
+
+            if 'radio' in request or 'sdrsharp' in request:
+                oldRadio = curTarget.radio
+                curTarget.radio = newRadio
+                curTarget.radioAddress = newRadio.radio if newRadio else ""
+                if newRadio:
+                    curTarget.radioType = newRadio.radioType
+
+            if 'rotor' in request or 'rotortype' in request or 'rotorbaud' in request:
+                curTarget.rotor = str(request.get('rotor', curTarget.rotor))
+                rotortype = int(request.get('rotortype', curTarget.rotortype))
+                rotorbaud = int(request.get('rotorbaud', curTarget.rotorbaud))
+
+                if ':' not in curTarget.rotor and (rotortype, rotorbaud) != (curTarget.rotortype, curTarget.rotorbaud):
+                    # A serial rotor's rotctld was started with the old model and baud.  Restart it with the
+                    # new ones, which then apply to every target sharing that port.
+                    closeRotor(curTarget.rotor)
+                    for otherTarget in self.targets:
+                        if otherTarget.rotor == curTarget.rotor:
+                            otherTarget.rotortype = rotortype
+                            otherTarget.rotorbaud = rotorbaud
+
+                curTarget.rotortype = rotortype
+                curTarget.rotorbaud = rotorbaud
+                # The new rotor's position is unknown
+                curTarget.motion = MotionPlanner(**self.rotorMotion)
+
+        if oldRadio:
+            oldRadio.close()
+
+        self.wakeup.set()
+        print("[Info] Control: updated " + label)
+        return {'target': label}
+
+    def cmdLimits(self, request):
+        # Any of left, right, elevation (-1 for no limit).  The horizon mask is kept.
+        with self.lock:
+            newLimits = RotorLimits(request.get('left', self.rotorLimits.left), request.get('right', self.rotorLimits.right),
+                                    request.get('elevation', self.rotorLimits.elevation), self.rotorLimits.horizonMask)
+
+            # In place, since the loop and every MotionPlanner hold this object
+            self.rotorLimits.left = newLimits.left
+            self.rotorLimits.right = newLimits.right
+            self.rotorLimits.elevation = newLimits.elevation
+
+        self.wakeup.set()
+        print("[Info] Control: rotor limits left %g, right %g, elevation %g" % (newLimits.left, newLimits.right, newLimits.elevation))
+        return {'limits': self.limitsState()}
+
+    def limitsState(self):
+        return {'left': self.rotorLimits.left, 'right': self.rotorLimits.right, 'elevation': self.rotorLimits.elevation,
+                'horizonmask': self.rotorLimits.horizonMask is not None}
+
+    def cmdState(self, request):
+        targetStates = []
+
+        with self.lock:
+            for curTarget in self.targets:
+                curState = {'target': curTarget.label, 'freq': curTarget.freq, 'radio': curTarget.radioAddress, 'rotor': curTarget.rotor}
+
+                if curTarget.state is not None:
+                    curState.update(curTarget.state.asDict())
+                    curState['time'] = datetime.fromtimestamp(curState['time'], tz=timezone.utc).isoformat()
+
+                if curTarget.radio:
+                    curState['radioAcknowledged'] = curTarget.radio.acknowledged
+                    curState['radioErrors'] = curTarget.radio.errors
+
+                if len(curTarget.rotor) > 0 and curTarget.motion is not None:
+                    curState['rotorMoves'] = curTarget.motion.sent
+
+                targetStates.append(curState)
+
+            schedulerStats = self.scheduler.stats() if self.scheduler is not None else None
+
+        return {'targets': targetStates, 'limits': self.limitsState(), 'scheduler': schedulerStats,
+                'uptime': time.monotonic() - self.startTime, 'commands': self.commands}
+
+    def cmdStop(self, request):
+        self.stopped = True
+        self.wakeup.set()
+        print("[Info] Control: stop requested")
+        return {}
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    # One JSON request per line, one JSON reply per line, for as long as the client stays connected
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError as e:
+                reply = {'ok': False, 'error': "Bad JSON: " + str(e)}
+            else:
+                reply = self.server.control.handle(request)
+
+            self.wfile.write((json.dumps(reply) + "\n").encode('utf-8'))
+
+class TcpControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class UnixControlServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    UnixControlServer = None
+
+def startControlServer(control, address):
+    # Serves control on a Unix socket path or a TCP port / host:port (bound to 127.0.0.1 unless a host
+    # is given) from a background thread.  Raises OSError if the address is in use.
+    if isTcpAddress(address):
+        server = TcpControlServer(splitTcpAddress(address), ControlRequestHandler)
+    else:
+        if UnixControlServer is None:
+            raise OSError("Unix sockets are not available here.  Use a TCP port for the control address.")
+
+        if os.path.exists(address):
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise OSError(address + " exists and is not a socket.")
+
+            try:
+                sendCommand(address, {'command': 'state'}, timeout=1.0)
+                raise OSError("A daemon is already listening on " + address + ".")
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a daemon that didn't exit cleanly
+                os.remove(address)
+
+        server = UnixControlServer(address, ControlRequestHandler)
+
+    server.control = control
+    serverThread = threading.Thread(target=server.serve_forever, name='trackcontrol', daemon=True)
+    serverThread.start()
+
+    return server
+
+def stopControlServer(server, address):
+    server.shutdown()
+    server.server_close()
+
+    if not isTcpAddress(address):
+        try:
+            os.remove(address)
+        except OSError:
+            pass
@@ -0,0 +1,40 @@
+###################################################################
+#
+# Module: trackdefaults.py
+# Author: ghostop14
+#
+# Default values shared by skytrack.py's command line and the tracking
+# modules.  Kept free of numpy/skyfield imports so the argument parser can
+# be built (and --help, --listbodies and argument errors answered) without
+# loading any of the heavy libraries.
+##################################################################
+
+# -------------------  Global Vars -------------------------------------
+DEFAULT_KERNEL = 'de421.bsp'
+
+# Defaults used by skytrack when building a tracking table
+DEFAULT_TABLE_WINDOW = 3600.0  # seconds
+DEFAULT_TABLE_STEP = 10.0  # seconds
+
+INTERPOLATION_LINEAR = 'linear'
+INTERPOLATION_CUBIC = 'cubic'
+
+DEFAULT_TABLE_CACHE_SIZE = 100  # MB
+
+DEFAULT_DEVICE_TIMEOUT = 2.0  # seconds for a connect or a command round trip
+
+DEFAULT_METRICS_INTERVAL = 10.0  # seconds between metrics log lines
+
+DEFAULT_RADIO_PIPELINE = 1  # frequency commands in flight before waiting for a reply (1 = wait for each)
+
+DEFAULT_CONTROL_ADDRESS = 'skytrack.sock'  # daemon control socket (a Unix socket path, or a TCP port / host:port)
+
+OUTPUT_FORMAT_NDJSON = 'ndjson'
+OUTPUT_FORMAT_BINARY = 'binary'
+DEFAULT_OUTPUT_FLUSH = 0.1  # seconds machine-readable records are buffered before being written
+
+EXPORT_FORMAT_CSV = 'csv'
+EXPORT_FORMAT_NPY = 'npy'
+EXPORT_FORMAT_PARQUET = 'parquet'
+DEFAULT_EXPORT_STEP = 60.0  # seconds between exported samples
+DEFAULT_EXPORT_CHUNK = 20000  # times solved and written per chunk, bounding memory on long ranges
@@ -0,0 +1,192 @@
+###################################################################
+#
+# Module: tracker.py
+# Author: ghostop14
+#
+# Importable tracking API, for using skytrack's ephemeris in-process (e.g.
+# from a GNU Radio block or a service) instead of running skytrack.py and
+# parsing its output.  A Tracker loads the kernel once (or shares one that
+# is already loaded) and serves positions, range-rate, doppler and
+# illumination from the same precomputed tables as the tracking loops.
+# states() is a generator that yields one compact TrackState per tick on
+# fixed deadlines; stateArray() evaluates many times at once into a numpy
+# structured array.
+#
+#   from tracker import Tracker
+#   moon = Tracker('moon', lat=40.0, long=-75.0, freq=144000000)
+#   for state in moon.states(delay=0.1):
+#       print(state.azimuth, state.elevation, state.doppler)
+##################################################################
+
+# -----------------------imports -------------------------------------
+from datetime import datetime, timezone
+
+import numpy as np
+
+from ephemtable import EphemerisTable, computeTopocentric, doppler_shift, resolveBody
+from trackdefaults import DEFAULT_KERNEL, DEFAULT_TABLE_WINDOW, DEFAULT_TABLE_STEP, INTERPOLATION_CUBIC
+from trackscheduler import DeadlineScheduler
+
+# -------------------  Global Vars -------------------------------------
+STATE_FIELDS = ('time', 'azimuth', 'elevation', 'range', 'rangeRate', 'doppler', 'illumination')
+
+# stateArray() records.  time is a UTC POSIX timestamp, doppler and illumination are NaN when not available.
+STATE_DTYPE = np.dtype([(curField, np.float64) for curField in STATE_FIELDS])
+
+# -------------------  Global Functions ----------------------------------------
+def timestampsToTime(ts, timestamps):
+    # Array of UTC POSIX timestamps -> skyfield Time array.  POSIX days are always 86400 seconds, so
+    # whole days and seconds into the day are passed separately to keep leap seconds out of the count.
+    days = np.floor(timestamps / 86400.0)
+    return ts.utc(1970, 1, 1 + days, 0, 0, timestamps - days * 86400.0)
+
+def computeStates(planets, observer, target, bodyName, freq, times, timestamps, observerAt=None):
+    # Exact batched solve for one target over a skyfield Time array into a STATE_DTYPE array.
+    # timestamps are the same times as POSIX seconds.  observerAt is an optional precomputed
+    # observer.at(times) shared by several targets.
+    from skyfield import almanac
+
+    azimuth, elevation, distance, rangeRate = computeTopocentric(observer, target, times, observerAt)
+
+    states = np.empty(len(timestamps), dtype=STATE_DTYPE)
+    states['time'] = timestamps
+    states['azimuth'] = azimuth
+    states['elevation'] = elevation
+    states['range'] = distance
+    states['rangeRate'] = rangeRate
+    states['doppler'] = doppler_shift(freq, rangeRate) if freq != 0.0 else np.nan
+    states['illumination'] = almanac.fraction_illuminated(planets, bodyName, times)
+
+    return states
+
+# -------------------  Classes ----------------------------------------
+class TrackState(object):
+    """
+    DESCRIPTION:
+        One tracking sample.  __slots__ keeps it small and quick to create at high tick rates.
+    INPUTS:
+        time (float)             = UTC POSIX timestamp the state is for
+        azimuth (float)          = degrees
+        elevation (float)        = degrees
+        range (float)            = meters
+        rangeRate (float)        = m/s, + is moving away
+        doppler (float)          = doppler-shifted frequency in Hz (None without a frequency)
+        illumination (float)     = fraction illuminated 0-1 (None if not available)
+    """
+    __slots__ = STATE_FIELDS
+
+    def __init__(self, time, azimuth, elevation, range, rangeRate, doppler=None, illumination=None):
+        self.time = time
+        self.azimuth = azimuth
+        self.elevation = elevation
+        self.range = range
+        self.rangeRate = rangeRate
+        self.doppler = doppler
+        self.illumination = illumination
+
+    def asDict(self):
+        return {curField: getattr(self, curField) for curField in STATE_FIELDS}
+
+    def __repr__(self):
+        return "TrackState(" + ", ".join("%s=%r" % (curField, getattr(self, curField)) for curField in STATE_FIELDS) + ")"
+
+class Tracker(object):
+    """
+    DESCRIPTION:
+        One body tracked from one observer.  Single-time lookups (stateAt, states) are served
+        from an EphemerisTable that is rebuilt when a time falls outside it; stateArray solves
+        exactly over a whole array of times.  Raises ValueError or KeyError for a body not in the kernel.
+    INPUTS:
+        body (str)               = kernel body name (barycenter is tried as well, like skytrack.py)
+        lat (float)              = observer latitude in degrees
+        long (float)             = observer longitude in degrees
+        altitude (float)         = observer altitude in meters
+        freq (float)             = frequency in Hz for doppler (0 for none)
+        ephemeris (str)          = kernel file to load if planets isn't given
+        planets (SpiceKernel)    = already-loaded kernel to share between trackers
+        ts (Timescale)           = already-loaded timescale to share between trackers
+        tableWindow (float)      = seconds covered by each precomputed table
+        tableStep (float)        = seconds between table samples
+        interpolation (str)      = INTERPOLATION_CUBIC or INTERPOLATION_LINEAR
+        tableCache (EphemerisTableCache) = optional tablecache to load/save tables through
+    """
+    def __init__(self, body, lat, long, altitude=0.0, freq=0.0, ephemeris=DEFAULT_KERNEL, planets=None, ts=None,
+                 tableWindow=DEFAULT_TABLE_WINDOW, tableStep=DEFAULT_TABLE_STEP, interpolation=INTERPOLATION_CUBIC, tableCache=None):
+        from skyfield.api import load, Topos
+
+        self.planets = planets if planets is not None else load(ephemeris)
+        self.ts = ts if ts is not None else load.timescale()
+        self.bodyName, self.target = resolveBody(self.planets, body)
+        self.observer = self.planets['earth'] + Topos(latitude_degrees=float(lat), longitude_degrees=float(long), elevation_m=float(altitude))
+
+        self.freq = float(freq)
+        self.tableWindow = float(tableWindow)
+        self.tableStep = float(tableStep)
+        self.interpolation = interpolation
+        self.tableCache = tableCache
+        self.table = None
+
+    def toTime(self, when):
+        # None (now), a datetime (naive is taken as UTC), a POSIX timestamp or a skyfield Time -> skyfield Time
+        if when is None:
+            return self.ts.now()
+        elif isinstance(when, datetime):
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            return self.ts.from_datetime(when)
+        elif isinstance(when, (int, float)):
+            return self.ts.from_datetime(datetime.fromtimestamp(when, tz=timezone.utc))
+
+        return when
+
+    def tableFor(self, t):
+        if self.table is None or not self.table.covers(t):
+            if self.tableCache is not None:
+                self.table = self.tableCache.getTables(self.ts, self.observer, [self.target], t, self.tableWindow, self.tableStep,
+                                                       self.planets, [self.bodyName], self.interpolation)[0]
+            else:
+                self.table = EphemerisTable(self.ts, self.observer, self.target, t, self.tableWindow, self.tableStep,
+                                            self.planets, self.bodyName, self.interpolation)
+
+        return self.table
+
+    def stateAt(self, when=None):
+        # TrackState at one time (see toTime for the accepted types)
+        t = self.toTime(when)
+        azimuth, elevation, distance, rangeRate, illumination = self.tableFor(t).lookup(t)
+
+        # Skip the Time -> datetime conversion when the caller already gave us the time
+        if isinstance(when, datetime):
+            timestamp = (when if when.tzinfo is not None else when.replace(tzinfo=timezone.utc)).timestamp()
+        elif isinstance(when, (int, float)):
+            timestamp = float(when)
+        else:
+            timestamp = t.utc_datetime().timestamp()
+
+        return TrackState(timestamp, float(azimuth), float(elevation), float(distance), float(rangeRate),
+                          float(doppler_shift(self.freq, rangeRate)) if self.freq != 0.0 else None,
+                          float(illumination) if illumination is not None else None)
+
+    def states(self, delay, leadTime=0.0, count=None):
+        # Generator of TrackStates every delay seconds on fixed deadlines, each computed for when it
+        # takes effect (deadline + leadTime).  Runs forever unless count is given.
+        scheduler = DeadlineScheduler(delay, leadTime)
+        numStates = 0
+
+        while count is None or numStates < count:
+            yield self.stateAt(scheduler.tickTime())
+            numStates += 1
+
+            if count is None or numStates < count:
+                scheduler.wait()
+
+    def stateArray(self, times):
+        # Exact batched solve.  times is a skyfield Time array or an array of POSIX timestamps.
+        # Returns a numpy structured array of STATE_DTYPE, one record per time.
+        if isinstance(times, np.ndarray) or isinstance(times, (list, tuple)):
+            timestamps = np.asarray(times, dtype=np.float64)
+            times = timestampsToTime(self.ts, timestamps)
+        else:
+            timestamps = np.array([curTime.timestamp() for curTime in np.atleast_1d(times.utc_datetime())], dtype=np.float64)
+
+        return computeStates(self.planets, self.observer, self.target, self.bodyName, self.freq, times, timestamps)
@@ -0,0 +1,276 @@
+###################################################################
+#
+# Module: trackexport.py
+# Author: ghostop14
+#
+# Bulk ephemeris export for skytrack.py and radecl.py.  A UTC range is
+# split into chunks of times; each chunk is solved for every target in one
+# batched call and streamed to CSV, a .npy file or Parquet before the next is
+# computed, so a year at one second steps needs no more memory than one
+# chunk.  Used to build pass predictions and doppler correction files for
+# offline processing of recordings without running the tracker per instant.
+#
+# Records have the tracker.TrackState fields (time as UTC POSIX seconds,
+# azimuth, elevation, range, range-rate, doppler, illumination), time-major
+# with one row per target at each time.  CSV and Parquet add the target name
+# and a UTC timestamp; .npy uses trackoutput's fixed-width binary record.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import collections
+import csv
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from tracker import STATE_FIELDS
+from trackoutput import recordDtype, TARGET_NAME_SIZE
+from trackdefaults import EXPORT_FORMAT_CSV, EXPORT_FORMAT_NPY, EXPORT_FORMAT_PARQUET, DEFAULT_EXPORT_CHUNK
+
+# -------------------  Global Vars -------------------------------------
+EXPORT_FORMATS = [EXPORT_FORMAT_CSV, EXPORT_FORMAT_NPY, EXPORT_FORMAT_PARQUET]
+
+# printf formats for the CSV columns.  Empty where a value isn't available.
+CSV_FORMATS = {'time': '%.3f', 'azimuth': '%.6f', 'elevation': '%.6f', 'range': '%.3f', 'rangeRate': '%.6f',
+               'doppler': '%.3f', 'illumination': '%.6f'}
+
+# -------------------  Global Functions ----------------------------------------
+def parseUtcDate(datestr):
+    # 'year/month/day [hh:mm:ss]' (or with '-') in UTC -> POSIX timestamp
+    datestr = datestr.strip().strip('"').strip("'").replace('-', '/')
+    for curFormat in ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(datestr, curFormat).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            pass
+
+    raise ValueError("Bad date '" + datestr + "'.  Format: year/month/day [hh:mm:ss]")
+
+def exportFormatFor(filename, exportFormat=None):
+    # The format asked for, or the one the filename's extension names
+    if exportFormat:
+        return exportFormat
+
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension in EXPORT_FORMATS:
+        return extension
+    elif extension == 'pq':
+        return EXPORT_FORMAT_PARQUET
+
+    raise ValueError("Can't tell the export format of " + filename + ".  Use a .csv, .npy or .parquet name, or give the format.")
+
+def rangeLength(start, end, step):
+    # Number of samples from start to end (inclusive, if end falls on a step)
+    if step <= 0.0:
+        raise ValueError("Export step must be greater than zero.")
+    if end < start:
+        raise ValueError("Export end is before the start.")
+
+    return int(np.floor((end - start) / step + 1e-9)) + 1
+
+def rangeChunks(start, end, step, chunkSize=DEFAULT_EXPORT_CHUNK):
+    # Yields arrays of POSIX timestamps covering start..end every step seconds, chunkSize at a time.
+    # Each is computed from its index so long ranges don't accumulate rounding.
+    numSamples = rangeLength(start, end, step)
+
+    for chunkStart in range(0, numSamples, chunkSize):
+        yield start + np.arange(chunkStart, min(chunkStart + chunkSize, numSamples), dtype=np.float64) * step
+
+def utcStrings(timestamps):
+    return np.datetime_as_string(np.round(timestamps * 1e3).astype('datetime64[ms]'), unit='ms', timezone='UTC')
+
+def openExport(filename, exportFormat, names, numRecords):
+    if exportFormat == EXPORT_FORMAT_CSV:
+        return CsvExport(filename, names)
+    elif exportFormat == EXPORT_FORMAT_NPY:
+        return NpyExport(filename, names, numRecords)
+    elif exportFormat == EXPORT_FORMAT_PARQUET:
+        return ParquetExport(filename, names)
+
+    raise ValueError("Unknown export format " + str(exportFormat) + ".  Options are: " + ", ".join(EXPORT_FORMATS))
+
+def executorChunks(executor, computeChunk, chunks, maxPending):
+    # Yields computeChunk(chunk) for each chunk, in order, solving up to maxPending chunks at once in executor.
+    # Bounded so results don't pile up in memory while the file is written.
+    pending = collections.deque()
+
+    try:
+        for curChunk in chunks:
+            pending.append(executor.submit(computeChunk, curChunk))
+            if len(pending) >= maxPending:
+                yield pending.popleft().result()
+
+        while len(pending) > 0:
+            yield pending.popleft().result()
+    finally:
+        for curFuture in pending:
+            curFuture.cancel()
+
+def runExport(filename, exportFormat, names, start, end, step, computeChunk, chunkSize=DEFAULT_EXPORT_CHUNK, executor=None, maxPending=None):
+    # Solves and writes start..end every step seconds for every target in names.
+    # computeChunk(timestamps) returns a STATE_DTYPE array shaped (len(timestamps), len(names)).
+    # With a concurrent.futures executor (computeChunk then has to be a module-level function for a process
+    # pool), up to maxPending chunks (default twice the CPUs) are solved in parallel and written in order.
+    # Raises ValueError for a bad range/format or a missing optional library.
+    exportFormat = exportFormatFor(filename, exportFormat)
+    numTimes = rangeLength(start, end, step)
+    export = openExport(filename, exportFormat, names, numTimes * len(names))
+
+    print("Exporting %d times x %d targets to %s (%s)..." % (numTimes, len(names), filename, exportFormat))
+    exportStart = time.perf_counter()
+    computeTime = 0.0
+    timesDone = 0
+
+    if executor is None:
+        results = map(computeChunk, rangeChunks(start, end, step, chunkSize))
+    else:
+        if maxPending is None:
+            maxPending = 2 * (os.cpu_count() or 1)
+        results = executorChunks(executor, computeChunk, rangeChunks(start, end, step, chunkSize), maxPending)
+
+    try:
+        while True:
+            # Time spent solving, or with workers, waiting on them
+            chunkStart = time.perf_counter()
+            states = next(results, None)
+            computeTime += time.perf_counter() - chunkStart
+            if states is None:
+                break
+
+            export.write(states)
+            timesDone += len(states)
+            print("[Info] %d of %d times (%.0f%%)" % (timesDone, numTimes, 100.0 * timesDone / numTimes))
+    except KeyboardInterrupt:
+        print("[Info] Interrupted.  Keeping the %d times already exported." % timesDone)
+    finally:
+        if executor is not None:
+            # Drops the chunks still queued
+            results.close()
+        export.close()
+
+    totalTime = time.perf_counter() - exportStart
+    print("Exported %d records in %.1f s (%.1f s solving, %.0f records/s)" % (export.count, totalTime, computeTime,
+          export.count / totalTime if totalTime > 0.0 else 0.0))
+
+    return export.count
+
+# -------------------  Classes ----------------------------------------
+class CsvExport(object):
+    """
+    DESCRIPTION:
+        CSV with a header row: target, utc (ISO 8601), then the TrackState fields.  Values that
+        aren't available (e.g. doppler without a frequency) are left empty.
+    INPUTS:
+        filename (str)           = CSV file to write
+        names (list)             = target names, one per column of each chunk
+    """
+    def __init__(self, filename, names):
+        self.names = np.asarray(names, dtype=object)
+        self.file = open(filename, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['target', 'utc'] + list(STATE_FIELDS))
+        self.count = 0
+
+    def write(self, states):
+        states = states.reshape(-1)
+        columns = [np.tile(self.names, len(states) // len(self.names)), utcStrings(states['time'])]
+
+        for curField in STATE_FIELDS:
+            values = states[curField]
+            formatted = np.char.mod(CSV_FORMATS[curField], values).astype(object)
+            formatted[np.isnan(values)] = ''
+            columns.append(formatted)
+
+        self.writer.writerows(zip(*columns))
+        self.count += len(states)
+
+    def close(self):
+        self.file.close()
+
+class NpyExport(object):
+    """
+    DESCRIPTION:
+        A .npy file of trackoutput.recordDtype() records (target names cut to TARGET_NAME_SIZE
+        bytes), filled through a memory map so only the current chunk is in memory.  Load it
+        with numpy.load().  An interrupted export is cut down to the records written.
+    INPUTS:
+        filename (str)           = .npy file to write
+        names (list)             = target names, one per column of each chunk
+        numRecords (int)         = total records the export will write
+    """
+    def __init__(self, filename, names, numRecords):
+        self.filename = filename
+        self.names = np.array([curName.encode('utf-8')[:TARGET_NAME_SIZE] for curName in names], dtype='S%d' % TARGET_NAME_SIZE)
+        self.records = np.lib.format.open_memmap(filename, mode='w+', dtype=recordDtype(), shape=(int(numRecords),))
+        self.count = 0
+
+    def write(self, states):
+        states = states.reshape(-1)
+        chunk = self.records[self.count:self.count + len(states)]
+
+        chunk['target'] = np.tile(self.names, len(states) // len(self.names))
+        for curField in STATE_FIELDS:
+            chunk[curField] = states[curField]
+
+        self.count += len(states)
+
+    def close(self):
+        records = self.records
+        self.records = None
+        records.flush()
+
+        if self.count < len(records):
+            # Copy what was written to a file of the right length, a chunk at a time
+            tmpFilename = self.filename + ".tmp"
+            if self.count == 0:
+                np.save(tmpFilename, np.empty(0, dtype=records.dtype))
+                tmpFilename += ".npy"
+            else:
+                partial = np.lib.format.open_memmap(tmpFilename, mode='w+', dtype=records.dtype, shape=(self.count,))
+                for chunkStart in range(0, self.count, DEFAULT_EXPORT_CHUNK):
+                    partial[chunkStart:chunkStart + DEFAULT_EXPORT_CHUNK] = records[chunkStart:chunkStart + DEFAULT_EXPORT_CHUNK]
+                partial.flush()
+                del partial
+
+            # Both maps are released first, Windows won't replace a mapped file
+            del records
+            os.replace(tmpFilename, self.filename)
+
+class ParquetExport(object):
+    """
+    DESCRIPTION:
+        Parquet with one row group per chunk: target (string), utc (timestamp, microseconds UTC),
+        then the TrackState fields as float64, null where not available.  Needs pyarrow.
+    INPUTS:
+        filename (str)           = Parquet file to write
+        names (list)             = target names, one per column of each chunk
+    """
+    def __init__(self, filename, names):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Parquet export needs pyarrow (pip3 install pyarrow).  Use a .csv or .npy file instead.")
+
+        self.pa = pyarrow
+        self.names = np.asarray(names, dtype=object)
+        self.schema = pyarrow.schema([('target', pyarrow.string()), ('utc', pyarrow.timestamp('us', tz='UTC'))] +
+                                     [(curField, pyarrow.float64()) for curField in STATE_FIELDS])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+        self.count = 0
+
+    def write(self, states):
+        states = states.reshape(-1)
+        utc = np.round(states['time'] * 1e6).astype('datetime64[us]')
+
+        columns = [self.pa.array(np.tile(self.names, len(states) // len(self.names)), type=self.pa.string()),
+                   self.pa.array(utc, type=self.pa.timestamp('us', tz='UTC'))]
+        columns += [self.pa.array(states[curField], from_pandas=True) for curField in STATE_FIELDS]
+
+        self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+        self.count += len(states)
+
+    def close(self):
+        self.writer.close()
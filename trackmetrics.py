@@ -0,0 +1,359 @@
+###################################################################
+#
+# Module: trackmetrics.py
+# Author: ghostop14
+#
+# Hot-path instrumentation for the skytrack.py tracking loops.  Each stage of
+# a tick (table build, ephemeris lookup, rise/set, illumination, radio, rotor,
+# status output) is timed into a rolling window, along with radio and rotor
+# round trip times.  The windows are reported as percentiles in periodic JSON
+# log lines and on a local Prometheus text endpoint, together with counters
+# such as reconnects, missed deadlines and table cache hits gathered from the
+# objects that already keep them.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import collections
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from trackdefaults import DEFAULT_METRICS_INTERVAL
+
+# -------------------  Global Vars -------------------------------------
+DEFAULT_METRICS_WINDOW = 1000  # samples kept per stage/device
+METRICS_QUANTILES = (0.5, 0.9, 0.99)
+METRICS_PREFIX = 'skytrack_'
+
+STAGE_FAMILY = 'stage_seconds'
+RTT_FAMILY = 'device_rtt_seconds'
+
+FAMILY_HELP = {
+    STAGE_FAMILY: "Time spent in each tracking loop stage over the most recent samples.",
+    RTT_FAMILY: "Radio and rotor command round trip times over the most recent samples.",
+}
+
+# -------------------  Classes ----------------------------------------
+class RollingHistogram(object):
+    """
+    DESCRIPTION:
+        The most recent window samples of one timing, for percentiles, plus the count and sum
+        of every sample since start (Prometheus summary semantics).
+    INPUTS:
+        window (int)             = number of recent samples kept
+    """
+    def __init__(self, window=DEFAULT_METRICS_WINDOW):
+        self.samples = collections.deque(maxlen=int(window))
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, quantiles=METRICS_QUANTILES):
+        # Returns a list of values for quantiles (0-1) over the window, or None if empty
+        if len(self.samples) == 0:
+            return None
+
+        return list(np.quantile(np.fromiter(self.samples, dtype=np.float64, count=len(self.samples)), quantiles))
+
+    def windowMax(self):
+        if len(self.samples) == 0:
+            return None
+
+        return max(self.samples)
+
+class StageTimer(object):
+    # Context manager returned by TrackMetrics.stage()
+    __slots__ = ('metrics', 'histogram', 'startTime')
+
+    def __init__(self, metrics, histogram):
+        self.metrics = metrics
+        self.histogram = histogram
+        self.startTime = 0.0
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.metrics.observe(self.histogram, time.perf_counter() - self.startTime)
+        return False
+
+class TrackMetrics(object):
+    """
+    DESCRIPTION:
+        Stage timings and device round trips for a tracking loop.  stage() times a block,
+        observeRtt() records a device round trip, and collectors registered with addCollector()
+        supply counters and gauges (reconnects, missed deadlines, ...) from existing objects
+        when a snapshot or the Prometheus text is produced.  The Prometheus endpoint reads
+        from another thread, so recording and reading share a lock.
+    INPUTS:
+        window (int)             = samples kept per stage/device for percentiles
+    """
+    def __init__(self, window=DEFAULT_METRICS_WINDOW):
+        self.window = int(window)
+        self.histograms = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+        self.logFile = None
+        self.logInterval = DEFAULT_METRICS_INTERVAL
+        self.lastLogTime = time.monotonic()
+
+    def histogram(self, family, labelName, labelValue):
+        key = (family, labelName, labelValue)
+        curHistogram = self.histograms.get(key)
+
+        if curHistogram is None:
+            with self.lock:
+                curHistogram = self.histograms.setdefault(key, RollingHistogram(self.window))
+
+        return curHistogram
+
+    def stage(self, name):
+        # with metrics.stage('ephemeris'): ...
+        return StageTimer(self, self.histogram(STAGE_FAMILY, 'stage', name))
+
+    def observeStage(self, name, seconds):
+        self.observe(self.histogram(STAGE_FAMILY, 'stage', name), seconds)
+
+    def observeRtt(self, device, seconds):
+        if seconds is not None:
+            self.observe(self.histogram(RTT_FAMILY, 'device', device), seconds)
+
+    def observe(self, curHistogram, value):
+        with self.lock:
+            curHistogram.add(value)
+
+    def addCollector(self, collector):
+        # collector() returns a list of (name, type ('counter' or 'gauge'), help, labels dict, value)
+        self.collectors.append(collector)
+
+    def collect(self):
+        values = []
+        for collector in self.collectors:
+            try:
+                values.extend(collector())
+            except Exception as e:
+                print("WARNING: metrics collector failed: " + str(e), file=sys.stderr)
+
+        return values
+
+    def snapshot(self):
+        # Dict of percentiles (seconds) for every stage and device plus the collected counters/gauges
+        snapshot = {'time': datetime.now(timezone.utc).isoformat(), 'stages': {}, 'rtt': {}, 'counters': {}}
+
+        with self.lock:
+            for (family, labelName, labelValue), curHistogram in sorted(self.histograms.items()):
+                quantiles = curHistogram.quantiles()
+                if quantiles is None:
+                    continue
+
+                entry = {'count': curHistogram.count, 'mean': curHistogram.total / curHistogram.count, 'max': curHistogram.windowMax()}
+                for quantile, value in zip(METRICS_QUANTILES, quantiles):
+                    entry['p%g' % (quantile * 100.0)] = value
+
+                snapshot['stages' if family == STAGE_FAMILY else 'rtt'][labelValue] = entry
+
+        for name, metricType, helpText, labels, value in self.collect():
+            if value is None:
+                continue
+
+            if len(labels) > 0:
+                name += "{" + ",".join("%s=%s" % (labelName, labels[labelName]) for labelName in sorted(labels)) + "}"
+
+            snapshot['counters'][name] = value
+
+        return snapshot
+
+    def prometheusText(self):
+        # Prometheus text exposition format (0.0.4)
+        lines = []
+
+        with self.lock:
+            families = collections.OrderedDict()
+            for key in sorted(self.histograms):
+                families.setdefault(key[0], []).append(key)
+
+            for family, keys in families.items():
+                name = METRICS_PREFIX + family
+                lines.append("# HELP %s %s" % (name, FAMILY_HELP.get(family, family)))
+                lines.append("# TYPE %s summary" % name)
+
+                for curKey in keys:
+                    curHistogram = self.histograms[curKey]
+                    label = '%s="%s"' % (curKey[1], escapeLabel(curKey[2]))
+                    quantiles = curHistogram.quantiles()
+                    if quantiles is not None:
+                        for quantile, value in zip(METRICS_QUANTILES, quantiles):
+                            lines.append('%s{%s,quantile="%g"} %.9g' % (name, label, quantile, value))
+                    lines.append('%s_sum{%s} %.9g' % (name, label, curHistogram.total))
+                    lines.append('%s_count{%s} %d' % (name, label, curHistogram.count))
+
+        # Every sample of a metric has to follow its HELP/TYPE lines, and several collectors can report the same metric
+        collected = collections.OrderedDict()
+        for name, metricType, helpText, labels, value in self.collect():
+            if value is not None:
+                collected.setdefault(name, (metricType, helpText, []))[2].append((labels, value))
+
+        for name, (metricType, helpText, samples) in collected.items():
+            name = METRICS_PREFIX + name
+            lines.append("# HELP %s %s" % (name, helpText))
+            lines.append("# TYPE %s %s" % (name, metricType))
+
+            for labels, value in samples:
+                if len(labels) > 0:
+                    labelStr = "{" + ",".join('%s="%s"' % (labelName, escapeLabel(labels[labelName])) for labelName in sorted(labels)) + "}"
+                else:
+                    labelStr = ""
+
+                lines.append("%s%s %.9g" % (name, labelStr, value))
+
+        return "\n".join(lines) + "\n"
+
+    def openLog(self, logFile, interval=DEFAULT_METRICS_INTERVAL):
+        # logFile is a filename (appended to) or '-' for stdout
+        if logFile == '-':
+            self.logFile = sys.stdout
+        else:
+            self.logFile = open(logFile, 'a', buffering=1)
+
+        self.logInterval = float(interval)
+
+    def maybeLog(self):
+        # Called once per tick.  Writes a JSON snapshot line every logInterval seconds.
+        if self.logFile is None or time.monotonic() - self.lastLogTime < self.logInterval:
+            return
+
+        self.lastLogTime = time.monotonic()
+        self.writeLog()
+
+    def writeLog(self):
+        if self.logFile is None:
+            return
+
+        try:
+            self.logFile.write(json.dumps(self.snapshot(), sort_keys=True) + "\n")
+        except (OSError, ValueError) as e:
+            print("WARNING: Unable to write metrics log: " + str(e), file=sys.stderr)
+
+    def summary(self):
+        # One line per stage/device with p50/p99/max in ms, for the end of a run
+        lines = []
+        snapshot = self.snapshot()
+
+        for title, section in (("Stage", snapshot['stages']), ("RTT", snapshot['rtt'])):
+            for name, entry in section.items():
+                lines.append("%-5s %-24s n=%-8d p50 %8.3f ms  p99 %8.3f ms  max %8.3f ms" % (title, name, entry['count'], entry['p50']*1000.0,
+                             entry['p99']*1000.0, entry['max']*1000.0))
+
+        return "\n".join(lines)
+
+    def close(self):
+        if self.logFile is not None:
+            self.writeLog()
+            if self.logFile is not sys.stdout:
+                self.logFile.close()
+
+        self.logFile = None
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    # Serves GET /metrics from the server's metrics attribute
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.prometheusText().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the tracker's output
+        pass
+
+# -------------------  Global Functions ----------------------------------------
+def escapeLabel(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def startMetricsServer(metrics, port, host='127.0.0.1'):
+    # Serves metrics.prometheusText() at http://host:port/metrics from a daemon thread.  Returns the server.
+    server = ThreadingHTTPServer((host, int(port)), MetricsRequestHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+
+    serverThread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    serverThread.start()
+
+    return server
+
+def schedulerCollector(scheduler, loopName='track'):
+    # Collector for a trackscheduler.DeadlineScheduler
+    def collect():
+        curStats = scheduler.stats()
+        labels = {'loop': loopName}
+        return [('ticks_total', 'counter', "Tracking loop ticks.", labels, curStats['ticks']),
+                ('missed_deadlines_total', 'counter', "Tracking loop deadlines missed.", labels, curStats['missed']),
+                ('jitter_max_seconds', 'gauge', "Largest tick wake-up jitter.", labels, curStats['jitterMax'])]
+
+    return collect
+
+def rotorBackendCollector():
+    # Collector for every rotorcontrol backend in use
+    from rotorcontrol import rotorBackends
+
+    def collect():
+        values = []
+        for port, backend in list(rotorBackends.items()):
+            labels = {'device': port}
+            values.append(('device_reconnects_total', 'counter', "Device reconnects.", labels, backend.reconnects))
+            values.append(('device_acknowledged_total', 'counter', "Device commands acknowledged.", labels, backend.acknowledgedMoves))
+            values.append(('device_rtt_last_seconds', 'gauge', "Most recent device round trip.", labels, backend.lastLatency))
+
+        return values
+
+    return collect
+
+def radioCollector(radioConn):
+    # Collector for a radiocontrol.RadioConnection
+    def collect():
+        labels = {'device': radioConn.radio}
+        return [('device_reconnects_total', 'counter', "Device reconnects.", labels, radioConn.reconnects),
+                ('device_errors_total', 'counter', "Device errors (failed sends and error replies).", labels, radioConn.errors),
+                ('device_acknowledged_total', 'counter', "Device commands acknowledged.", labels, radioConn.acknowledged),
+                ('device_rtt_last_seconds', 'gauge', "Most recent device round trip.", labels, radioConn.lastLatency)]
+
+    return collect
+
+def tableCacheCollector(tableCache):
+    # Collector for a tablecache.EphemerisTableCache
+    def collect():
+        return [('table_cache_hits_total', 'counter', "Position tables loaded from the table cache.", {}, tableCache.hits),
+                ('table_cache_misses_total', 'counter', "Position tables computed because they were not cached.", {}, tableCache.misses)]
+
+    return collect
+
+def asyncDeviceCollector(devices):
+    # Collector for asynctrack.AsyncDevices
+    def collect():
+        values = []
+        for curDevice in devices:
+            labels = {'device': curDevice.name}
+            values.append(('device_reconnects_total', 'counter', "Device reconnects.", labels, curDevice.reconnects))
+            values.append(('device_timeouts_total', 'counter', "Device replies that timed out.", labels, curDevice.timeouts))
+            values.append(('device_dropped_total', 'counter', "Device updates replaced by a newer one before they were sent.", labels, curDevice.dropped))
+            values.append(('device_rtt_last_seconds', 'gauge', "Most recent device round trip.", labels, curDevice.lastLatency))
+
+        return values
+
+    return collect
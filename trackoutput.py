@@ -0,0 +1,199 @@
+###################################################################
+#
+# Module: trackoutput.py
+# Author: ghostop14
+#
+# Machine-readable tracking output for skytrack.py and radecl.py.  Instead of
+# the human-readable status block, every update writes one record per target
+# as NDJSON (one JSON object per line) or as fixed-width little-endian binary
+# records, to stdout, a file, or a UDP / Unix datagram socket.  Records are
+# buffered and written together every flush interval so high update rates
+# don't cost a write (or a datagram) per record.
+#
+# Binary records are RECORD_SIZE bytes: the target name (16 bytes, NUL
+# padded) followed by time (UTC POSIX seconds), azimuth, elevation, range (m),
+# range-rate (m/s), doppler (Hz) and illumination as float64, NaN where not
+# available.  readRecords() loads a binary file as a numpy structured array.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import json
+import socket
+import struct
+import sys
+import time
+
+from tracker import STATE_FIELDS
+from trackdefaults import OUTPUT_FORMAT_NDJSON, OUTPUT_FORMAT_BINARY, DEFAULT_OUTPUT_FLUSH
+
+# -------------------  Global Vars -------------------------------------
+TARGET_NAME_SIZE = 16  # bytes of the target name kept in binary records
+RECORD_STRUCT = struct.Struct('<%ds%dd' % (TARGET_NAME_SIZE, len(STATE_FIELDS)))
+RECORD_SIZE = RECORD_STRUCT.size
+
+MAX_OUTPUT_BUFFER = 65536  # bytes buffered before writing regardless of the flush interval
+MAX_UDP_DATAGRAM = 1400  # keeps each datagram inside one ethernet frame
+MAX_UNIX_DATAGRAM = 65000
+
+NAN = float('nan')
+
+# -------------------  Global Functions ----------------------------------------
+def recordDtype():
+    # numpy dtype matching the binary record layout
+    import numpy as np
+
+    return np.dtype([('target', 'S%d' % TARGET_NAME_SIZE)] + [(curField, '<f8') for curField in STATE_FIELDS])
+
+def readRecords(filename):
+    # Binary output file -> numpy structured array of recordDtype()
+    import numpy as np
+
+    return np.fromfile(filename, dtype=recordDtype())
+
+def encodeNdjson(target, state):
+    record = {'target': target}
+    record.update(state.asDict())
+    return (json.dumps(record, separators=(',', ':')) + "\n").encode('utf-8')
+
+def encodeBinary(target, state):
+    values = [getattr(state, curField) for curField in STATE_FIELDS]
+    return RECORD_STRUCT.pack(target.encode('utf-8')[:TARGET_NAME_SIZE], *[NAN if value is None else value for value in values])
+
+def openSink(destination):
+    # '-' is stdout, udp:<host>:<port> and unix:<path> are datagram sockets, anything else is a file (appended to)
+    if destination == '-':
+        return StreamSink(sys.stdout.buffer, closeStream=False)
+    elif destination.startswith('udp:'):
+        host, port = destination[4:].rsplit(':', 1)
+        return DatagramSink(socket.AF_INET, (host if len(host) > 0 else '127.0.0.1', int(port)), MAX_UDP_DATAGRAM)
+    elif destination.startswith('unix:'):
+        return DatagramSink(socket.AF_UNIX, destination[5:], MAX_UNIX_DATAGRAM)
+
+    return StreamSink(open(destination, 'ab'))
+
+# -------------------  Classes ----------------------------------------
+class StreamSink(object):
+    # A binary file-like destination.  Any number of records can go in one write.
+    maxWrite = None
+
+    def __init__(self, stream, closeStream=True):
+        self.stream = stream
+        self.closeStream = closeStream
+
+    def write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+    def close(self):
+        if self.closeStream:
+            self.stream.close()
+
+class DatagramSink(object):
+    # A connected UDP or Unix datagram socket.  Each write is one datagram of whole records.
+    def __init__(self, family, address, maxWrite):
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.connect(address)
+        self.maxWrite = maxWrite
+
+    def write(self, data):
+        self.sock.send(data)
+
+    def close(self):
+        self.sock.close()
+
+class StateWriter(object):
+    """
+    DESCRIPTION:
+        Buffers encoded records and writes them once flushInterval seconds have passed since the
+        last write (or the buffer reaches MAX_OUTPUT_BUFFER), so a slow update rate still writes
+        every record straight away.  Write errors (e.g. nobody listening on a socket, a closed
+        pipe) are counted and the records dropped rather than stopping the tracker.
+    INPUTS:
+        destination (str)        = '-' for stdout, udp:<host>:<port>, unix:<path> or a filename
+        outputFormat (str)       = OUTPUT_FORMAT_NDJSON or OUTPUT_FORMAT_BINARY
+        flushInterval (float)    = seconds records are held before writing (0 writes every record)
+    """
+    def __init__(self, destination, outputFormat=OUTPUT_FORMAT_NDJSON, flushInterval=DEFAULT_OUTPUT_FLUSH):
+        if outputFormat == OUTPUT_FORMAT_NDJSON:
+            self.encode = encodeNdjson
+        elif outputFormat == OUTPUT_FORMAT_BINARY:
+            self.encode = encodeBinary
+        else:
+            raise ValueError("Unknown output format " + str(outputFormat) + ".  Use " + OUTPUT_FORMAT_NDJSON + " or " + OUTPUT_FORMAT_BINARY + ".")
+
+        self.flushInterval = float(flushInterval)
+        if self.flushInterval < 0.0:
+            raise ValueError("Output flush interval cannot be negative.")
+
+        self.destination = destination
+        self.outputFormat = outputFormat
+        self.sink = openSink(destination)
+
+        self.buffer = []
+        self.bufferSize = 0
+        self.lastFlush = 0.0
+
+        self.records = 0
+        self.writes = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def write(self, target, state):
+        # target is the target's name, state a tracker.TrackState
+        record = self.encode(target, state)
+        self.buffer.append(record)
+        self.bufferSize += len(record)
+        self.records += 1
+
+        if self.bufferSize >= MAX_OUTPUT_BUFFER or time.monotonic() - self.lastFlush >= self.flushInterval:
+            self.flush()
+
+    def chunks(self):
+        # Buffered records joined into writes the sink accepts
+        if self.sink.maxWrite is None:
+            yield b''.join(self.buffer)
+            return
+
+        chunk = []
+        chunkSize = 0
+        for record in self.buffer:
+            if chunkSize + len(record) > self.sink.maxWrite and len(chunk) > 0:
+                yield b''.join(chunk)
+                chunk = []
+                chunkSize = 0
+
+            chunk.append(record)
+            chunkSize += len(record)
+
+        if len(chunk) > 0:
+            yield b''.join(chunk)
+
+    def flush(self):
+        self.lastFlush = time.monotonic()
+        if len(self.buffer) == 0:
+            return
+
+        try:
+            for chunk in self.chunks():
+                self.sink.write(chunk)
+                self.writes += 1
+        except OSError as e:
+            if self.errors == 0:
+                print("WARNING: Unable to write output to " + self.destination + ": " + str(e), file=sys.stderr)
+            self.errors += 1
+            self.dropped += len(self.buffer)
+
+        self.buffer = []
+        self.bufferSize = 0
+
+    def summary(self):
+        return ("Output: %d %s records in %d writes to %s, %d write errors, %d records dropped" %
+                (self.records, self.outputFormat, self.writes, self.destination, self.errors, self.dropped))
+
+    def close(self):
+        self.flush()
+
+        try:
+            self.sink.close()
+        except OSError:
+            pass
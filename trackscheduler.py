@@ -0,0 +1,104 @@
+###################################################################
+#
+# Module: trackscheduler.py
+# Author: ghostop14
+#
+# Drift-free tick scheduling for the skytrack.py and radecl.py loops.
+#
+# Sleeping a fixed delay after all the computation and I/O makes the real
+# period delay + work time, which drifts over a long pass.  This scheduler
+# fires on fixed deadlines from the monotonic clock instead, tells the loop
+# which (UTC) instant the tick's commands take effect so state is computed for
+# that time rather than the time the loop happened to wake up, and keeps
+# missed-deadline and jitter statistics.
+##################################################################
+
+# -----------------------imports -------------------------------------
+import asyncio
+import math
+import time
+from datetime import datetime, timezone
+
+# -------------------  Classes ----------------------------------------
+class DeadlineScheduler(object):
+    """
+    DESCRIPTION:
+        Fixed-period deadline scheduler on the monotonic clock.  The first deadline is
+        "now"; wait()/waitAsync() advance to the next one.  If a tick overruns one or more
+        deadlines they are counted as missed and skipped rather than run back to back.
+    INPUTS:
+        period (float)           = seconds between deadlines
+        leadTime (float)         = seconds after the deadline that commands take effect
+                                   (e.g. expected radio/rotor latency).  tickTime() includes it.
+    """
+    def __init__(self, period, leadTime=0.0):
+        if period <= 0.0:
+            raise ValueError("Scheduler period must be greater than zero.")
+
+        self.period = float(period)
+        self.leadTime = float(leadTime)
+        self.monoStart = time.monotonic()
+        self.wallStart = time.time()
+        self.deadline = self.monoStart
+
+        self.ticks = 0
+        self.missed = 0
+        self.jitterSum = 0.0
+        self.jitterSumSq = 0.0
+        self.jitterMax = 0.0
+
+    def tickTime(self):
+        # UTC datetime the current tick's commands take effect
+        wallTime = self.wallStart + (self.deadline - self.monoStart) + self.leadTime
+        return datetime.fromtimestamp(wallTime, tz=timezone.utc)
+
+    def advance(self):
+        # Moves to the next deadline (skipping any we've already blown through) and returns
+        # how long to sleep until it.
+        self.deadline += self.period
+        now = time.monotonic()
+
+        if now > self.deadline:
+            skipped = int((now - self.deadline) // self.period) + 1
+            self.missed += skipped
+            self.deadline += skipped * self.period
+
+        return max(self.deadline - now, 0.0)
+
+    def recordWake(self):
+        jitter = time.monotonic() - self.deadline
+        self.ticks += 1
+        self.jitterSum += jitter
+        self.jitterSumSq += jitter * jitter
+        self.jitterMax = max(self.jitterMax, jitter)
+
+    def wait(self, wakeup=None):
+        # wakeup is an optional threading.Event that ends the wait early (e.g. a new target was added).
+        # The deadlines then restart from the time it was set.
+        if wakeup is None:
+            time.sleep(self.advance())
+        elif wakeup.wait(self.advance()):
+            wakeup.clear()
+            self.deadline = time.monotonic()
+
+        self.recordWake()
+
+    async def waitAsync(self):
+        await asyncio.sleep(self.advance())
+        self.recordWake()
+
+    def stats(self):
+        # Returns a dict with tick/missed counts and wake-up jitter in seconds
+        if self.ticks > 0:
+            jitterMean = self.jitterSum / self.ticks
+            jitterStd = math.sqrt(max(self.jitterSumSq / self.ticks - jitterMean * jitterMean, 0.0))
+        else:
+            jitterMean = 0.0
+            jitterStd = 0.0
+
+        return {'ticks': self.ticks, 'missed': self.missed, 'jitterMean': jitterMean, 'jitterStd': jitterStd, 'jitterMax': self.jitterMax}
+
+    def summary(self):
+        curStats = self.stats()
+        return ("Scheduler: %d ticks, %d missed deadlines, jitter mean %.2f ms / std %.2f ms / max %.2f ms" %
+                (curStats['ticks'], curStats['missed'], curStats['jitterMean']*1000.0, curStats['jitterStd']*1000.0, curStats['jitterMax']*1000.0))